@@ -0,0 +1,308 @@
+"""Local HTTP/JSON API for submitting and following conversions.
+
+Other programs drive the converter through a small API bound to
+127.0.0.1, served from daemon threads on the same BatchEngine as the
+GUI or CLI that started it, so their jobs share its workers and
+resource budget:
+
+    GET    /formats               formats and their quality presets
+    GET    /jobs                  every job, with the engine's stats
+    POST   /jobs                  submit a job: {"source": PATH, "format": "MP4",
+                                  "preset": "Balanced", ...}
+    GET    /jobs/ID               poll one job
+    POST   /jobs/ID/cancel        cancel it (DELETE /jobs/ID does the same)
+    POST   /jobs/ID/pause         suspend its FFMPEG processes
+    POST   /jobs/ID/resume        continue them
+    GET    /events[?job=ID]       stream events as JSON lines, for one job until it finishes
+
+Errors are returned as {"error": MESSAGE} with a 4xx status.
+
+Only local programs may use the API: a request must name the server as
+127.0.0.1:PORT or localhost:PORT in its Host header, and must not send
+an Origin header, which browsers add to requests from web pages. POST
+requests must send Content-Type: application/json, which a web page
+cannot send without the browser first asking permission the server
+never gives.
+"""
+import http.server
+import json
+import os
+import threading
+import urllib.parse
+
+from engine import DEFAULT_OUTPUT_TEMPLATE, ConversionJob
+from presets import ENCODING_PRESETS, FORMATS, RESOLUTION_PRESETS
+from process import PRIORITIES
+from trim import parse_timestamp
+from twopass import parse_bitrate, parse_size
+
+DEFAULT_API_PORT = 9851
+
+# Request bodies larger than this are refused
+MAX_BODY_BYTES = 1024 * 1024
+
+# Seconds between blank keep-alive lines on an idle event stream
+EVENT_KEEPALIVE = 15
+
+# Optional request fields, which set the ConversionJob options of the same name,
+# and the JSON types each accepts
+JOB_FIELDS = {
+    'output_file': (str,),
+    'resolution': (str,),
+    'crf': (int,),
+    'encode_preset': (str,),
+    'allow_remux': (bool,),
+    'start': (int, float, str),
+    'end': (int, float, str),
+    'target_size': (int, float, str),
+    'target_bitrate': (int, float, str),
+    'priority': (str,)
+}
+JSON_TYPE_NAMES = {str: 'a string', int: 'an integer', float: 'a number', bool: 'true or false'}
+
+
+class RequestError(Exception):
+    """A request the API refuses, with the HTTP status to answer it with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def job_state(job):
+    """A job's summary with its progress, as JSON-compatible values."""
+    state = job.summary()
+    state['media_time'] = round(job.media_time, 3)
+    state['percent'] = (round(min(100 * job.media_time / job.duration, 100), 1)
+                        if job.duration else None)
+    return state
+
+
+def parse_time_field(value):
+    return float(value) if isinstance(value, (int, float)) else parse_timestamp(value)
+
+
+def check_type(name, value, types):
+    """Raise RequestError unless value has one of the JSON types; bools aren't numbers."""
+    if isinstance(value, bool) != (bool in types) or not isinstance(value, types):
+        raise RequestError(f"'{name}' must be {' or '.join(JSON_TYPE_NAMES[t] for t in types)}")
+
+
+def job_from_request(body, output_template=DEFAULT_OUTPUT_TEMPLATE, priority='normal'):
+    """Build a ConversionJob from a POST /jobs body. Raises RequestError."""
+    if not isinstance(body, dict):
+        raise RequestError('the request body must be a JSON object')
+    unknown = set(body) - {'source', 'format', 'preset', *JOB_FIELDS}
+    if unknown:
+        raise RequestError(f"unknown fields: {', '.join(sorted(unknown))}")
+    for name in ('source', 'format', 'preset'):
+        if body.get(name) is not None:
+            check_type(name, body[name], (str,))
+    source = body.get('source')
+    if source is None or not os.path.isfile(source):
+        raise RequestError(f'no such source file: {source}')
+    format_name = body.get('format', 'MP4').upper()
+    if format_name not in FORMATS:
+        raise RequestError(f"unknown format '{format_name}' (choose from: {', '.join(FORMATS)})")
+    presets = FORMATS[format_name]['presets']
+    preset_name = body.get('preset') or next(iter(presets))
+    if preset_name not in presets:
+        raise RequestError(f"unknown quality preset '{preset_name}' for {format_name} "
+                           f"(choose from: {', '.join(presets)})")
+
+    options = {key: body[key] for key in JOB_FIELDS if body.get(key) is not None}
+    for name, value in options.items():
+        check_type(name, value, JOB_FIELDS[name])
+    options.setdefault('priority', priority)
+    try:
+        if options.get('resolution', 'Original') not in ('Original', *RESOLUTION_PRESETS):
+            raise ValueError(f"unknown resolution '{options['resolution']}'")
+        if options.get('encode_preset', 'medium') not in ENCODING_PRESETS:
+            raise ValueError(f"unknown encoding preset '{options['encode_preset']}'")
+        if options['priority'] not in PRIORITIES:
+            raise ValueError(f"unknown priority '{options['priority']}'")
+        for key in ('start', 'end'):
+            if key in options:
+                options[key] = parse_time_field(options[key])
+        if 'target_size' in options:
+            options['target_size'] = parse_size(str(options['target_size']))
+        if 'target_bitrate' in options:
+            options['target_bitrate'] = parse_bitrate(str(options['target_bitrate']))
+        return ConversionJob(source, format_name, preset_name, output_template=output_template,
+                             **options)
+    except ValueError as e:
+        raise RequestError(str(e))
+
+
+class JobServer:
+    """Serve the job API for an engine on http://host:port/ from daemon threads.
+
+    Submitted jobs without an output_file are named by output_template,
+    and run at priority unless the request sets its own.
+    """
+
+    def __init__(self, engine, port=DEFAULT_API_PORT, host='127.0.0.1',
+                 output_template=DEFAULT_OUTPUT_TEMPLATE, priority='normal'):
+        self.engine = engine
+        self.output_template = output_template
+        self.priority = priority
+        self.closing = threading.Event()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self, 'GET')
+
+            def do_POST(self):
+                server.handle(self, 'POST')
+
+            def do_DELETE(self):
+                server.handle(self, 'DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop serving; open event streams end within a keep-alive interval."""
+        self.closing.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request, method):
+        url = urllib.parse.urlsplit(request.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            self.check_local(request, method)
+            if parts == ['events'] and method == 'GET':
+                self.stream_events(request, query.get('job', [None])[0])
+                return
+            status, body = self.route(request, method, parts)
+        except RequestError as e:
+            status, body = e.status, {'error': str(e)}
+        self.send_json(request, status, body)
+
+    def route(self, request, method, parts):
+        """Return (status, JSON body) for a request other than the event stream."""
+        if parts == ['formats'] and method == 'GET':
+            return 200, {name: list(info['presets']) for name, info in FORMATS.items()}
+        if parts == ['jobs'] and method == 'GET':
+            return 200, {'jobs': [job_state(job) for job in list(self.engine.jobs)],
+                         'stats': self.engine.stats()}
+        if parts == ['jobs'] and method == 'POST':
+            job = job_from_request(self.read_json(request), self.output_template, self.priority)
+            try:
+                self.engine.submit(job)
+            except ValueError as e:
+                raise RequestError(str(e), 409)
+            return 201, job_state(job)
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.find_job(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if action is None and method == 'GET':
+                return 200, job_state(job)
+            if (action, method) in (('cancel', 'POST'), (None, 'DELETE')):
+                if not self.engine.cancel(job):
+                    raise RequestError(f'job {job.id} has already finished', 409)
+                return 200, job_state(job)
+            if action in ('pause', 'resume') and method == 'POST':
+                changed = self.engine.pause(job) if action == 'pause' else self.engine.resume(job)
+                if not changed:
+                    raise RequestError(f'job {job.id} cannot be {action}d now', 409)
+                return 200, job_state(job)
+        if parts and parts[0] in ('formats', 'jobs', 'events'):
+            raise RequestError(f'{method} is not supported here', 405)
+        raise RequestError('not found', 404)
+
+    def check_local(self, request, method):
+        """Refuse requests that web pages could make, directly or by DNS rebinding."""
+        port = self.server.server_address[1]
+        if request.headers.get('Host') not in (f'127.0.0.1:{port}', f'localhost:{port}'):
+            raise RequestError(f'the Host header must be 127.0.0.1:{port} or localhost:{port}',
+                               403)
+        if request.headers.get('Origin') is not None:
+            raise RequestError('requests from web pages are not allowed', 403)
+        if method == 'POST' and request.headers.get_content_type() != 'application/json':
+            raise RequestError('POST requests must send Content-Type: application/json', 415)
+
+    def find_job(self, job_id):
+        try:
+            job = self.engine.find_job(int(job_id))
+        except ValueError:
+            job = None
+        if job is None:
+            raise RequestError(f'no job {job_id}', 404)
+        return job
+
+    def read_json(self, request):
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 < length <= MAX_BODY_BYTES:
+            raise RequestError('a JSON body with a Content-Length is required')
+        try:
+            return json.loads(request.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            raise RequestError(f'invalid JSON: {e}')
+
+    def send_json(self, request, status, body):
+        data = (json.dumps(body) + '\n').encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def stream_events(self, request, job_id):
+        """Write each engine event as a JSON line until the client goes away.
+
+        With a job id, the stream starts with the job's current state and
+        ends after its 'finished' event.
+        """
+        job = self.find_job(job_id) if job_id is not None else None
+        stream = self.engine.subscribe()
+        try:
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/x-ndjson')
+            request.send_header('Cache-Control', 'no-cache')
+            request.end_headers()
+            if job is not None:
+                self.write_event(request, 'state', job)
+                if job.status not in ('queued', 'running'):
+                    return
+            while not self.closing.is_set():
+                item = stream.get(timeout=EVENT_KEEPALIVE)
+                if item is None:
+                    # Blank lines keep proxies and idle clients from timing out
+                    request.wfile.write(b'\n')
+                    request.wfile.flush()
+                    continue
+                event, event_job, _ = item
+                if job is not None and event_job is not job:
+                    continue
+                self.write_event(request, event, event_job)
+                if job is not None and event == 'finished':
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.close()
+
+    def write_event(self, request, event, job):
+        line = json.dumps({'event': event, 'job': job_state(job)}) + '\n'
+        request.wfile.write(line.encode('utf-8'))
+        request.wfile.flush()
@@ -0,0 +1,223 @@
+"""Measure the encode cost of every format and quality preset.
+
+Generates deterministic lavfi test sources at each resolution preset size,
+converts each one with every format x quality preset combination through
+the batch engine, and writes wall time, speed, CPU time, peak RSS and
+output size to a JSON file. Each conversion runs in its own Python
+process so CPU time and peak RSS cover only that conversion's FFMPEG
+processes.
+
+    python benchmarks/conversions.py [--duration 5] [--sizes 1280x720 640x360]
+        [--formats MP4 WEBM] [--qualities Balanced] [--output results.json]
+        [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import BatchEngine, ConversionJob  # noqa: E402
+from presets import FORMATS, RESOLUTION_PRESETS  # noqa: E402
+
+# Relative change in a metric that --compare reports as a regression
+REGRESSION_THRESHOLD = 0.10
+COMPARED_METRICS = ('wall_seconds', 'cpu_seconds', 'peak_rss_kb', 'output_bytes')
+
+
+def preset_sizes():
+    """Return the WIDTHxHEIGHT of each resolution preset except Original."""
+    return [resolution.split('(')[1].rstrip(')')
+            for resolution in RESOLUTION_PRESETS if '(' in resolution]
+
+
+def make_source(path, duration, size, rate=30):
+    """Encode a deterministic, nearly lossless test pattern without audio."""
+    command = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=duration={duration}:size={size}:rate={rate}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '10', '-g', str(rate * 2),
+        '-pix_fmt', 'yuv420p', '-y', path
+    ]
+    subprocess.run(command, check=True)
+
+
+def child_usage():
+    """CPU seconds and peak RSS in KiB of this process's finished children."""
+    if resource is None:
+        return None, None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return usage.ru_utime, usage.ru_stime, peak_rss
+
+
+def run_case(case):
+    """Convert one source with one preset and return its measurements."""
+    engine = BatchEngine(max_workers=1)
+    job = engine.submit(ConversionJob(case['source'], case['format'], case['quality'],
+                                      output_file=case['output'], allow_remux=False))
+    engine.wait()
+    user, system, peak_rss = child_usage()
+    output_bytes = os.path.getsize(job.output_file) if os.path.exists(job.output_file) else 0
+    return {
+        'format': case['format'],
+        'quality': case['quality'],
+        'size': case['size'],
+        'encoder': job.encoder,
+        'mode': job.mode,
+        'status': job.status,
+        'error': job.error or (None if job.status == 'done' else
+                               f'ffmpeg exited with code {job.return_code}'),
+        'duration': job.duration,
+        'wall_seconds': job.elapsed,
+        'speed': job.speed,
+        'cpu_user_seconds': user,
+        'cpu_system_seconds': system,
+        'cpu_seconds': None if user is None else user + system,
+        'peak_rss_kb': peak_rss,
+        'output_bytes': output_bytes
+    }
+
+
+def measure(case):
+    """Run a case in a fresh interpreter so its rusage covers only that case."""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return json.loads(result.stdout)
+
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE,
+                                universal_newlines=True)
+    except OSError:
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else None
+
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def case_key(result):
+    return (result['format'], result['quality'], result['size'])
+
+
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+    """Print metrics that changed by more than threshold; return the regression count."""
+    before = {case_key(result): result for result in previous['results']}
+    regressions = 0
+    for result in current['results']:
+        old = before.get(case_key(result))
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            change = result[metric] / old[metric] - 1
+            if abs(change) < threshold:
+                continue
+            if change > 0:
+                regressions += 1
+            label = 'REGRESSION' if change > 0 else 'improvement'
+            print(f"{label}: {' / '.join(case_key(result))} {metric} "
+                  f"{old[metric]:.6g} -> {result[metric]:.6g} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5, help='source length in seconds')
+    parser.add_argument('--sizes', nargs='+', default=preset_sizes(),
+                        help='source sizes (default: every resolution preset)')
+    parser.add_argument('--formats', nargs='+', type=str.upper, default=list(FORMATS.keys()),
+                        choices=list(FORMATS.keys()))
+    parser.add_argument('--qualities', nargs='+',
+                        help='quality presets to run (default: all of each format)')
+    parser.add_argument('--workdir', help='keep sources and outputs here instead of a temp dir')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='previous results to compare against; exits 1 on regressions')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='conversions-bench-') as tempdir:
+        workdir = args.workdir or tempdir
+        os.makedirs(workdir, exist_ok=True)
+        for size in args.sizes:
+            source = os.path.join(workdir, f'source-{size}-{args.duration:g}s.mp4')
+            if not os.path.exists(source):
+                print(f"Generating {args.duration:g}s {size} test source...", flush=True)
+                make_source(source, args.duration, size)
+            for format_name in args.formats:
+                format_info = FORMATS[format_name]
+                for quality in format_info['presets']:
+                    if args.qualities and quality not in args.qualities:
+                        continue
+                    stem = f"{size}-{format_name}-{quality.replace(' ', '_')}"
+                    result = measure({
+                        'source': source,
+                        'output': os.path.join(workdir, stem + format_info['extension']),
+                        'format': format_name,
+                        'quality': quality,
+                        'size': size
+                    })
+                    results.append(result)
+                    if result['status'] == 'done':
+                        cpu = ('' if result['cpu_seconds'] is None else
+                               f" cpu {result['cpu_seconds']:6.1f}s "
+                               f"rss {result['peak_rss_kb'] / 1024:6.0f} MiB")
+                        print(f"{size:>9} {format_name:4} {quality:16} {result['encoder']:11} "
+                              f"{result['wall_seconds']:6.1f}s {result['speed']:6.2f}x{cpu} "
+                              f"{result['output_bytes'] / 1048576:7.2f} MiB", flush=True)
+                    else:
+                        print(f"{size:>9} {format_name:4} {quality:16} failed: "
+                              f"{result['error']}", flush=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'ffmpeg': ffmpeg_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'duration': args.duration,
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, report):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
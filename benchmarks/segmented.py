@@ -0,0 +1,70 @@
+"""Compare segmented parallel encoding against a single FFMPEG process.
+
+Generates a synthetic source with lavfi testsrc, encodes it once in a
+single process and once in segments, and reports the wall-clock times.
+
+    python benchmarks/segmented.py [--duration 180] [--size 1280x720]
+        [--format MP4] [--quality "Maximum Quality"]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import BatchEngine, ConversionJob  # noqa: E402
+from presets import FORMATS  # noqa: E402
+
+
+def make_source(path, duration, size, rate=30):
+    """Encode a deterministic test pattern with a keyframe every two seconds."""
+    command = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=duration={duration}:size={size}:rate={rate}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate * 2),
+        '-c:a', 'aac', '-shortest', '-y', path
+    ]
+    subprocess.run(command, check=True)
+
+
+def run(source, output, format_name, quality, segmented):
+    engine = BatchEngine()
+    job = engine.submit(ConversionJob(source, format_name, quality, output_file=output,
+                                      allow_remux=False, segmented=segmented))
+    engine.wait()
+    if job.status != 'done':
+        raise SystemExit(f'{job.mode} encode failed: {job.error or job.return_code}')
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=int, default=180)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--format', default='MP4', choices=list(FORMATS.keys()))
+    parser.add_argument('--quality', default='Maximum Quality')
+    args = parser.parse_args()
+
+    extension = FORMATS[args.format]['extension']
+    with tempfile.TemporaryDirectory(prefix='segmented-bench-') as workdir:
+        source = os.path.join(workdir, 'source.mp4')
+        print(f"Generating {args.duration}s {args.size} test source...")
+        make_source(source, args.duration, args.size)
+
+        single = run(source, os.path.join(workdir, 'single' + extension),
+                     args.format, args.quality, segmented=False)
+        print(f"single process: {single.elapsed:7.1f}s ({single.speed:.2f}x realtime)")
+
+        chunked = run(source, os.path.join(workdir, 'segmented' + extension),
+                      args.format, args.quality, segmented=True)
+        print(f"segmented:      {chunked.elapsed:7.1f}s ({chunked.speed:.2f}x realtime)")
+
+        print(f"speedup: {single.elapsed / chunked.elapsed:.2f}x on {os.cpu_count()} cores")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
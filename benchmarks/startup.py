@@ -0,0 +1,76 @@
+"""Measure command-line startup time.
+
+Runs the CLI entry point repeatedly with a no-op command and reports the
+wall-clock time, and checks that no GUI modules were imported on the way.
+
+    python benchmarks/startup.py [--runs 20] [--max-ms 250]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINT = os.path.join(ROOT, 'video_converter.py')
+GUI_MODULES = ('tkinter', 'tkinterdnd2', 'PIL')
+
+
+def time_startup(runs):
+    command = [sys.executable, ENTRY_POINT, '--list-presets']
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def imported_gui_modules():
+    """Return the GUI modules imported by a CLI run, using -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', ENTRY_POINT, '--list-presets'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    found = set()
+    for line in result.stderr.splitlines():
+        module = line.rsplit('|', 1)[-1].strip()
+        if module.split('.')[0] in GUI_MODULES:
+            found.add(module.split('.')[0])
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=250,
+                        help='fail if the median startup time exceeds this')
+    args = parser.parse_args()
+
+    # Baseline: a bare interpreter, to separate our cost from Python's own
+    baseline = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baseline.append((time.perf_counter() - started) * 1000)
+
+    timings = time_startup(args.runs)
+    median = statistics.median(timings)
+    print(f"python -c pass:           median {statistics.median(baseline):.1f} ms")
+    print(f"video_converter.py (CLI): median {median:.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms")
+
+    gui_modules = imported_gui_modules()
+    if gui_modules:
+        print(f"FAIL: CLI imported GUI modules: {', '.join(gui_modules)}")
+        return 1
+    if median > args.max_ms:
+        print(f"FAIL: median startup {median:.1f} ms exceeds {args.max_ms:.0f} ms")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
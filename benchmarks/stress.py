@@ -0,0 +1,144 @@
+"""Stress the engine with hundreds of short concurrent jobs.
+
+Generates one short synthetic source, then converts it many times on a
+large worker pool while cancelling, pausing and resuming a share of the
+jobs. Checks afterwards that every job ended, no FFMPEG child is left
+running or unreaped, and the process has no more open file descriptors
+or threads than before.
+
+    python benchmarks/stress.py [--jobs 300] [--workers 32]
+        [--cancel 0.2] [--pause 0.2]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import BatchEngine, ConversionJob  # noqa: E402
+from process import CAN_PAUSE, TERMINATE_GRACE  # noqa: E402
+
+# Threads may take a moment to exit after the engine shuts down
+SETTLE_SECONDS = TERMINATE_GRACE + 1
+
+
+def make_source(path, duration=2, size='320x240', rate=25):
+    command = [
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=duration={duration}:size={size}:rate={rate}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate),
+        '-y', path
+    ]
+    subprocess.run(command, check=True)
+
+
+def make_job(source, workdir, name, index):
+    """Alternate stream copies and encodes, to mix short and longer processes."""
+    if index % 2:
+        return ConversionJob(source, 'MKV', 'Small Size',
+                             output_file=os.path.join(workdir, f'{name}.mkv'))
+    return ConversionJob(source, 'MP4', 'Small Size',
+                         output_file=os.path.join(workdir, f'{name}.mp4'), allow_remux=False)
+
+
+def open_descriptors():
+    """Count this process's open file descriptors, or None where unsupported."""
+    for directory in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(directory):
+            return len(os.listdir(directory))
+    return None
+
+
+def unreaped_children():
+    """Return True if an exited child process is still waiting to be reaped."""
+    if not hasattr(os, 'waitid'):
+        return False
+    try:
+        return os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--cancel', type=float, default=0.2,
+                        help='share of jobs to cancel while queued or running')
+    parser.add_argument('--pause', type=float, default=0.2,
+                        help='share of jobs to pause and resume while running')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix='stress-') as workdir:
+        source = os.path.join(workdir, 'source.mp4')
+        make_source(source)
+
+        # A job of each kind first opens the long-lived probe and encoder caches,
+        # which aren't leaks
+        warmup = BatchEngine(max_workers=1)
+        for index in range(2):
+            warmup.submit(make_job(source, workdir, f'warmup_{index}', index))
+        warmup.wait()
+        warmup.shutdown()
+
+        descriptors_before = open_descriptors()
+        threads_before = threading.active_count()
+        started = time.time()
+
+        # cpu_count sizes the core budget, so it must allow as many jobs as workers
+        engine = BatchEngine(max_workers=args.workers, cpu_count=args.workers,
+                             memory_limit=0, write_rate_limit=0)
+        jobs = []
+        for index in range(args.jobs):
+            jobs.append(engine.submit(make_job(source, workdir, f'out_{index}', index)))
+
+        for job in rng.sample(jobs, int(len(jobs) * args.cancel)):
+            time.sleep(rng.uniform(0, 0.01))
+            engine.cancel(job)
+        if CAN_PAUSE:
+            for job in rng.sample(jobs, int(len(jobs) * args.pause)):
+                if engine.pause(job):
+                    time.sleep(rng.uniform(0, 0.02))
+                    engine.resume(job)
+
+        engine.wait()
+        engine.shutdown()
+        elapsed = time.time() - started
+        time.sleep(SETTLE_SECONDS)
+
+        stats = engine.stats()
+        descriptors_after = open_descriptors()
+        threads_after = threading.active_count()
+        print(f"{stats['jobs']} jobs in {elapsed:.1f}s: {stats['done']} done, "
+              f"{stats['cancelled']} cancelled, {stats['failed']} failed")
+        print(f"open file descriptors: {descriptors_before} before, {descriptors_after} after")
+        print(f"threads: {threads_before} before, {threads_after} after")
+
+        problems = []
+        if stats['queued'] or stats['running']:
+            problems.append('jobs left unfinished')
+        if stats['failed']:
+            errors = {job.error for job in jobs if job.status == 'failed'}
+            problems.append(f"failed jobs: {'; '.join(sorted(str(error) for error in errors))}")
+        if engine.supervisor.running():
+            problems.append(f'{engine.supervisor.running()} FFMPEG processes still registered')
+        if unreaped_children():
+            problems.append('unreaped child processes')
+        if descriptors_before is not None and descriptors_after > descriptors_before:
+            problems.append('file descriptors leaked')
+        if threads_after > threads_before:
+            problems.append('threads leaked')
+        for problem in problems:
+            print(f'FAIL: {problem}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""On-disk caches shared by the probe, thumbnail and encoder lookups."""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+def cache_dir(*parts):
+    """Return (and create) the per-user cache directory, or a subdirectory of it.
+
+    VIDEO_CONVERTER_CACHE overrides the platform default location.
+    """
+    base = os.environ.get('VIDEO_CONVERTER_CACHE')
+    if not base:
+        if sys.platform == 'win32':
+            base = os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'),
+                                'video_converter', 'cache')
+        elif sys.platform == 'darwin':
+            base = os.path.join(os.path.expanduser('~/Library/Caches'), 'video_converter')
+        else:
+            base = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                'video_converter')
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_key(path):
+    """Identify a file by absolute path, size and modification time.
+
+    Raises OSError if the file cannot be read.
+    """
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'
+
+
+class KeyValueCache:
+    """A persistent JSON value store in SQLite with least-recently-used eviction."""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)')
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                'UPDATE entries SET used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, used) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time()))
+            if self.max_entries:
+                self._connection.execute(
+                    'DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                    'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries')
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
@@ -0,0 +1,458 @@
+"""Command-line interface for batch conversions.
+
+Runs the same presets and argument builder as the GUI through the batch
+engine, without importing Tk, tkinterdnd2 or PIL.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from api import DEFAULT_API_PORT, JobServer
+from encoders import CODEC_FAMILIES, resolve_encoder
+from engine import DEFAULT_OUTPUT_TEMPLATE, BatchEngine, ConversionJob
+from ingest import WatchFolder, batch_output_path, iter_video_files
+from journal import JobJournal
+from metrics import DEFAULT_METRICS_PORT, MetricsCollector, MetricsLog, MetricsServer
+from output_cache import DEFAULT_MAX_BYTES, OutputCache
+from presets import ENCODING_PRESETS, FORMATS, RESOLUTION_PRESETS
+from process import PRIORITIES
+from quality import parse_target
+from renditions import Rendition, resolution_label
+from scheduler import DEFAULT_WRITE_RATE
+from trim import parse_timestamp, validate_range
+from twopass import parse_bitrate, parse_size, supports_two_pass
+
+
+def parse_resolution(value):
+    """Accept a resolution preset by full label, short name, WIDTHxHEIGHT or e.g. 720p."""
+    wanted = value.strip().lower()
+    for resolution in RESOLUTION_PRESETS:
+        short_name = resolution.split(' (')[0].lower()
+        size = resolution.split('(')[1].rstrip(')') if '(' in resolution else ''
+        if wanted in (resolution.lower(), short_name, size.lower(), resolution_label(resolution)):
+            return resolution
+    raise argparse.ArgumentTypeError(
+        f"unknown resolution '{value}' (choose from: {', '.join(RESOLUTION_PRESETS)})")
+
+
+def parse_quality_target(value):
+    try:
+        return parse_target(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_time(value):
+    try:
+        return parse_timestamp(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_target_size(value):
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_target_bitrate(value):
+    try:
+        return parse_bitrate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_rendition(value):
+    """Parse FORMAT[:QUALITY][@RESOLUTION] into a Rendition."""
+    spec, _, resolution = value.partition('@')
+    format_name, _, quality = spec.partition(':')
+    format_name = format_name.strip().upper()
+    if format_name not in FORMATS:
+        raise argparse.ArgumentTypeError(
+            f"unknown format '{format_name}' (choose from: {', '.join(FORMATS)})")
+    presets = FORMATS[format_name]['presets']
+    quality = quality.strip() or next(iter(presets))
+    if quality not in presets:
+        raise argparse.ArgumentTypeError(
+            f"unknown quality preset '{quality}' for {format_name} "
+            f"(choose from: {', '.join(presets)})")
+    resolution = parse_resolution(resolution) if resolution else 'Original'
+    return Rendition(format_name, quality, resolution)
+
+
+def expand_inputs(patterns):
+    """Expand input globs into a de-duplicated list of files, in order.
+
+    Directories are searched recursively for supported video files.
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                paths = [path for path, _ in iter_video_files([match])]
+            elif os.path.isfile(match):
+                paths = [match]
+            else:
+                print(f"warning: no such file: {match}", file=sys.stderr)
+                continue
+            for path in paths:
+                if path not in seen:
+                    seen.add(path)
+                    files.append(path)
+    return files
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='video_converter',
+        description='Convert video files with the Video Format Converter presets.')
+    parser.add_argument('inputs', nargs='*', metavar='INPUT',
+                        help='input files, folders (searched recursively) or glob patterns '
+                             '(quote globs to use ** recursion)')
+    parser.add_argument('-f', '--format', default='MP4', type=str.upper,
+                        choices=list(FORMATS.keys()), help='output format (default: MP4)')
+    parser.add_argument('-q', '--quality', metavar='PRESET',
+                        help="quality preset of the format (default: the format's first preset)")
+    parser.add_argument('-r', '--resolution', default='Original', type=parse_resolution,
+                        help="output resolution, e.g. 'Full HD', '1280x720' (default: Original)")
+    parser.add_argument('--crf', type=int, help='override the preset CRF value (0-51)')
+    parser.add_argument('--encoding-preset', choices=list(ENCODING_PRESETS.keys()),
+                        help='override the preset encoding speed')
+    parser.add_argument('--target-quality', metavar='METRIC[=VALUE]', type=parse_quality_target,
+                        help='pick the CRF by measured quality instead of the preset value: '
+                             'vmaf (default 93), ssim (0.98), psnr (42) or auto')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--target-size', type=parse_target_size, metavar='SIZE',
+                        help="encode in two passes to about this output size, e.g. '700M', "
+                             "'1.5G' or '25MiB'")
+    target.add_argument('--target-bitrate', type=parse_target_bitrate, metavar='RATE',
+                        help="encode in two passes at this average video bitrate, e.g. '2500k'")
+    parser.add_argument('--also', action='append', default=[], type=parse_rendition,
+                        metavar='FORMAT[:QUALITY][@RESOLUTION]',
+                        help="also write this rendition from the same decode, e.g. 'WEBM:Balanced' "
+                             "or 'MP4:Balanced@720p'; repeat for more")
+    parser.add_argument('--start', type=parse_time, metavar='TIME',
+                        help='convert from this time in the source ([[HH:]MM:]SS[.fff])')
+    parser.add_argument('--end', type=parse_time, metavar='TIME',
+                        help='convert up to this time in the source ([[HH:]MM:]SS[.fff])')
+    parser.add_argument('--fast-trim', action='store_true',
+                        help='when streams can be copied but --start is not on a keyframe, copy '
+                             'from the keyframe before it instead of re-encoding')
+    parser.add_argument('--no-remux', action='store_true',
+                        help='always re-encode, even when the streams could be copied as-is')
+    parser.add_argument('--segmented', choices=['auto', 'on', 'off'], default='auto',
+                        help='split long, slow encodes into segments encoded in parallel '
+                             '(default: auto)')
+    parser.add_argument('-o', '--output-template', default=DEFAULT_OUTPUT_TEMPLATE,
+                        help='output path template; fields: {dir} {stem} {ext} {format} {preset} '
+                             '{resolution} '
+                             f'(default: {DEFAULT_OUTPUT_TEMPLATE})')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='maximum concurrent FFMPEG processes (default: sized from CPU count)')
+    parser.add_argument('--priority', choices=list(PRIORITIES), default='normal',
+                        help='scheduling priority of the FFMPEG processes (default: normal)')
+    parser.add_argument('--max-memory', type=int, metavar='MIB',
+                        help='estimated memory running jobs may use together, 0 for no limit '
+                             '(default: most of the memory available at startup)')
+    parser.add_argument('--max-write-rate', type=float, default=DEFAULT_WRITE_RATE, metavar='MBPS',
+                        help='estimated output MB/s running jobs may write together, 0 for no '
+                             f'limit (default: {DEFAULT_WRITE_RATE})')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='stop an FFMPEG process that runs longer than this and fail its job')
+    parser.add_argument('--stall-timeout', type=float, metavar='SECONDS',
+                        help='stop an FFMPEG process that reports no progress for this long and '
+                             'fail its job')
+    parser.add_argument('--journal', nargs='?', const='', metavar='PATH',
+                        help='record jobs in a journal so a rerun skips finished work '
+                             '(default: journal.sqlite3 in the cache directory)')
+    parser.add_argument('--resume', action='store_true',
+                        help="queue the journal's unfinished jobs again (implies --journal)")
+    parser.add_argument('--output-cache', nargs='?', type=float, metavar='GIB',
+                        const=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help='reuse outputs of identical earlier conversions from a cache of '
+                             'at most GIB gibibytes (default size: '
+                             f'{DEFAULT_MAX_BYTES / 1024 ** 3:g})')
+    parser.add_argument('--metrics-log', metavar='PATH',
+                        help="append each finished job's stage timings, FFMPEG CPU time, "
+                             'peak memory, speed, bitrate and stderr tail to a JSON lines file')
+    parser.add_argument('--metrics-port', nargs='?', type=int, const=DEFAULT_METRICS_PORT,
+                        metavar='PORT',
+                        help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics while '
+                             f'converting (default port: {DEFAULT_METRICS_PORT})')
+    parser.add_argument('--serve', nargs='?', type=int, const=DEFAULT_API_PORT, metavar='PORT',
+                        help='accept jobs from a local HTTP/JSON API on http://127.0.0.1:PORT/ '
+                             f'until interrupted (default port: {DEFAULT_API_PORT})')
+    parser.add_argument('--watch', metavar='DIR',
+                        help='convert video files arriving in DIR with these settings once '
+                             'they stop growing, until interrupted')
+    parser.add_argument('--watch-output', metavar='DIR',
+                        help="folder for converted watched files, mirroring DIR's layout "
+                             '(default: DIR/converted)')
+    parser.add_argument('--progress', action='store_true',
+                        help='print progress updates while converting')
+    parser.add_argument('--json', action='store_true',
+                        help='print a JSON report instead of text')
+    parser.add_argument('--list-presets', action='store_true',
+                        help='list formats and quality presets, then exit')
+    return parser
+
+
+def list_presets():
+    for format_name, format_info in FORMATS.items():
+        print(f"{format_name} ({format_info['extension']})")
+        for preset_name, options in format_info['presets'].items():
+            settings = ', '.join(f'{key}={value}' for key, value in options.items()
+                                 if key != 'codec')
+            codec = options['codec']
+            print(f"  {preset_name}: {CODEC_FAMILIES.get(codec, codec)} "
+                  f"({resolve_encoder(codec)}), {settings}")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.list_presets:
+        list_presets()
+        return 0
+
+    presets = FORMATS[args.format]['presets']
+    quality = args.quality or next(iter(presets))
+    if quality not in presets:
+        parser.error(f"unknown quality preset '{quality}' for {args.format} "
+                     f"(choose from: {', '.join(presets)})")
+    if not args.inputs and not args.resume and args.serve is None and not args.watch:
+        parser.error('no input files given')
+    if args.watch and not os.path.isdir(args.watch):
+        parser.error(f'--watch: no such folder: {args.watch}')
+    try:
+        validate_range(args.start, args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.target_size or args.target_bitrate:
+        if args.target_quality or args.also:
+            parser.error('--target-size and --target-bitrate cannot be combined with '
+                         '--target-quality or --also')
+        if not supports_two_pass(args.format, quality):
+            parser.error(f'{args.format} {quality} cannot be encoded to a target size or bitrate')
+
+    files = expand_inputs(args.inputs)
+    if args.inputs and not files:
+        print('error: no input files matched', file=sys.stderr)
+        return 1
+
+    journal = None
+    if args.journal is not None or args.resume:
+        journal = JobJournal(args.journal or None)
+    output_cache = None
+    if args.output_cache is not None:
+        output_cache = OutputCache(max_bytes=int(args.output_cache * 1024 ** 3))
+    engine = BatchEngine(max_workers=args.jobs, journal=journal, output_cache=output_cache,
+                         memory_limit=args.max_memory, write_rate_limit=args.max_write_rate,
+                         timeout=args.timeout, stall_timeout=args.stall_timeout)
+    if not args.json:
+        engine.add_listener(print_event)
+    if args.progress:
+        engine.add_listener(progress_printer(engine))
+    if args.metrics_log:
+        engine.add_listener(MetricsLog(args.metrics_log))
+    metrics_server = None
+    if args.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(MetricsCollector(engine), args.metrics_port).start()
+        except OSError as e:
+            print(f'error: cannot serve metrics on port {args.metrics_port}: {e}', file=sys.stderr)
+            return 1
+        print(f'serving metrics on {metrics_server.url}', file=sys.stderr)
+
+    def make_job(path, output_file=None):
+        return ConversionJob(
+            path, args.format, quality,
+            output_template=args.output_template,
+            output_file=output_file,
+            resolution=args.resolution,
+            crf=args.crf,
+            encode_preset=args.encoding_preset,
+            allow_remux=not args.no_remux,
+            target_quality=args.target_quality,
+            renditions=[Rendition(**rendition.settings()) for rendition in args.also],
+            segmented={'auto': None, 'on': True, 'off': False}[args.segmented],
+            priority=args.priority,
+            start=args.start,
+            end=args.end,
+            accurate_trim=not args.fast_trim,
+            target_size=args.target_size,
+            target_bitrate=args.target_bitrate
+        )
+
+    jobs = []
+    if args.resume:
+        unfinished = journal.unfinished()
+        print(f"resuming {len(unfinished)} unfinished job(s) from {journal.path}", file=sys.stderr)
+        for settings in unfinished:
+            try:
+                job = ConversionJob.from_settings(settings)
+            except ValueError as e:
+                print(f"error: cannot resume {settings['source']}: {e}", file=sys.stderr)
+                continue
+            job.priority = args.priority
+            jobs.append(job)
+
+    rejected = 0
+    for path in files:
+        try:
+            jobs.append(make_job(path))
+        except ValueError as e:
+            print(f'error: {path}: {e}', file=sys.stderr)
+            rejected += 1
+
+    # Inputs given again alongside --resume would otherwise be queued twice
+    submitted = set()
+    for job in jobs:
+        if job.journal_key not in submitted:
+            submitted.add(job.journal_key)
+            try:
+                engine.submit(job)
+            except ValueError as e:
+                print(f'error: {job.source}: {e}', file=sys.stderr)
+                rejected += 1
+
+    # The API and the watched folder feed the same engine until Ctrl+C
+    ingest = []
+    if args.serve is not None:
+        try:
+            api_server = JobServer(engine, args.serve, output_template=args.output_template,
+                                   priority=args.priority).start()
+        except OSError as e:
+            print(f'error: cannot serve the job API on port {args.serve}: {e}', file=sys.stderr)
+            engine.shutdown(cancel=True)
+            return 1
+        ingest.append(api_server)
+        print(f'accepting jobs on {api_server.url}', file=sys.stderr)
+    if args.watch:
+        watch_output = args.watch_output or os.path.join(args.watch, 'converted')
+        extension = FORMATS[args.format]['extension']
+        claimed = {}
+        ingest.append(WatchFolder(
+            engine, args.watch,
+            lambda path, relative: make_job(
+                path, batch_output_path(path, relative, watch_output, extension, claimed)),
+            ignore=[watch_output]
+        ).start())
+        print(f'watching {args.watch} for new files', file=sys.stderr)
+
+    try:
+        while ingest:
+            time.sleep(3600)
+        engine.wait()
+    except KeyboardInterrupt:
+        for source in ingest:
+            source.close()
+        print('interrupted, stopping conversions', file=sys.stderr)
+        # Journaled jobs stopped here stay unfinished, for --resume
+        engine.shutdown(cancel=True)
+        if not ingest:
+            return 130
+    finally:
+        if metrics_server:
+            metrics_server.close()
+
+    stats = engine.stats()
+    if args.json:
+        print(json.dumps({'jobs': [job.summary() for job in engine.jobs], 'stats': stats},
+                         indent=2))
+    else:
+        print(f"{stats['done'] - stats['skipped']} converted, {stats['failed']} failed in "
+              f"{stats['wall_seconds']:.1f}s ({stats['speed']:.2f}x realtime)")
+        if stats['skipped']:
+            print(f"{stats['skipped']} already converted, skipped")
+        if stats['cancelled']:
+            print(f"{stats['cancelled']} cancelled")
+        if stats['remuxed']:
+            saved = f", saving about {stats['time_saved']:.0f}s" if stats['time_saved'] else ''
+            print(f"{stats['remuxed']} remuxed without re-encoding{saved}")
+        cache = stats['output_cache']
+        if cache:
+            print(f"output cache: {cache['hits']} hits, {cache['misses']} misses, "
+                  f"{cache['bytes_saved'] / 1048576:.1f} MiB reused; "
+                  f"{cache['entries']} outputs, {cache['bytes'] / 1048576:.1f} of "
+                  f"{cache['max_bytes'] / 1048576:.0f} MiB used; lifetime "
+                  f"{cache['lifetime_hits']} hits, {cache['lifetime_misses']} misses, "
+                  f"{cache['lifetime_bytes_saved'] / 1048576:.1f} MiB reused")
+    return 0 if stats['failed'] == 0 and not rejected else 1
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '--:--:--'
+    seconds = int(seconds)
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def progress_printer(engine):
+    """Return a listener printing each job's progress and the queue's ETA."""
+    def print_progress(event, job):
+        if event != 'progress':
+            return
+        estimator = job.estimator
+        percent = f'{100 * job.media_time / job.duration:5.1f}%' if job.duration else '  ?  '
+        if job.current_pass:
+            percent = f'pass {job.current_pass}/2 {percent}'
+        size = job.projected_size
+        size = f'~{size / 1048576:.1f} MiB' if size else f'{estimator.total_size / 1048576:.1f} MiB'
+        print(f"[{job.id}] {percent} {estimator.fps:6.1f} fps {estimator.speed:5.2f}x "
+              f"ETA {format_seconds(job.eta)} {size}; "
+              f"queue ETA {format_seconds(engine.estimate_completion())}",
+              file=sys.stderr, flush=True)
+    return print_progress
+
+
+def print_event(event, job):
+    if event == 'started':
+        print(f"[{job.id}] converting {job.source} -> {job.output_file}", flush=True)
+    elif event in ('paused', 'resumed'):
+        print(f"[{job.id}] {event}", flush=True)
+    elif event == 'finished':
+        search = job.quality_search
+        if search:
+            outcome = 'meets' if search['met'] else 'misses'
+            source = 'cached' if search['cached'] else f"searched in {search['seconds']:.1f}s"
+            print(f"[{job.id}] CRF {search['crf']} {outcome} {search['metric']} "
+                  f"{search['target']:g} (worst sample {search['score']:.4g}, {source})",
+                  flush=True)
+        if job.status == 'done' and job.mode == 'skipped':
+            print(f"[{job.id}] already converted, skipped", flush=True)
+        elif job.status == 'done' and job.mode == 'cached':
+            print(f"[{job.id}] reused an identical earlier conversion from the output cache",
+                  flush=True)
+        elif job.status == 'done' and job.mode == 'remux':
+            saved = '' if job.time_saved is None else f', saved about {job.time_saved:.0f}s'
+            print(f"[{job.id}] remuxed in {job.elapsed:.1f}s{saved}", flush=True)
+        elif job.status == 'done' and job.mode == 'multi':
+            print(f"[{job.id}] encoded {len(job.outputs)} outputs from one decode in "
+                  f"{job.elapsed:.1f}s ({job.speed:.2f}x): "
+                  f"{', '.join(output.output_file for output in job.outputs)}", flush=True)
+        elif job.status == 'done' and job.mode == 'two-pass':
+            size = os.path.getsize(job.output_file) if os.path.exists(job.output_file) else 0
+            print(f"[{job.id}] encoded in two passes at {job.bitrate / 1000:.0f} kb/s in "
+                  f"{job.elapsed:.1f}s ({job.speed:.2f}x), {size / 1048576:.1f} MiB", flush=True)
+        elif job.status == 'done' and job.mode == 'segmented':
+            print(f"[{job.id}] encoded in segments in {job.elapsed:.1f}s ({job.speed:.2f}x)",
+                  flush=True)
+        elif job.status == 'done':
+            print(f"[{job.id}] encoded in {job.elapsed:.1f}s ({job.speed:.2f}x)", flush=True)
+        elif job.status == 'cancelled':
+            print(f"[{job.id}] cancelled", flush=True)
+        else:
+            reason = job.error or f'ffmpeg exited with code {job.return_code}'
+            print(f"[{job.id}] failed: {reason}", flush=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
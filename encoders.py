@@ -0,0 +1,182 @@
+"""Encoder capability detection and codec family resolution.
+
+Presets name a codec family (as ffprobe reports it) rather than an FFMPEG
+encoder. Each family is resolved against the encoders the installed FFMPEG
+was built with, picking the preferred software implementation available,
+so the same presets work on any CPU-only build. The list of encoders is
+cached per FFMPEG binary so startup doesn't have to run it every time.
+"""
+import os
+import shutil
+import subprocess
+import threading
+
+from cache import KeyValueCache, cache_dir, file_key
+
+# Display names of the codec families used in presets
+CODEC_FAMILIES = {
+    'h264': 'H.264',
+    'hevc': 'HEVC',
+    'vp9': 'VP9',
+    'av1': 'AV1',
+    'prores': 'ProRes'
+}
+
+# Software encoders for each family, fastest for a given quality first
+FAMILY_ENCODERS = {
+    'h264': ['libx264', 'libopenh264'],
+    'hevc': ['libx265'],
+    'vp9': ['libvpx-vp9'],
+    'av1': ['libsvtav1', 'librav1e', 'libaom-av1'],
+    'prores': ['prores_ks', 'prores_aw']
+}
+
+# The x264 preset names used in presets, mapped to each AV1 encoder's speed scale
+SVT_AV1_PRESETS = {
+    'ultrafast': 12, 'superfast': 11, 'veryfast': 10, 'faster': 9, 'fast': 8,
+    'medium': 6, 'slow': 5, 'slower': 4, 'veryslow': 2
+}
+RAV1E_SPEEDS = {
+    'ultrafast': 10, 'superfast': 9, 'veryfast': 8, 'faster': 7, 'fast': 6,
+    'medium': 5, 'slow': 4, 'slower': 3, 'veryslow': 1
+}
+AOM_CPU_USED = {
+    'ultrafast': 8, 'superfast': 8, 'veryfast': 7, 'faster': 7, 'fast': 6,
+    'medium': 5, 'slow': 4, 'slower': 3, 'veryslow': 2
+}
+
+# Tiles let multi-threaded AV1 encoders work on several parts of a frame at once;
+# VP9's tile columns follow the job's thread budget (scheduler.thread_parameters)
+AOM_TILES = '2x2'
+RAV1E_TILES = 4
+
+_encoders = None
+_lock = threading.Lock()
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = KeyValueCache(os.path.join(cache_dir(), 'encoders.sqlite3'), max_entries=16)
+    return _cache
+
+
+def parse_encoders(output):
+    """Return the names of the video encoders in `ffmpeg -encoders` output."""
+    encoders = set()
+    in_list = False
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('------'):
+            in_list = True
+            continue
+        fields = line.split()
+        if in_list and len(fields) >= 2 and fields[0].startswith('V'):
+            encoders.add(fields[1])
+    return encoders
+
+
+def detect_encoders():
+    """Run `ffmpeg -encoders` and return the set of video encoder names.
+
+    Results are cached per FFMPEG binary (path, size and modification
+    time). Returns an empty set if FFMPEG can't be found or run.
+    """
+    path = shutil.which('ffmpeg')
+    if not path:
+        return set()
+    try:
+        key = file_key(os.path.realpath(path))
+    except OSError:
+        key = None
+
+    if key:
+        cached = get_cache().get(key)
+        if cached is not None:
+            return set(cached)
+
+    try:
+        result = subprocess.run([path, '-hide_banner', '-encoders'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return set()
+    if result.returncode != 0:
+        return set()
+
+    encoders = parse_encoders(result.stdout)
+    if key and encoders:
+        get_cache().set(key, sorted(encoders))
+    return encoders
+
+
+def available_encoders():
+    """Return the installed video encoders, detected once per process."""
+    global _encoders
+    with _lock:
+        if _encoders is None:
+            _encoders = detect_encoders()
+        return _encoders
+
+
+def resolve_encoder(family):
+    """Return the FFMPEG encoder to use for a codec family.
+
+    Falls back to the first candidate when none is installed, so FFMPEG
+    reports the missing encoder itself. A name that isn't a known family
+    is taken to be an encoder already.
+    """
+    candidates = FAMILY_ENCODERS.get(family)
+    if not candidates:
+        return family
+    installed = available_encoders()
+    for encoder in candidates:
+        if encoder in installed:
+            return encoder
+    return candidates[0]
+
+
+def encoder_parameters(encoder, options, crf=None, encode_preset=None):
+    """Build the rate control, speed and threading arguments for an encoder.
+
+    options is a preset dictionary; crf and encode_preset override its
+    'crf' and 'preset' values. libopenh264 has no CRF mode, so its own
+    rate control defaults are used.
+    """
+    crf = crf if crf is not None else options.get('crf')
+    speed = encode_preset or options.get('preset')
+
+    params = []
+    if encoder in ('libx264', 'libx265'):
+        if crf is not None:
+            params.extend(['-crf', str(crf)])
+        if speed:
+            params.extend(['-preset', speed])
+    elif encoder == 'libvpx-vp9':
+        if 'speed' in options:
+            params.extend(['-speed', str(options['speed'])])
+        if crf is not None:
+            params.extend(['-crf', str(crf), '-b:v', '0'])
+        params.extend(['-row-mt', '1'])
+    elif encoder == 'libsvtav1':
+        if crf is not None:
+            params.extend(['-crf', str(crf)])
+        if speed in SVT_AV1_PRESETS:
+            params.extend(['-preset', str(SVT_AV1_PRESETS[speed])])
+    elif encoder == 'librav1e':
+        if crf is not None:
+            # rav1e's quantizer runs 0-255; scale the 0-63 CRF range onto it
+            params.extend(['-qp', str(min(int(crf) * 4, 255))])
+        if speed in RAV1E_SPEEDS:
+            params.extend(['-speed', str(RAV1E_SPEEDS[speed])])
+        params.extend(['-tiles', str(RAV1E_TILES)])
+    elif encoder == 'libaom-av1':
+        if crf is not None:
+            params.extend(['-crf', str(crf), '-b:v', '0'])
+        if speed in AOM_CPU_USED:
+            params.extend(['-cpu-used', str(AOM_CPU_USED[speed])])
+        params.extend(['-row-mt', '1', '-tiles', AOM_TILES])
+    elif encoder in ('prores_ks', 'prores_aw'):
+        if 'profile' in options:
+            params.extend(['-profile:v', str(options['profile'])])
+    return params
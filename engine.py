@@ -0,0 +1,1076 @@
+"""Headless batch conversion engine.
+
+Jobs are queued and run by a pool of worker threads, each driving one
+FFMPEG process. The engine has no GUI dependencies: the Tk window and
+headless runs are both clients that submit jobs and listen for events.
+"""
+import itertools
+import os
+import queue
+import shutil
+import threading
+import time
+
+from encoders import resolve_encoder
+from presets import (FORMATS, build_conversion_parameters, build_remux_parameters,
+                     can_stream_copy, get_preset_options, resolution_width)
+from probe import probe
+from process import STOPPED_RETURN_CODE, ProcessStats, Supervisor, run_ffmpeg
+from estimator import SpeedHistory, ThroughputEstimator, queue_completion_time
+from journal import job_key
+from metrics import timed_stage
+from output_cache import output_key, source_fingerprint
+from progress import ProgressThrottle
+from quality import QualitySearchError, search_crf, supports_target_quality
+from renditions import Rendition, build_multi_output_command, resolution_label
+from scheduler import (BASE_MEMORY, DEFAULT_WRITE_RATE, ResourceBudget, bits_per_pixel,
+                       default_memory_limit, encoder_max_threads, estimate_memory,
+                       estimate_write_rate, thread_parameters)
+from segmented import encode_segmented, segment_workdir, should_segment
+from trim import range_duration, starts_on_keyframe, trim_parameters, validate_range
+from twopass import (bitrate_parameters, first_pass_parameters, make_passlog_prefix,
+                     pass_parameters, supports_two_pass, target_video_bitrate)
+
+# Approximate number of cores a single FFMPEG process keeps busy, per encoder
+CODEC_THREAD_USAGE = {
+    'libx264': 4,
+    'libopenh264': 2,
+    'libx265': 4,
+    'libvpx-vp9': 2,
+    'libsvtav1': 6,
+    'librav1e': 4,
+    'libaom-av1': 4,
+    'prores_ks': 4,
+    'prores_aw': 2
+}
+DEFAULT_THREAD_USAGE = 2
+
+# Frame size and rate assumed for resource estimates when the source wasn't probed
+DEFAULT_FRAME_SIZE = (1920, 1080)
+DEFAULT_FRAME_RATE = 30
+# Remuxes copy as fast as the disk allows; assume this many times realtime
+REMUX_SPEED = 20
+
+# Stop reasons that cancel a job rather than fail it
+CANCEL_REASONS = ('cancelled', 'shutdown')
+
+DEFAULT_OUTPUT_TEMPLATE = os.path.join('{dir}', '{stem}_converted{ext}')
+
+_job_ids = itertools.count(1)
+
+
+def partial_output_path(output_file):
+    """Return the temporary name an output is written under until it is complete."""
+    stem, ext = os.path.splitext(output_file)
+    return f'{stem}.partial{ext}'
+
+
+def codec_thread_usage(encoder):
+    """Return the number of cores an encode with the given encoder keeps busy."""
+    return CODEC_THREAD_USAGE.get(encoder, DEFAULT_THREAD_USAGE)
+
+
+class ConversionJob:
+    """A source file to convert with a format and quality preset."""
+
+    def __init__(self, source, format_name, preset_name,
+                 output_template=DEFAULT_OUTPUT_TEMPLATE, output_file=None,
+                 resolution='Original', crf=None, encode_preset=None, media_info=None,
+                 allow_remux=True, segmented=None, target_quality=None, renditions=None,
+                 priority='normal', start=None, end=None, accurate_trim=True,
+                 target_size=None, target_bitrate=None):
+        validate_range(start, end)
+        if target_size or target_bitrate:
+            if target_quality or renditions:
+                raise ValueError('a target size or bitrate cannot be combined with a quality '
+                                 'target or extra renditions')
+            if not supports_two_pass(format_name, preset_name):
+                raise ValueError(f'{format_name} {preset_name} cannot be encoded to a target '
+                                 f'size or bitrate')
+        self.id = next(_job_ids)
+        self.source = source
+        self.format_name = format_name
+        self.preset_name = preset_name
+        self.output_template = output_template
+        self.resolution = resolution
+        self.crf = crf
+        self.encode_preset = encode_preset
+        self.media_info = media_info
+        # Seconds of the source to convert; None for the start or end of the file
+        self.start = start
+        self.end = end
+        # False lets a stream copy begin at the keyframe before start
+        self.accurate_trim = accurate_trim
+        self.duration = range_duration(start, end, media_info.duration if media_info else None)
+        self.allow_remux = allow_remux
+        # None lets the engine decide; True or False forces segmented encoding on or off
+        self.segmented = segmented
+        # (metric, value) to pick the CRF by measured quality; see quality.parse_target
+        self.target_quality = target_quality
+        self.quality_search = None
+        # Output size in bytes, or video bits per second, to reach with two-pass encoding
+        self.target_size = target_size
+        self.target_bitrate = target_bitrate
+        # Video bitrate of a two-pass job, set by the engine once the source is probed
+        self.bitrate = None
+        # Which pass of a two-pass encode is running, and its pass log's path prefix
+        self.current_pass = None
+        self.passlog = None
+        # Exit code of the first pass once run, possibly ahead of the job's turn
+        self.first_pass_code = None
+        self.first_pass_claimed = False
+        self.first_pass_thread = None
+        self.first_pass_lock = threading.RLock()
+        # Scheduling priority of the job's FFMPEG processes; see process.PRIORITIES
+        self.priority = priority
+        # Threads FFMPEG may use, set by the engine from its thread budget
+        self.threads = None
+        # True while the engine has the job's FFMPEG processes suspended
+        self.paused = False
+        # 'encode', 'segmented', 'remux', 'two-pass' or 'multi' (with renditions), decided
+        # once the source has been probed; 'skipped' when the journal shows the job already
+        # finished, or 'cached' when the output cache already held the result
+        self.mode = None
+        self.estimated_encode_time = None
+        self.output_file = output_file or self.format_output_path()
+        # Further outputs encoded from the same decode of the source
+        self.renditions = list(renditions or [])
+        used = {os.path.abspath(self.output_file)}
+        for rendition in self.renditions:
+            if not rendition.output_file:
+                rendition.output_file = self.rendition_output_path(rendition, used)
+            used.add(os.path.abspath(rendition.output_file))
+        # FFMPEG never sees the final name, so its own input == output check can't fire
+        if os.path.abspath(source) in used:
+            raise ValueError(f'the output would overwrite the source file {source}')
+        # FFMPEG writes here; the file is renamed to output_file once complete
+        self.partial_file = partial_output_path(self.output_file)
+        self.journal_settings = self.settings()
+        self.journal_key = job_key(self.journal_settings)
+
+        self.status = 'queued'
+        self.media_time = 0
+        # Latest ProgressEvent from FFMPEG, and the rates smoothed from them
+        self.progress = None
+        self.estimator = None
+        self.return_code = None
+        self.error = None
+        # Wall-clock seconds per stage, and usage and stderr of the job's FFMPEG processes
+        self.stages = {}
+        self.process_stats = ProcessStats()
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Recreate a job from the output of settings(), e.g. read from the journal."""
+        settings = dict(settings)
+        if settings.get('target_quality'):
+            settings['target_quality'] = tuple(settings['target_quality'])
+        settings['renditions'] = [Rendition.from_settings(rendition)
+                                  for rendition in settings.get('renditions') or []]
+        return cls(settings.pop('source'), **settings)
+
+    def settings(self):
+        """The options the job was created with, as JSON-compatible values."""
+        return {
+            'source': os.path.abspath(self.source),
+            'format_name': self.format_name,
+            'preset_name': self.preset_name,
+            'output_file': os.path.abspath(self.output_file),
+            'resolution': self.resolution,
+            'crf': self.crf,
+            'encode_preset': self.encode_preset,
+            'allow_remux': self.allow_remux,
+            'segmented': self.segmented,
+            'target_quality': list(self.target_quality) if self.target_quality else None,
+            'renditions': [rendition.settings() for rendition in self.renditions],
+            'start': self.start,
+            'end': self.end,
+            'accurate_trim': self.accurate_trim,
+            'target_size': self.target_size,
+            'target_bitrate': self.target_bitrate
+        }
+
+    @property
+    def codec(self):
+        """The preset's codec family, e.g. 'h264'."""
+        return get_preset_options(self.format_name, self.preset_name).get('codec')
+
+    @property
+    def encoder(self):
+        """The installed FFMPEG encoder that implements the codec family."""
+        return resolve_encoder(self.codec)
+
+    def format_output_path(self, format_name=None, preset_name=None, resolution=None):
+        """Expand the output template for this job's source file.
+
+        The format, preset and resolution default to the job's own.
+        """
+        format_name = format_name or self.format_name
+        preset_name = preset_name or self.preset_name
+        directory, name = os.path.split(os.path.abspath(self.source))
+        stem = os.path.splitext(name)[0]
+        return self.output_template.format(
+            dir=directory,
+            stem=stem,
+            ext=FORMATS[format_name]['extension'],
+            format=format_name.lower(),
+            preset=preset_name.lower().replace(' ', '_'),
+            resolution=resolution_label(resolution or self.resolution)
+        )
+
+    def rendition_output_path(self, rendition, used):
+        """Expand the output template for a rendition, adding suffixes to avoid the used paths."""
+        path = self.format_output_path(rendition.format_name, rendition.preset_name,
+                                       rendition.resolution)
+        stem, ext = os.path.splitext(path)
+        label = resolution_label(rendition.resolution)
+        format_name = rendition.format_name.lower()
+        preset = rendition.preset_name.lower().replace(' ', '_')
+        candidates = [path, f'{stem}_{format_name}_{label}{ext}',
+                      f'{stem}_{format_name}_{preset}_{label}{ext}']
+        number = 2
+        while all(os.path.abspath(candidate) in used for candidate in candidates):
+            candidates.append(f'{stem}_{format_name}_{preset}_{label}_{number}{ext}')
+            number += 1
+        return next(candidate for candidate in candidates if os.path.abspath(candidate) not in used)
+
+    @property
+    def outputs(self):
+        """Every output of the job as a Rendition, the job's own first."""
+        return [Rendition(self.format_name, self.preset_name, self.resolution, self.output_file,
+                          self.crf, self.encode_preset), *self.renditions]
+
+    def choose_mode(self, cpu_count):
+        """Remux when the probed source already fits the preset, otherwise encode.
+
+        Long, slow encodes are split into segments encoded in parallel, and
+        jobs with renditions encode every output from one decode.
+        """
+        if self.renditions:
+            self.mode = 'multi'
+            return self.mode
+        if self.two_pass:
+            self.mode = 'two-pass'
+            return self.mode
+        # A quality target asks for a re-encode at the CRF it calls for
+        if self.allow_remux and not self.target_quality and can_stream_copy(
+                self.media_info, self.format_name, self.preset_name, self.resolution,
+                self.crf, self.encode_preset) and (
+                not self.accurate_trim or starts_on_keyframe(self.source, self.start,
+                                                             self.media_info)):
+            self.mode = 'remux'
+        # Segments are split from the whole source, so ranges encode in one process
+        elif not self.trimmed and should_segment(self, cpu_count):
+            self.mode = 'segmented'
+        else:
+            self.mode = 'encode'
+        return self.mode
+
+    @property
+    def two_pass(self):
+        return bool(self.target_size or self.target_bitrate)
+
+    def video_bitrate(self):
+        """Video bits per second meeting the job's target size or bitrate. Raises ValueError."""
+        return target_video_bitrate(self.duration, self.media_info, self.target_size,
+                                    self.target_bitrate)
+
+    @property
+    def trimmed(self):
+        return self.start is not None or self.end is not None
+
+    def input_parameters(self):
+        """FFMPEG arguments placed before -i, selecting the job's range of the source."""
+        return trim_parameters(self.start, self.end)
+
+    def conversion_parameters(self, threads=True):
+        """FFMPEG output arguments; threads=False leaves out the thread limits."""
+        if self.mode == 'remux':
+            params = build_remux_parameters()
+            if self.trimmed:
+                # A copy starting mid-file keeps the source's timestamps otherwise
+                params.extend(['-avoid_negative_ts', 'make_zero'])
+            return params
+        params = build_conversion_parameters(self.format_name, self.preset_name,
+                                             self.resolution, self.crf, self.encode_preset)
+        if self.mode == 'two-pass':
+            params = bitrate_parameters(params, self.bitrate)
+        if threads and self.threads:
+            params.extend(thread_parameters(self.encoder, self.threads, self.frame_size()[0]))
+        return params
+
+    def frame_size(self, resolution=None):
+        """Output (width, height) at a resolution preset, defaulting to the job's own."""
+        info = self.media_info
+        width, height = DEFAULT_FRAME_SIZE
+        if info and info.width and info.height:
+            width, height = info.width, info.height
+        target = resolution_width(resolution or self.resolution)
+        if target:
+            width, height = target, round(height * target / width)
+        return width, height
+
+    def output_threads(self):
+        """Split the job's threads between its outputs by each encoder's usual usage."""
+        usages = [codec_thread_usage(output.encoder) for output in self.outputs]
+        return [max(1, round(self.threads * usage / sum(usages))) for usage in usages]
+
+    def resources(self, threads, speed=None):
+        """Estimate what running the job on threads cores takes from a ResourceBudget.
+
+        Memory is in MiB and the output write rate in MB/s, at speed times
+        realtime (1 when unknown).
+        """
+        frame_rate = (self.media_info and self.media_info.frame_rate) or DEFAULT_FRAME_RATE
+        if self.mode == 'remux':
+            bit_rate = (self.media_info and self.media_info.bit_rate) or 0
+            return {'cores': 1, 'memory': BASE_MEMORY,
+                    'write_rate': bit_rate * REMUX_SPEED / 8e6}
+        memory = write_rate = 0
+        for output in self.outputs:
+            width, height = self.frame_size(output.resolution)
+            options = get_preset_options(output.format_name, output.preset_name)
+            memory += estimate_memory(output.encoder, width, height)
+            write_rate += estimate_write_rate(bits_per_pixel(options), width, height,
+                                              frame_rate, speed or 1.0)
+        return {'cores': threads, 'memory': memory, 'write_rate': write_rate}
+
+    @property
+    def thread_usage(self):
+        """Cores this job keeps busy; a remux is I/O bound and needs one."""
+        if self.mode == 'remux':
+            return 1
+        if self.mode == 'multi':
+            return sum(codec_thread_usage(output.encoder) for output in self.outputs)
+        return codec_thread_usage(self.encoder)
+
+    def build_command(self, pass_number=None):
+        """Build the job's FFMPEG command; a two-pass job's takes the pass, 1 or 2."""
+        if pass_number == 1:
+            return [
+                'ffmpeg',
+                *self.input_parameters(),
+                '-i', self.source,
+                *first_pass_parameters(self.conversion_parameters(), self.encoder),
+                *pass_parameters(self.encoder, 1, self.passlog),
+                '-an', '-f', 'null', os.devnull
+            ]
+        if pass_number == 2:
+            return [
+                'ffmpeg',
+                *self.input_parameters(),
+                '-i', self.source,
+                *self.conversion_parameters(),
+                *pass_parameters(self.encoder, 2, self.passlog),
+                '-y',
+                self.partial_file
+            ]
+        if self.mode == 'multi':
+            outputs = [(output, partial_output_path(output.output_file)) for output in self.outputs]
+            threads = None
+            if self.threads:
+                threads = [(count, self.frame_size(output.resolution)[0])
+                           for output, count in zip(self.outputs, self.output_threads())]
+            return build_multi_output_command(self.source, outputs, threads,
+                                              self.input_parameters())
+        return [
+            'ffmpeg',
+            *self.input_parameters(),
+            '-i', self.source,
+            *self.conversion_parameters(),
+            '-y',  # Overwrite a partial file left by an earlier attempt
+            self.partial_file
+        ]
+
+    @property
+    def elapsed(self):
+        """Wall-clock seconds spent running, so far or in total."""
+        if self.started_at is None:
+            return 0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def speed(self):
+        """Media seconds converted per wall-clock second."""
+        elapsed = self.elapsed
+        return self.media_time / elapsed if elapsed > 0 else 0
+
+    @property
+    def time_saved(self):
+        """Estimated seconds a remux saved over encoding, or None if unknown."""
+        if self.mode != 'remux' or self.estimated_encode_time is None or not self.finished_at:
+            return None
+        return max(self.estimated_encode_time - self.elapsed, 0)
+
+    def history_key(self, mode=None, by_source=True):
+        """Jobs with the same key are expected to convert at similar speeds.
+
+        by_source=False leaves out the source resolution, for jobs not probed yet.
+        """
+        source_height = self.media_info.height if by_source and self.media_info else None
+        return (self.format_name, self.preset_name, self.resolution, self.crf,
+                self.encode_preset, source_height, mode or self.mode)
+
+    @property
+    def eta(self):
+        """Wall-clock seconds until a running job finishes, or None if unknown."""
+        if self.status != 'running' or self.estimator is None:
+            return None
+        return self.estimator.eta()
+
+    @property
+    def projected_size(self):
+        """Expected output size in bytes of a running job, or None if unknown."""
+        if self.status != 'running' or self.estimator is None:
+            return None
+        return self.estimator.projected_size()
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'output': self.output_file,
+            'format': self.format_name,
+            'preset': self.preset_name,
+            'status': self.status,
+            'paused': self.paused,
+            'mode': self.mode,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'elapsed': round(self.elapsed, 3),
+            'speed': round(self.speed, 3),
+            'eta': None if self.eta is None else round(self.eta, 3),
+            'time_saved': None if self.time_saved is None else round(self.time_saved, 3),
+            'outputs': [output.output_file for output in self.outputs],
+            'crf': self.crf,
+            'quality_search': self.quality_search,
+            'threads': self.threads,
+            'priority': self.priority,
+            'bitrate': self.bitrate,
+            'pass': self.current_pass,
+            'error': self.error
+        }
+
+    def metrics(self):
+        """Stage timings, FFMPEG resource usage and output figures, as JSON-compatible values."""
+        output_bytes = 0
+        if self.status == 'done':
+            for output in self.outputs:
+                try:
+                    output_bytes += os.path.getsize(output.output_file)
+                except OSError:
+                    pass
+        media_seconds = self.duration if self.status == 'done' else self.media_time
+        encode_seconds = self.stages.get('encode')
+        return {
+            'id': self.id,
+            'source': self.source,
+            'outputs': [output.output_file for output in self.outputs],
+            'format': self.format_name,
+            'preset': self.preset_name,
+            'status': self.status,
+            'mode': self.mode,
+            'return_code': self.return_code,
+            'error': self.error,
+            'threads': self.threads,
+            'priority': self.priority,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'stages': dict(self.stages),
+            'wall_seconds': round(self.elapsed, 3),
+            'media_seconds': media_seconds,
+            'encode_speed': (round(media_seconds / encode_seconds, 3)
+                             if media_seconds and encode_seconds else None),
+            'output_bytes': output_bytes,
+            # Bits per second of media, over all outputs together
+            'bitrate': round(output_bytes * 8 / self.duration) if output_bytes and self.duration
+            else None,
+            **self.process_stats.to_dict()
+        }
+
+
+class BatchEngine:
+    """Run queued conversion jobs on a bounded pool of FFMPEG processes.
+
+    Listeners are called from worker threads as listener(event, job) with
+    event one of 'queued', 'started', 'progress', 'paused', 'resumed' or
+    'finished'; pausing and resuming call them from the caller's thread. Progress
+    events are coalesced to a few per second per job; job.progress holds
+    the latest ProgressEvent.
+
+    A job starts once the cores, memory (MiB) and output write rate (MB/s)
+    it is estimated to need are free. memory_limit defaults to most of the
+    memory available at startup; a limit of 0 turns that check off.
+
+    Jobs can be cancelled, paused and resumed. An FFMPEG process running
+    longer than timeout seconds, or showing no progress for stall_timeout
+    seconds, is stopped and its job fails.
+    """
+
+    def __init__(self, max_workers=None, cpu_count=None, journal=None, output_cache=None,
+                 memory_limit=None, write_rate_limit=DEFAULT_WRITE_RATE, timeout=None,
+                 stall_timeout=None):
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.max_workers = max_workers or self.cpu_count
+        self.budget = ResourceBudget({
+            'cores': self.cpu_count,
+            'memory': default_memory_limit() if memory_limit is None else memory_limit,
+            'write_rate': write_rate_limit
+        })
+        self.jobs = []
+        self.started_at = None
+        # Speed and output size of finished jobs, per job history key
+        self.history = SpeedHistory()
+        # Optional JobJournal; jobs it shows as finished are skipped
+        self.journal = journal
+        # Optional OutputCache serving encodes that were done before
+        self.output_cache = output_cache
+        # Every FFMPEG process the engine starts, by job, for cancel/pause/resume
+        self.supervisor = Supervisor(timeout, stall_timeout)
+
+        self._queue = queue.Queue()
+        self._listeners = []
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def subscribe(self):
+        """Return an EventStream receiving every event from now on."""
+        return EventStream(self)
+
+    def _emit(self, event, job):
+        for callback in list(self._listeners):
+            try:
+                callback(event, job)
+            except Exception:
+                pass
+
+    def start(self):
+        """Start the worker threads."""
+        with self._lock:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._worker, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, job):
+        """Queue a job for conversion and return it.
+
+        Raises ValueError if a queued or running job already writes one of
+        its outputs, as two sources with the same stem can under one
+        output template.
+        """
+        outputs = {os.path.abspath(output.output_file) for output in job.outputs}
+        with self._lock:
+            for other in self.jobs:
+                if other.status not in ('queued', 'running'):
+                    continue
+                for output in other.outputs:
+                    if os.path.abspath(output.output_file) in outputs:
+                        raise ValueError(f'{output.output_file} is already the output of job '
+                                         f'{other.id} ({other.source})')
+            self.jobs.append(job)
+        self.start()
+        # A finished entry is left alone so run_job can still skip the job
+        if self.journal and not self.journal.finished(job):
+            self.journal.record(job)
+        self._emit('queued', job)
+        self._queue.put(job)
+        return job
+
+    def find_job(self, job_id):
+        """Return the submitted job with id job_id, or None."""
+        with self._lock:
+            return next((job for job in self.jobs if job.id == job_id), None)
+
+    def wait(self):
+        """Block until every submitted job has finished."""
+        self._queue.join()
+
+    def cancel(self, job):
+        """Cancel a queued or running job; return False if it had already finished.
+
+        Its FFMPEG processes are stopped and its partial outputs removed.
+        """
+        if job.status not in ('queued', 'running'):
+            return False
+        self.supervisor.stop(job, 'cancelled')
+        job.paused = False
+        # A job waiting for resources gives up
+        self.budget.wake()
+        return True
+
+    def cancel_all(self, reason='cancelled'):
+        """Cancel every queued and running job."""
+        with self._lock:
+            jobs = [job for job in self.jobs if job.status in ('queued', 'running')]
+        for job in jobs:
+            self.supervisor.stop(job, reason)
+            job.paused = False
+        self.budget.wake()
+
+    def pause(self, job):
+        """Suspend a job's FFMPEG processes (SIGSTOP); a queued job starts suspended.
+
+        Returns False if the job finished or pausing isn't supported here.
+        Paused jobs keep their share of the resource budget.
+        """
+        if job.status not in ('queued', 'running') or not self.supervisor.pause(job):
+            return False
+        job.paused = True
+        self._emit('paused', job)
+        return True
+
+    def resume(self, job):
+        """Continue a paused job's FFMPEG processes (SIGCONT)."""
+        if not job.paused or not self.supervisor.resume(job):
+            return False
+        job.paused = False
+        self._emit('resumed', job)
+        return True
+
+    def shutdown(self, cancel=False):
+        """Stop the worker threads once the queued jobs are done.
+
+        With cancel, queued jobs are dropped and running FFMPEG processes
+        stopped first, so no child process outlives the engine.
+        """
+        if cancel:
+            self.cancel_all('shutdown')
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self.run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def run_job(self, job):
+        """Run one job's FFMPEG process to completion.
+
+        FFMPEG writes to job.partial_file, which replaces job.output_file
+        only once the conversion succeeded.
+        """
+        skip = self.journal is not None and self.journal.finished(job)
+        job.status = 'running'
+        job.started_at = time.time()
+        job.stages['queue_wait'] = round(job.started_at - job.queued_at, 6)
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = job.started_at
+        if not skip:
+            self.record_journal(job)
+            self._emit('started', job)
+
+        granted = None
+        try:
+            if skip:
+                job.mode = 'skipped'
+                job.status = 'done'
+                return
+            if self.supervisor.stop_reason(job):
+                # Cancelled while queued
+                return
+
+            if job.media_info is None:
+                with timed_stage(job, 'probe'):
+                    job.media_info = probe(job.source)
+                job.duration = range_duration(job.start, job.end, job.media_info.duration)
+            if job.start and job.media_info.duration and job.start >= job.media_info.duration:
+                raise ValueError(f'the range starts after the end of the source '
+                                 f'({job.media_info.duration:.3f}s)')
+            for output in job.outputs:
+                os.makedirs(os.path.dirname(os.path.abspath(output.output_file)), exist_ok=True)
+            if job.choose_mode(self.cpu_count) == 'remux':
+                job.estimated_encode_time = self.estimate_encode_time(job)
+            elif job.mode == 'two-pass':
+                job.bitrate = job.video_bitrate()
+            elif job.target_quality and supports_target_quality(job.format_name, job.preset_name):
+                with timed_stage(job, 'quality_search'):
+                    self.choose_crf(job)
+
+            cache_key = None
+            if self.output_cache is not None and job.mode in ('encode', 'segmented', 'two-pass'):
+                with timed_stage(job, 'cache_lookup'):
+                    cache_key = self.output_cache_key(job)
+                    if self.output_cache.fetch(cache_key, job.partial_file):
+                        job.mode = 'cached'
+
+            throttle = ProgressThrottle()
+            job.estimator = ThroughputEstimator(job.duration)
+
+            def on_progress(event):
+                job.progress = event
+                job.media_time = event.out_time
+                job.estimator.update(event)
+                if throttle.ready(event):
+                    self._emit('progress', job)
+
+            if job.mode == 'cached':
+                job.return_code = 0
+            elif job.mode == 'segmented':
+                # Each segment takes its own share from the budget
+                job.threads = job.thread_usage
+                with timed_stage(job, 'encode'):
+                    job.return_code = encode_segmented(job, self.budget, self.cpu_count,
+                                                       on_progress, self.supervisor)
+            elif job.mode == 'two-pass':
+                job.return_code = self.encode_two_pass(job, on_progress)
+            else:
+                job.threads = self.thread_budget(job)
+                with timed_stage(job, 'resource_wait'):
+                    # Nothing is granted to a job stopped while it waits; its
+                    # run_ffmpeg call then returns at once
+                    granted = self.budget.acquire(job.resources(job.threads,
+                                                                self.predict_speed(job)),
+                                                  self.stop_check(job))
+                with timed_stage(job, 'encode'):
+                    job.return_code = run_ffmpeg(job.build_command(), on_progress, job.priority,
+                                                 job.process_stats, self.supervisor, job)
+
+            if job.return_code == 0:
+                with timed_stage(job, 'finalize'):
+                    for output in job.outputs:
+                        os.replace(partial_output_path(output.output_file), output.output_file)
+                    job.status = 'done'
+                    job.media_time = job.duration or job.media_time
+                    if job.mode != 'cached':
+                        self.record_history(job)
+                    if cache_key and job.mode != 'cached':
+                        self.output_cache.store(cache_key, job.output_file)
+            else:
+                job.status = 'failed'
+                job.error = f'ffmpeg exited with code {job.return_code}'
+                cause = job.process_stats.last_error()
+                if cause:
+                    job.error += f': {cause}'
+
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+
+        finally:
+            if granted is not None:
+                self.budget.release(granted)
+            reason = self.supervisor.stop_reason(job)
+            if reason and job.status != 'done':
+                job.status = 'cancelled' if reason in CANCEL_REASONS else 'failed'
+                job.error = reason
+            with self._lock:
+                first_pass_thread = job.first_pass_thread
+            if first_pass_thread is not None:
+                first_pass_thread.join()
+            self.supervisor.forget(job)
+            job.paused = False
+            job.current_pass = None
+            if job.passlog:
+                shutil.rmtree(os.path.dirname(job.passlog), ignore_errors=True)
+            if job.status in ('failed', 'cancelled'):
+                self.remove_partial_outputs(job)
+            if job.status == 'cancelled' and reason != 'shutdown' and job.mode == 'segmented':
+                # Finished segments are only kept for a job that will be retried
+                shutil.rmtree(segment_workdir(job), ignore_errors=True)
+            job.finished_at = time.time()
+            # Jobs stopped by a shutdown stay unfinished in the journal, to be resumed
+            if reason != 'shutdown':
+                self.record_journal(job)
+            self._emit('finished', job)
+
+    def output_cache_key(self, job):
+        """Key of a job's output in the output cache.
+
+        Thread limits are left out: they depend on how busy the engine was,
+        e.g. whether the job's first pass ran ahead, not on the settings.
+        """
+        return output_key(source_fingerprint(job.source),
+                          [*job.input_parameters(), *job.conversion_parameters(threads=False)],
+                          os.path.splitext(job.output_file)[1])
+
+    def remove_partial_outputs(self, job):
+        try:
+            outputs = job.outputs
+        except ValueError:
+            # A job with an unknown format or preset never started writing
+            return
+        for output in outputs:
+            try:
+                os.remove(partial_output_path(output.output_file))
+            except OSError:
+                pass
+
+    def record_journal(self, job):
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(job)
+        except Exception:
+            # Losing a journal entry only costs redoing that job after a restart
+            pass
+
+    def choose_crf(self, job):
+        """Replace the job's CRF with the one its quality target calls for."""
+        parallelism = max(1, self.cpu_count // job.thread_usage)
+        granted = self.budget.acquire({'cores': job.thread_usage * parallelism},
+                                      self.stop_check(job))
+        if granted is None:
+            raise QualitySearchError(f'Quality search stopped: {self.supervisor.stop_reason(job)}')
+        try:
+            job.quality_search = search_crf(job, job.target_quality, parallelism,
+                                            supervisor=self.supervisor)
+        finally:
+            self.budget.release(granted)
+        job.crf = job.quality_search['crf']
+
+    def stop_check(self, job):
+        """A callable telling ResourceBudget.acquire whether the job was stopped."""
+        return lambda: self.supervisor.stop_reason(job)
+
+    def thread_budget(self, job, sharing=0):
+        """Threads for a job: its encoders' usual core usage, or an even share of
+        the cores when fewer jobs are left than workers, up to what the
+        encoders can use.
+
+        sharing counts further processes to leave cores for, such as a first
+        pass running ahead.
+        """
+        if job.mode == 'remux':
+            return 1
+        with self._lock:
+            pending = sum(1 for other in self.jobs if other.status in ('queued', 'running'))
+        share = self.cpu_count // max(1, min(pending, self.max_workers) + sharing)
+        limit = sum(encoder_max_threads(output.encoder) for output in job.outputs)
+        return max(1, min(max(job.thread_usage, share), limit, self.cpu_count))
+
+    def encode_two_pass(self, job, on_progress):
+        """Run a two-pass job's passes and return the exit code of the last one run.
+
+        When the second pass starts, the first pass of the next queued
+        two-pass job starts alongside it, so its analysis is done by the
+        time its turn comes; the two share the cores.
+        """
+        job.threads = self.thread_budget(job)
+        job.current_pass = 1
+        with timed_stage(job, 'first_pass'):
+            return_code = self.run_first_pass(job, job.threads, on_progress)
+        if return_code != 0:
+            return return_code
+
+        job.current_pass = 2
+        job.media_time = 0
+        job.estimator = ThroughputEstimator(job.duration)
+        next_job = self.claim_first_pass(job)
+        job.threads = self.thread_budget(job, 1 if next_job else 0)
+        with timed_stage(job, 'resource_wait'):
+            granted = self.budget.acquire(job.resources(job.threads, self.predict_speed(job)),
+                                          self.stop_check(job))
+        if granted is None:
+            return STOPPED_RETURN_CODE
+        try:
+            if next_job is not None:
+                self.start_first_pass(next_job, self.thread_budget(next_job, 1))
+            with timed_stage(job, 'encode'):
+                return run_ffmpeg(job.build_command(2), on_progress, job.priority,
+                                  job.process_stats, self.supervisor, job)
+        finally:
+            self.budget.release(granted)
+
+    def run_first_pass(self, job, threads, on_progress=None):
+        """Run a two-pass job's analysis pass unless it already ran; return its exit code.
+
+        If the pass is running ahead on another thread, this waits for it.
+        """
+        with job.first_pass_lock:
+            if job.first_pass_code is None:
+                if job.passlog is None:
+                    job.passlog = make_passlog_prefix()
+                job.threads = threads
+                # The analysis pass writes nothing but its small pass log
+                granted = self.budget.acquire({**job.resources(threads), 'write_rate': 0},
+                                              self.stop_check(job))
+                if granted is None:
+                    return STOPPED_RETURN_CODE
+                try:
+                    job.first_pass_code = run_ffmpeg(job.build_command(1), on_progress,
+                                                     job.priority, job.process_stats,
+                                                     self.supervisor, job)
+                finally:
+                    self.budget.release(granted)
+            return job.first_pass_code
+
+    def claim_first_pass(self, current):
+        """Pick the next queued two-pass job whose first pass may run ahead, or None."""
+        with self._lock:
+            for job in self.jobs:
+                if (job is current or job.status != 'queued' or not job.two_pass
+                        or job.first_pass_claimed or job.paused
+                        or self.supervisor.stop_reason(job)):
+                    continue
+                if self.journal is not None and self.journal.finished(job):
+                    continue
+                job.first_pass_claimed = True
+                return job
+        return None
+
+    def start_first_pass(self, job, threads):
+        """Start a claimed job's first pass on a thread of its own, unless its turn came."""
+        with self._lock:
+            if job.status != 'queued':
+                return
+            job.first_pass_thread = threading.Thread(
+                target=self._run_first_pass_ahead, args=(job, threads), daemon=True)
+            job.first_pass_thread.start()
+
+    def _run_first_pass_ahead(self, job, threads):
+        with job.first_pass_lock:
+            if job.status != 'queued' or self.supervisor.stop_reason(job):
+                return
+            try:
+                if job.media_info is None:
+                    job.media_info = probe(job.source)
+                    job.duration = range_duration(job.start, job.end, job.media_info.duration)
+                job.mode = 'two-pass'
+                job.bitrate = job.video_bitrate()
+                if (self.output_cache is not None
+                        and self.output_cache.contains(self.output_cache_key(job))):
+                    # The job's turn takes its output from the cache; no pass is needed
+                    return
+                self.run_first_pass(job, threads)
+            except Exception:
+                # The job runs into the same problem on its turn and reports it then
+                pass
+
+    def predict_speed(self, job):
+        """Expected speed in media seconds per second from past runs, or None."""
+        if not job.duration:
+            return None
+        seconds = self.predict_from_history(job, (job.mode,))
+        return job.duration / seconds if seconds else None
+
+    def record_history(self, job):
+        try:
+            output_bytes = os.path.getsize(job.output_file)
+        except OSError:
+            output_bytes = 0
+        wall_seconds = time.time() - job.started_at
+        self.history.record(job.history_key(), job.media_time, wall_seconds, output_bytes)
+        if job.media_info and job.media_info.height:
+            self.history.record(job.history_key(by_source=False), job.media_time,
+                                wall_seconds, output_bytes)
+
+    def predict_from_history(self, job, modes):
+        """Predict a job's wall-clock seconds from the first mode with history, or None."""
+        for mode in modes:
+            for by_source in (True, False):
+                estimate = self.history.predict_time(job.history_key(mode, by_source),
+                                                     job.duration)
+                if estimate is not None:
+                    return estimate
+        return None
+
+    def estimate_encode_time(self, job):
+        """Predict how long encoding the job would take from past encodes, or None."""
+        return self.predict_from_history(job, ('encode', 'segmented'))
+
+    def predict_job_time(self, job):
+        """Predict a job's remaining wall-clock seconds, or None if unknown."""
+        if job.status == 'running':
+            return job.eta
+        if job.status != 'queued':
+            return 0
+        # The mode of a queued job isn't known yet, so use any history that matches
+        return self.predict_from_history(job, ('encode', 'segmented', 'remux'))
+
+    def estimate_completion(self):
+        """Estimate wall-clock seconds until every submitted job is done, or None."""
+        with self._lock:
+            jobs = [job for job in self.jobs if job.status in ('queued', 'running')]
+        running = sum(1 for job in jobs if job.status == 'running')
+        estimate = queue_completion_time([self.predict_job_time(job) for job in jobs],
+                                         max(running, 1))
+        return None if estimate is None else round(estimate, 3)
+
+    def stats(self):
+        """Aggregate throughput across all jobs submitted so far."""
+        with self._lock:
+            jobs = list(self.jobs)
+        counts = {status: 0 for status in ('queued', 'running', 'done', 'failed', 'cancelled')}
+        for job in jobs:
+            counts[job.status] += 1
+
+        done = [job for job in jobs if job.status == 'done']
+        remuxed = [job for job in done if job.mode == 'remux']
+        skipped = [job for job in done if job.mode == 'skipped']
+        cached = [job for job in done if job.mode == 'cached']
+        media_seconds = sum(job.duration or 0 for job in done)
+        finished = [job.finished_at for job in jobs if job.finished_at]
+        if self.started_at is None:
+            wall_seconds = 0
+        elif counts['queued'] or counts['running'] or not finished:
+            wall_seconds = time.time() - self.started_at
+        else:
+            wall_seconds = max(finished) - self.started_at
+
+        return {
+            'jobs': len(jobs),
+            **counts,
+            'remuxed': len(remuxed),
+            'skipped': len(skipped),
+            'cached': len(cached),
+            'time_saved': round(sum(job.time_saved or 0 for job in remuxed), 3),
+            'media_seconds': round(media_seconds, 3),
+            'wall_seconds': round(wall_seconds, 3),
+            'speed': round(media_seconds / wall_seconds, 3) if wall_seconds > 0 else 0,
+            'jobs_per_hour': round(len(done) * 3600 / wall_seconds, 1) if wall_seconds > 0 else 0,
+            'eta': self.estimate_completion(),
+            'output_cache': self.output_cache.stats() if self.output_cache else None
+        }
+
+
+class EventStream:
+    """Engine events queued for consumption from any thread.
+
+    Each item is (event, job, progress) where progress is the job's
+    ProgressEvent for 'progress' events and None otherwise.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._queue = queue.Queue()
+        engine.add_listener(self._put)
+
+    def _put(self, event, job):
+        self._queue.put((event, job, job.progress if event == 'progress' else None))
+
+    def get(self, timeout=None):
+        """Return the next event, or None if none arrives within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while True:
+            yield self._queue.get()
+
+    def close(self):
+        self.engine.remove_listener(self._put)
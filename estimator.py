@@ -0,0 +1,125 @@
+"""Encode speed, ETA and output size estimates.
+
+The ETA of a running job comes from its smoothed encode speed (media
+seconds per wall second), not from the media time left, so a 0.3x VP9
+encode reports a wall-clock ETA about three times its remaining media
+time. Finished jobs feed a history that predicts the time and size of
+jobs that haven't started yet.
+"""
+import threading
+import time
+
+# Weight of the newest measurement in the exponentially smoothed rates
+SMOOTHING = 0.2
+
+
+class ThroughputEstimator:
+    """Smoothed encode speed, frame rate and output byte rate for one running job."""
+
+    def __init__(self, duration, smoothing=SMOOTHING, clock=time.monotonic):
+        self.duration = duration
+        self.smoothing = smoothing
+        self.clock = clock
+        self.speed = 0.0
+        self.fps = 0.0
+        self.byte_rate = 0.0
+        self.out_time = 0.0
+        self.total_size = 0
+        self._last = None
+
+    def _smooth(self, current, sample):
+        if not current:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def update(self, event):
+        """Fold a ProgressEvent into the smoothed rates."""
+        now = self.clock()
+        if self._last is None:
+            # Until there are two samples, trust FFMPEG's own averages
+            self.speed = event.speed
+            self.fps = event.fps
+        else:
+            last_time, last_out_time, last_frame, last_size = self._last
+            elapsed = now - last_time
+            if elapsed > 0 and event.out_time >= last_out_time:
+                self.speed = self._smooth(self.speed, (event.out_time - last_out_time) / elapsed)
+                self.fps = self._smooth(self.fps, (event.frame - last_frame) / elapsed)
+                self.byte_rate = self._smooth(self.byte_rate,
+                                              (event.total_size - last_size) / elapsed)
+        self._last = (now, event.out_time, event.frame, event.total_size)
+        self.out_time = event.out_time
+        self.total_size = event.total_size
+
+    def eta(self):
+        """Wall-clock seconds until the job finishes, or None if unknown."""
+        if not self.duration or self.speed <= 0:
+            return None
+        return max(self.duration - self.out_time, 0) / self.speed
+
+    def projected_size(self):
+        """Expected final output size in bytes, or None if unknown."""
+        if not self.duration or self.out_time <= 0 or not self.total_size:
+            return None
+        return self.total_size * self.duration / self.out_time
+
+
+class SpeedHistory:
+    """Speed and output size of finished jobs, totalled per kind of job."""
+
+    def __init__(self):
+        # key -> (jobs, media seconds, wall seconds, output bytes)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, media_seconds, wall_seconds, output_bytes=0):
+        if media_seconds <= 0 or wall_seconds <= 0:
+            return
+        with self._lock:
+            jobs, media, wall, size = self._totals.get(key, (0, 0, 0, 0))
+            self._totals[key] = (jobs + 1, media + media_seconds, wall + wall_seconds,
+                                 size + output_bytes)
+
+    def speed(self, key):
+        """Media seconds per wall second seen for this key, or None."""
+        with self._lock:
+            _, media, wall, _ = self._totals.get(key, (0, 0, 0, 0))
+        return media / wall if media and wall else None
+
+    def predict_time(self, key, duration=None):
+        """Predicted wall-clock seconds for a job, or None without history.
+
+        Without a known duration the average time per job is used.
+        """
+        with self._lock:
+            jobs, media, wall, _ = self._totals.get(key, (0, 0, 0, 0))
+        if not jobs:
+            return None
+        if not duration:
+            return wall / jobs
+        return duration * wall / media
+
+    def predict_size(self, key, duration=None):
+        """Predicted output bytes for a job, or None without history."""
+        with self._lock:
+            jobs, media, _, size = self._totals.get(key, (0, 0, 0, 0))
+        if not jobs or not size:
+            return None
+        if not duration:
+            return size / jobs
+        return size * duration / media
+
+
+def queue_completion_time(remaining, parallelism):
+    """Estimate wall-clock seconds until a queue drains.
+
+    remaining holds each unfinished job's expected wall-clock seconds (None
+    when unknown); the work is assumed to spread over parallelism workers.
+    Returns None if any job's time is unknown.
+    """
+    if any(seconds is None for seconds in remaining):
+        return None
+    if not remaining:
+        return 0
+    # The queue can't finish before its longest job does
+    return max(sum(remaining) / max(parallelism, 1), max(remaining))
@@ -0,0 +1,166 @@
+"""Discovering video files in dropped paths, folders and watched folders."""
+import os
+import threading
+
+from presets import SUPPORTED_EXTENSIONS
+
+# Seconds between scans of a watched folder
+WATCH_INTERVAL = 2
+# Scans in a row a file's size and modification time must stay the same for
+SETTLE_SCANS = 2
+
+
+def is_supported_file(path):
+    return path.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def iter_video_files(paths):
+    """Yield (path, relative directory) for each supported video file.
+
+    Folders are walked depth first, one directory listing at a time, so
+    the first files are yielded before the whole tree has been read. The
+    relative directory starts with the dropped folder's own name, and is
+    empty for files given directly.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            root = os.path.normpath(path)
+            base = os.path.basename(root)
+            stack = [root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+                except OSError:
+                    continue
+                subdirectories = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        elif entry.is_file() and is_supported_file(entry.name):
+                            relative = os.path.relpath(directory, root)
+                            yield entry.path, os.path.normpath(os.path.join(base, relative))
+                    except OSError:
+                        continue
+                # Reversed so subdirectories are visited in name order
+                stack.extend(reversed(subdirectories))
+        elif os.path.isfile(path) and is_supported_file(path):
+            yield path, ''
+
+
+def batch_output_path(source, relative_dir, output_dir, extension, claimed=None):
+    """Place a converted file under output_dir, mirroring the dropped folder layout.
+
+    A '_converted' suffix is added if the result would overwrite the source.
+    claimed maps the outputs already given out to their sources; a name
+    another source has, as clip.mkv does when clip.mov came first, gets a
+    numbered suffix, clip_1.mp4, instead. The chosen name is added to it.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    source = os.path.abspath(source)
+    claimed = {} if claimed is None else claimed
+    output_file = os.path.join(output_dir, relative_dir, stem + extension)
+    if os.path.abspath(output_file) == source:
+        stem += '_converted'
+        output_file = os.path.join(output_dir, relative_dir, stem + extension)
+    number = 0
+    while claimed.get(os.path.abspath(output_file), source) != source:
+        number += 1
+        output_file = os.path.join(output_dir, relative_dir, f'{stem}_{number}{extension}')
+    claimed[os.path.abspath(output_file)] = source
+    return output_file
+
+
+def is_partial_output(path):
+    """Return True for an output still being written under its temporary name."""
+    return os.path.splitext(os.path.splitext(path)[0])[1] == '.partial'
+
+
+class WatchFolder:
+    """Submit the video files that arrive in a folder once they are complete.
+
+    The folder is scanned every interval seconds, subdirectories included.
+    A file is passed to make_job(path, relative_dir), and the job submitted
+    to the engine, once its size and modification time have stayed the
+    same for settle_scans scans, so files still being copied or recorded
+    are left alone. Files already there at start are converted too, and a
+    file replaced later is converted again. Folders in ignore, such as the
+    output folder, are not scanned.
+    """
+
+    def __init__(self, engine, directory, make_job, ignore=(), interval=WATCH_INTERVAL,
+                 settle_scans=SETTLE_SCANS):
+        self.engine = engine
+        self.directory = os.path.abspath(directory)
+        self.make_job = make_job
+        self.ignore = {os.path.abspath(path) for path in ignore}
+        self.interval = interval
+        self.settle_scans = settle_scans
+        # path -> ((size, mtime), scans it has been unchanged for)
+        self._pending = {}
+        # path -> (size, mtime) when its job was submitted
+        self._submitted = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop scanning; jobs already submitted are left to the engine."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.scan()
+            self._stop.wait(self.interval)
+
+    def iter_files(self):
+        """Yield (path, relative directory) for each video file in the folder."""
+        for directory, subdirectories, files in os.walk(self.directory):
+            subdirectories[:] = sorted(name for name in subdirectories
+                                       if os.path.join(directory, name) not in self.ignore)
+            relative = os.path.relpath(directory, self.directory)
+            for name in sorted(files):
+                if is_supported_file(name) and not is_partial_output(name):
+                    yield os.path.join(directory, name), '' if relative == '.' else relative
+
+    def scan(self):
+        """Check the folder once and return the jobs submitted."""
+        jobs = []
+        present = set()
+        for path, relative in self.iter_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            present.add(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._submitted.get(path) == signature:
+                continue
+            previous = self._pending.get(path)
+            scans = previous[1] + 1 if previous and previous[0] == signature else 0
+            if scans < self.settle_scans or not stat.st_size:
+                self._pending[path] = (signature, scans)
+                continue
+            self._pending.pop(path, None)
+            self._submitted[path] = signature
+            try:
+                job = self.make_job(path, relative)
+            except ValueError:
+                # Settings this file can't take; it is retried if it changes
+                continue
+            try:
+                jobs.append(self.engine.submit(job))
+            except ValueError:
+                # Another job is still writing its output; try again on a later scan
+                del self._submitted[path]
+        # Files that went away start over if they come back
+        for tracked in (self._pending, self._submitted):
+            for path in [path for path in tracked if path not in present]:
+                del tracked[path]
+        return jobs
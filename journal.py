@@ -0,0 +1,109 @@
+"""Persistent journal of conversion jobs, so interrupted batches can resume.
+
+Each job is recorded by a key derived from its settings and the source
+file's identity. A job whose journal entry is 'done' and whose output is
+still the file that was written is not converted again, and jobs left
+'queued' or 'running' by a crash can be queued again with unfinished().
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import cache_dir, file_key
+
+# Finished entries older than this are dropped when the journal is opened
+RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def default_journal_path():
+    return os.path.join(cache_dir(), 'journal.sqlite3')
+
+
+def job_key(settings):
+    """Identify a job by its settings and the current state of its source file."""
+    try:
+        source = file_key(settings['source'])
+    except OSError:
+        source = os.path.abspath(settings['source'])
+    text = json.dumps([source, settings], sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class JobJournal:
+    """Queued, running and finished jobs in SQLite, safe to share between threads."""
+
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs '
+                '(key TEXT PRIMARY KEY, settings TEXT NOT NULL, status TEXT NOT NULL, '
+                'output TEXT, return_code INTEGER, error TEXT, updated REAL NOT NULL)')
+            self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated < ?",
+                (time.time() - RETENTION_SECONDS,))
+
+    def record(self, job):
+        """Store the job's current status; done jobs also record their output file."""
+        output = None
+        if job.status == 'done':
+            try:
+                output = file_key(job.output_file)
+            except OSError:
+                pass
+        values = (json.dumps(job.journal_settings), job.status, output, job.return_code,
+                  job.error, time.time(), job.journal_key)
+        with self._lock, self._connection:
+            # Update in place so unfinished() keeps the order jobs were first queued in
+            updated = self._connection.execute(
+                'UPDATE jobs SET settings = ?, status = ?, output = ?, return_code = ?, '
+                'error = ?, updated = ? WHERE key = ?', values).rowcount
+            if not updated:
+                self._connection.execute(
+                    'INSERT INTO jobs (settings, status, output, return_code, error, updated, key) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', values)
+
+    def finished(self, job):
+        """Return True if the job already finished and its output is unchanged since."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT status, output FROM jobs WHERE key = ?', (job.journal_key,)).fetchone()
+        if row is None or row[0] != 'done' or not row[1]:
+            return False
+        try:
+            return file_key(job.output_file) == row[1]
+        except OSError:
+            return False
+
+    def unfinished(self):
+        """Return the settings of jobs that were queued or running but never finished.
+
+        Entries whose source file changed or went away since are dropped:
+        their key no longer matches the job the settings would recreate, so
+        they could never be resumed or forgotten.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, settings FROM jobs WHERE status IN ('queued', 'running') "
+                "ORDER BY rowid").fetchall()
+        unfinished = []
+        stale = []
+        for key, text in rows:
+            settings = json.loads(text)
+            if job_key(settings) == key:
+                unfinished.append(settings)
+            else:
+                stale.append((key,))
+        if stale:
+            with self._lock, self._connection:
+                self._connection.executemany('DELETE FROM jobs WHERE key = ?', stale)
+        return unfinished
+
+    def forget(self, job):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM jobs WHERE key = ?', (job.journal_key,))
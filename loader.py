@@ -0,0 +1,90 @@
+"""Background file loading: probing, thumbnails and scrubbing frames off the UI thread."""
+import concurrent.futures
+import threading
+
+from probe import ProbeError, probe
+from thumbnails import PREVIEW_HEIGHT, ThumbnailError, get_sprites, get_thumbnail
+
+
+class FileLoader:
+    """Probe and thumbnail files on a small worker pool.
+
+    Results are passed to dispatch(callback_name, path, value), which must
+    be safe to call from any thread; the GUI puts them on its dispatch
+    queue. Starting a new load cancels the previous one: its remaining
+    steps are skipped and any late results are dropped.
+    """
+
+    def __init__(self, dispatch, max_workers=2, height=PREVIEW_HEIGHT):
+        self.dispatch = dispatch
+        self.height = height
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='loader')
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Start loading a file, cancelling any load in progress."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._executor.submit(self._run, path, generation)
+
+    def load_sprites(self, path, duration, prepare=None):
+        """Fetch the scrubbing sprite sheet of the file being loaded.
+
+        prepare, if given, is applied to the SpriteSheet on the worker
+        thread (e.g. to decode and slice it) and its result is delivered
+        instead. Results are dropped once another file is loaded.
+        """
+        with self._lock:
+            generation = self._generation
+        self._executor.submit(self._run_sprites, path, duration, prepare, generation)
+
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+
+    def cancelled(self, generation):
+        with self._lock:
+            return generation != self._generation
+
+    def _deliver(self, generation, event, path, value):
+        if not self.cancelled(generation):
+            self.dispatch(event, path, value)
+
+    def _run(self, path, generation):
+        if self.cancelled(generation):
+            return
+        # OSError covers files deleted or made unreadable after they were chosen,
+        # and a missing FFMPEG; it is reported like any failed probe
+        try:
+            info = probe(path)
+        except (ProbeError, OSError) as e:
+            self._deliver(generation, 'load_error', path, str(e))
+            return
+        self._deliver(generation, 'probed', path, info)
+
+        if self.cancelled(generation):
+            return
+        try:
+            data = get_thumbnail(path, info.duration, self.height)
+        except (ThumbnailError, OSError) as e:
+            self._deliver(generation, 'thumbnail_error', path, str(e))
+            return
+        self._deliver(generation, 'thumbnail', path, data)
+
+    def _run_sprites(self, path, duration, prepare, generation):
+        if self.cancelled(generation):
+            return
+        try:
+            sheet = get_sprites(path, duration, self.height)
+            value = prepare(sheet) if prepare else sheet
+        except Exception as e:
+            self._deliver(generation, 'sprites_error', path, str(e))
+            return
+        self._deliver(generation, 'sprites', path, value)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,168 @@
+"""Per-job instrumentation and metrics export.
+
+The engine times each stage of a job (queue wait, probe, quality search,
+cache lookup, first pass, encode, finalize) and run_ffmpeg collects the CPU time,
+peak memory and stderr tail of its FFMPEG processes. MetricsLog appends
+every finished job's metrics to a JSON lines file, and MetricsServer
+serves running totals in the Prometheus text format on a local port.
+"""
+import collections
+import contextlib
+import http.server
+import json
+import threading
+import time
+
+DEFAULT_METRICS_PORT = 9850
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'video_converter'
+
+
+@contextlib.contextmanager
+def timed_stage(job, stage):
+    """Add the wall-clock seconds spent in the block to job.stages[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        job.stages[stage] = round(job.stages.get(stage, 0) + time.perf_counter() - start, 6)
+
+
+class MetricsLog:
+    """Engine listener appending each finished job's metrics to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event, job):
+        if event != 'finished':
+            return
+        line = json.dumps(job.metrics(), sort_keys=True)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metric(name, kind, description, samples):
+    """Format one metric family; samples are (labels dict, value) pairs."""
+    lines = [f'# HELP {METRIC_PREFIX}_{name} {description}',
+             f'# TYPE {METRIC_PREFIX}_{name} {kind}']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+        if label_text:
+            label_text = '{' + label_text + '}'
+        lines.append(f'{METRIC_PREFIX}_{name}{label_text} {value}')
+    return lines
+
+
+class MetricsCollector:
+    """Running totals over an engine's finished jobs, rendered for Prometheus.
+
+    The collector registers itself as a listener of the engine; gauges such
+    as queued and running jobs are read from engine.stats() when rendered.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.jobs = collections.Counter()
+        self.stage_seconds = collections.Counter()
+        self.stage_counts = collections.Counter()
+        self.cpu_seconds = 0.0
+        self.max_rss = 0
+        self.media_seconds = 0.0
+        self.output_bytes = 0
+        self._lock = threading.Lock()
+        engine.add_listener(self)
+
+    def __call__(self, event, job):
+        if event != 'finished':
+            return
+        metrics = job.metrics()
+        with self._lock:
+            self.jobs[metrics['status'], metrics['mode'] or 'none'] += 1
+            for stage, seconds in metrics['stages'].items():
+                self.stage_seconds[stage] += seconds
+                self.stage_counts[stage] += 1
+            self.cpu_seconds += metrics['cpu_seconds']
+            self.max_rss = max(self.max_rss, metrics['max_rss_bytes'])
+            if metrics['status'] == 'done':
+                self.media_seconds += metrics['media_seconds'] or 0
+                self.output_bytes += metrics['output_bytes']
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        stats = self.engine.stats()
+        with self._lock:
+            lines = []
+            lines += format_metric(
+                'jobs_total', 'counter', 'Finished jobs by status and mode.',
+                [({'status': status, 'mode': mode}, count)
+                 for (status, mode), count in sorted(self.jobs.items())])
+            lines += format_metric(
+                'jobs', 'gauge', 'Jobs waiting or running now.',
+                [({'status': status}, stats[status]) for status in ('queued', 'running')])
+            lines += format_metric(
+                'stage_seconds_total', 'counter', 'Wall-clock seconds spent in each job stage.',
+                [({'stage': stage}, round(seconds, 6))
+                 for stage, seconds in sorted(self.stage_seconds.items())])
+            lines += format_metric(
+                'stage_runs_total', 'counter', 'Jobs that went through each stage.',
+                [({'stage': stage}, count) for stage, count in sorted(self.stage_counts.items())])
+            lines += format_metric(
+                'ffmpeg_cpu_seconds_total', 'counter', 'CPU seconds used by FFMPEG processes.',
+                [({}, round(self.cpu_seconds, 3))])
+            lines += format_metric(
+                'ffmpeg_max_rss_bytes', 'gauge', 'Peak memory of the largest FFMPEG process.',
+                [({}, self.max_rss)])
+            lines += format_metric(
+                'media_seconds_total', 'counter', 'Seconds of media converted.',
+                [({}, round(self.media_seconds, 3))])
+            lines += format_metric(
+                'output_bytes_total', 'counter', 'Bytes written to converted outputs.',
+                [({}, self.output_bytes)])
+            lines += format_metric(
+                'speed', 'gauge', 'Media seconds converted per wall-clock second in this batch.',
+                [({}, stats['speed'])])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serve a MetricsCollector on http://host:port/metrics from a daemon thread."""
+
+    def __init__(self, collector, port=DEFAULT_METRICS_PORT, host='127.0.0.1'):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = collector.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
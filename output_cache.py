@@ -0,0 +1,186 @@
+"""Content-addressed cache of finished conversion outputs.
+
+An output is keyed by a fingerprint of the source's contents and the
+exact FFMPEG output arguments, so converting the same source with the
+same settings again (under any name or path) is served from the cache
+by hardlinking, or copying when the cache is on another file system.
+The cache directory is kept under a size limit by evicting the least
+recently used outputs, and lifetime hit, miss and bytes-saved totals are
+kept so the limit can be sized from real use.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from cache import cache_dir
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+# The fingerprint hashes this much data from the start, middle and end of a file
+FINGERPRINT_CHUNK = 1024 * 1024
+
+
+def source_fingerprint(path):
+    """Hash a file's size and three sampled chunks; fast even for very large files.
+
+    Raises OSError if the file cannot be read.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        for offset in (0, size // 2, max(size - FINGERPRINT_CHUNK, 0)):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+def output_key(fingerprint, params, extension):
+    """Identify an output by source fingerprint, output arguments and container."""
+    text = json.dumps([fingerprint, [str(arg) for arg in params], extension.lower()])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(source, destination):
+    """Hardlink source to destination, copying if a link isn't possible."""
+    temp_path = f'{destination}.{threading.get_ident()}.tmp'
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+class OutputCache:
+    """Finished outputs on disk, indexed in SQLite, with LRU eviction by total size."""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or cache_dir('outputs')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Hits, misses and bytes served since this object was created
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'),
+                                           check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries '
+                '(key TEXT PRIMARY KEY, name TEXT NOT NULL, size INTEGER NOT NULL, '
+                'used REAL NOT NULL)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _count(self, name, amount=1):
+        self._connection.execute('INSERT OR IGNORE INTO totals (name, value) VALUES (?, 0)',
+                                 (name,))
+        self._connection.execute('UPDATE totals SET value = value + ? WHERE name = ?',
+                                 (amount, name))
+
+    def contains(self, key):
+        """Return True if an intact output is cached for key, without counting a hit or miss."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT name, size FROM entries WHERE key = ?', (key,)).fetchone()
+        try:
+            return row is not None and os.path.getsize(self._path(row[0])) == row[1]
+        except OSError:
+            return False
+
+    def fetch(self, key, destination):
+        """Place the cached output for key at destination; return True on a hit."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT name, size FROM entries WHERE key = ?', (key,)).fetchone()
+        hit = False
+        if row is not None:
+            name, size = row
+            try:
+                # A hardlinked output edited in place changes the cached copy too
+                if os.path.getsize(self._path(name)) == size:
+                    link_or_copy(self._path(name), destination)
+                    hit = True
+            except OSError:
+                pass
+
+        with self._lock, self._connection:
+            if hit:
+                self._connection.execute('UPDATE entries SET used = ? WHERE key = ?',
+                                         (time.time(), key))
+                self.hits += 1
+                self.bytes_saved += size
+                self._count('hits')
+                self._count('bytes_saved', size)
+            else:
+                if row is not None:
+                    self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    self._remove(row[0])
+                self.misses += 1
+                self._count('misses')
+        return hit
+
+    def store(self, key, path):
+        """Add a finished output to the cache, then evict down to max_bytes."""
+        extension = os.path.splitext(path)[1]
+        name = key + extension
+        try:
+            link_or_copy(path, self._path(name))
+            size = os.path.getsize(self._path(name))
+        except OSError:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO entries (key, name, size, used) VALUES (?, ?, ?, ?)',
+                (key, name, size, time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, name, size in self._connection.execute(
+                'SELECT key, name, size FROM entries ORDER BY used').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._remove(name)
+            total -= size
+
+    def _remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock, self._connection:
+            for (name,) in self._connection.execute('SELECT name FROM entries').fetchall():
+                self._remove(name)
+            self._connection.execute('DELETE FROM entries')
+
+    def stats(self):
+        """Hit/miss counts and bytes saved, for this session and over the cache's lifetime."""
+        with self._lock:
+            entries, total = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            lifetime = dict(self._connection.execute('SELECT name, value FROM totals').fetchall())
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_saved': self.bytes_saved,
+            'lifetime_hits': lifetime.get('hits', 0),
+            'lifetime_misses': lifetime.get('misses', 0),
+            'lifetime_bytes_saved': lifetime.get('bytes_saved', 0)
+        }
@@ -0,0 +1,305 @@
+"""Output formats, quality presets and FFMPEG argument building.
+
+This module has no GUI dependencies so it can be shared by the Tk window
+and headless batch runs. Presets name a codec family; the encoder that
+implements it is picked from the installed FFMPEG by the encoders module.
+"""
+from encoders import encoder_parameters, resolve_encoder
+
+# Define common presets
+ENCODING_PRESETS = {
+    'ultrafast': 'Fastest encoding, largest file size',
+    'superfast': 'Very fast encoding, larger file size',
+    'veryfast': 'Fast encoding, good file size',
+    'faster': 'Fast encoding, better compression',
+    'fast': 'Good balance of speed and compression',
+    'medium': 'Default preset, good balance',
+    'slow': 'Better compression, slower encoding',
+    'slower': 'Very good compression, slower encoding',
+    'veryslow': 'Best compression, slowest encoding'
+}
+
+# Define resolution presets
+RESOLUTION_PRESETS = [
+    'Original',
+    '4K (3840x2160)',
+    '2K (2560x1440)',
+    'Full HD (1920x1080)',
+    'HD (1280x720)',
+    'SD (854x480)',
+    'Low (640x360)'
+]
+
+FORMATS = {
+    'MP4': {
+        'extension': '.mp4',
+        'presets': {
+            'Maximum Quality': {
+                'crf': 18,
+                'preset': 'slow',
+                'codec': 'h264'
+            },
+            'High Quality': {
+                'crf': 23,
+                'preset': 'medium',
+                'codec': 'h264'
+            },
+            'Balanced': {
+                'crf': 28,
+                'preset': 'fast',
+                'codec': 'h264'
+            },
+            'Small Size': {
+                'crf': 32,
+                'preset': 'veryfast',
+                'codec': 'h264'
+            },
+            'HEVC Balanced': {
+                'crf': 28,
+                'preset': 'medium',
+                'codec': 'hevc'
+            },
+            'AV1 Balanced': {
+                'crf': 35,
+                'preset': 'medium',
+                'codec': 'av1'
+            }
+        }
+    },
+    'MOV': {
+        'extension': '.mov',
+        'presets': {
+            'ProRes HQ': {
+                'codec': 'prores',
+                'profile': 3
+            },
+            'ProRes Normal': {
+                'codec': 'prores',
+                'profile': 2
+            },
+            'ProRes LT': {
+                'codec': 'prores',
+                'profile': 1
+            },
+            'ProRes Proxy': {
+                'codec': 'prores',
+                'profile': 0
+            }
+        }
+    },
+    'MKV': {
+        'extension': '.mkv',
+        'presets': {
+            'Maximum Quality': {
+                'crf': 18,
+                'preset': 'slow',
+                'codec': 'h264'
+            },
+            'High Quality': {
+                'crf': 23,
+                'preset': 'medium',
+                'codec': 'h264'
+            },
+            'Balanced': {
+                'crf': 28,
+                'preset': 'fast',
+                'codec': 'h264'
+            },
+            'Small Size': {
+                'crf': 32,
+                'preset': 'veryfast',
+                'codec': 'h264'
+            },
+            'HEVC Balanced': {
+                'crf': 28,
+                'preset': 'medium',
+                'codec': 'hevc'
+            },
+            'AV1 Balanced': {
+                'crf': 35,
+                'preset': 'medium',
+                'codec': 'av1'
+            }
+        }
+    },
+    'AVI': {
+        'extension': '.avi',
+        'presets': {
+            'Maximum Quality': {
+                'crf': 18,
+                'preset': 'slow',
+                'codec': 'h264'
+            },
+            'High Quality': {
+                'crf': 23,
+                'preset': 'medium',
+                'codec': 'h264'
+            },
+            'Balanced': {
+                'crf': 28,
+                'preset': 'fast',
+                'codec': 'h264'
+            },
+            'Small Size': {
+                'crf': 32,
+                'preset': 'veryfast',
+                'codec': 'h264'
+            }
+        }
+    },
+    'WEBM': {
+        'extension': '.webm',
+        'presets': {
+            'Maximum Quality': {
+                'crf': 18,
+                'speed': 0,
+                'codec': 'vp9'
+            },
+            'High Quality': {
+                'crf': 30,
+                'speed': 1,
+                'codec': 'vp9'
+            },
+            'Balanced': {
+                'crf': 35,
+                'speed': 2,
+                'codec': 'vp9'
+            },
+            'Small Size': {
+                'crf': 40,
+                'speed': 4,
+                'codec': 'vp9'
+            },
+            'AV1 Balanced': {
+                'crf': 35,
+                'preset': 'medium',
+                'codec': 'av1'
+            }
+        }
+    }
+}
+
+SUPPORTED_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+
+def get_preset_options(format_name, preset_name):
+    """Return the preset dictionary for a format and quality preset."""
+    try:
+        return FORMATS[format_name]['presets'][preset_name]
+    except KeyError:
+        raise ValueError(f"Unknown preset '{preset_name}' for format '{format_name}'")
+
+
+def resolution_width(resolution):
+    """Return the target width for a resolution preset, or None for Original."""
+    if not resolution or resolution == 'Original':
+        return None
+    return int(resolution.split('(')[1].split('x')[0])
+
+
+def build_conversion_parameters(format_name, preset_name, resolution='Original',
+                                crf=None, encode_preset=None):
+    """Build the FFMPEG output arguments for a format and quality preset.
+
+    crf and encode_preset override the preset's own values for encoders
+    that use them; pass None to keep the preset defaults.
+    """
+    preset_options = get_preset_options(format_name, preset_name)
+
+    params = []
+
+    # Add codec
+    encoder = None
+    if 'codec' in preset_options:
+        encoder = resolve_encoder(preset_options['codec'])
+        params.extend(['-c:v', encoder])
+
+    # Add resolution if not original
+    width = resolution_width(resolution)
+    if width:
+        params.extend(['-vf', f'scale={width}:-2'])
+
+    # Add encoder-specific parameters
+    if encoder:
+        params.extend(encoder_parameters(encoder, preset_options, crf, encode_preset))
+
+    # Apple players only recognise HEVC in MP4 and MOV with the hvc1 tag
+    if preset_options.get('codec') == 'hevc' and format_name in ['MP4', 'MOV']:
+        params.extend(['-tag:v', 'hvc1'])
+
+    # Always copy audio codec
+    params.extend(['-c:a', 'copy'])
+
+    return params
+
+
+# ffprobe's profile names for the prores_ks profile numbers
+PRORES_PROFILES = {
+    0: 'Proxy',
+    1: 'LT',
+    2: 'Standard',
+    3: 'HQ'
+}
+
+# Codecs each container can hold as-is, used to decide whether a remux is possible
+CONTAINER_CODECS = {
+    'MP4': {
+        'video': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+        'audio': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac', 'flac'}
+    },
+    'MOV': {
+        'video': {'h264', 'hevc', 'prores', 'mpeg4', 'mjpeg'},
+        'audio': {'aac', 'mp3', 'alac', 'ac3', 'pcm_s16le', 'pcm_s24le'}
+    },
+    'MKV': {
+        'video': {'h264', 'hevc', 'av1', 'vp8', 'vp9', 'prores', 'mpeg4', 'mpeg2video', 'mjpeg'},
+        'audio': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'vorbis', 'flac', 'alac', 'dts',
+                  'truehd', 'pcm_s16le', 'pcm_s24le'}
+    },
+    'AVI': {
+        'video': {'h264', 'mpeg4', 'mjpeg'},
+        'audio': {'mp3', 'ac3', 'aac', 'pcm_s16le'}
+    },
+    'WEBM': {
+        'video': {'vp8', 'vp9', 'av1'},
+        'audio': {'opus', 'vorbis'}
+    }
+}
+
+
+def can_stream_copy(media_info, format_name, preset_name, resolution='Original',
+                    crf=None, encode_preset=None):
+    """Return True if the source can be remuxed into the format without re-encoding.
+
+    The source video must already use the preset's codec family (and ProRes
+    profile), no resolution change or quality override may be requested,
+    and every stream must be allowed in the target container.
+    """
+    preset_options = get_preset_options(format_name, preset_name)
+    if media_info is None or media_info.video is None:
+        return False
+    if resolution_width(resolution):
+        return False
+
+    # A CRF or speed different from the preset's means the user wants a re-encode
+    if crf is not None and str(crf) != str(preset_options.get('crf', crf)):
+        return False
+    if encode_preset and encode_preset != preset_options.get('preset', encode_preset):
+        return False
+
+    if media_info.video_codec != preset_options.get('codec'):
+        return False
+    if 'profile' in preset_options:
+        if media_info.video.get('profile') != PRORES_PROFILES.get(preset_options['profile']):
+            return False
+
+    allowed = CONTAINER_CODECS[format_name]
+    if any(stream.get('codec_name') not in allowed['video']
+           for stream in media_info.video_streams):
+        return False
+    return all(codec in allowed['audio'] for codec in media_info.audio_codecs)
+
+
+def build_remux_parameters():
+    """Build the FFMPEG output arguments for copying streams into a new container."""
+    return ['-c:v', 'copy', '-c:a', 'copy']
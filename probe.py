@@ -0,0 +1,235 @@
+"""Media probing with ffprobe and a persistent metadata cache.
+
+One ffprobe run returns the container and stream details as JSON. Results
+are cached on disk keyed by (path, size, mtime), so re-opening or
+re-queuing an unchanged file does not start any process.
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+
+from cache import KeyValueCache, cache_dir, file_key
+
+# Fields kept from ffprobe's output; everything else is dropped before caching
+FORMAT_FIELDS = ('format_name', 'duration', 'bit_rate', 'size', 'start_time')
+STREAM_FIELDS = ('index', 'codec_type', 'codec_name', 'profile', 'width', 'height',
+                 'pix_fmt', 'r_frame_rate', 'avg_frame_rate', 'bit_rate', 'duration',
+                 'channels', 'sample_rate')
+
+# Seconds searched before a time for the keyframe preceding it
+KEYFRAME_SEARCH_WINDOW = 20
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ProbeError(Exception):
+    """Raised when a file cannot be read as media."""
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_frame_rate(value):
+    """Parse an ffprobe rate such as '30000/1001' into frames per second."""
+    if not value:
+        return None
+    numerator, _, denominator = str(value).partition('/')
+    numerator = _to_float(numerator)
+    denominator = _to_float(denominator) if denominator else 1.0
+    if not numerator or not denominator:
+        return None
+    return numerator / denominator
+
+
+class MediaInfo:
+    """Container and stream details for one media file."""
+
+    def __init__(self, data):
+        self.data = data
+        self.format = data.get('format', {})
+        self.streams = data.get('streams', [])
+
+    @property
+    def duration(self):
+        """Duration in seconds, or None if the container doesn't report one."""
+        duration = _to_float(self.format.get('duration'))
+        if duration is None and self.video:
+            duration = _to_float(self.video.get('duration'))
+        return duration
+
+    @property
+    def bit_rate(self):
+        return _to_float(self.format.get('bit_rate'))
+
+    @property
+    def format_name(self):
+        return self.format.get('format_name')
+
+    @property
+    def video_streams(self):
+        return [stream for stream in self.streams if stream.get('codec_type') == 'video']
+
+    @property
+    def audio_streams(self):
+        return [stream for stream in self.streams if stream.get('codec_type') == 'audio']
+
+    @property
+    def video(self):
+        """The first video stream, or None for audio-only files."""
+        streams = self.video_streams
+        return streams[0] if streams else None
+
+    @property
+    def video_codec(self):
+        return self.video.get('codec_name') if self.video else None
+
+    @property
+    def audio_codecs(self):
+        return [stream.get('codec_name') for stream in self.audio_streams]
+
+    @property
+    def width(self):
+        return self.video.get('width') if self.video else None
+
+    @property
+    def height(self):
+        return self.video.get('height') if self.video else None
+
+    @property
+    def start_time(self):
+        """Timestamp of the first frame in seconds; 0 for most files, not for MPEG-TS."""
+        return _to_float(self.format.get('start_time')) or 0.0
+
+    @property
+    def frame_rate(self):
+        if not self.video:
+            return None
+        return (parse_frame_rate(self.video.get('avg_frame_rate'))
+                or parse_frame_rate(self.video.get('r_frame_rate')))
+
+    def to_dict(self):
+        return self.data
+
+
+def run_ffprobe(path):
+    """Probe a file with ffprobe and return the trimmed JSON result."""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, errors='replace')
+    if result.returncode != 0:
+        message = result.stderr.strip().splitlines()
+        raise ProbeError(message[-1] if message else f'ffprobe exited with code {result.returncode}')
+    output = json.loads(result.stdout or '{}')
+    return {
+        'format': {key: value for key, value in output.get('format', {}).items()
+                   if key in FORMAT_FIELDS},
+        'streams': [{key: value for key, value in stream.items() if key in STREAM_FIELDS}
+                    for stream in output.get('streams', [])]
+    }
+
+
+def run_ffmpeg_probe(path):
+    """Read the duration from `ffmpeg -i` output, for installs without ffprobe."""
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, errors='replace')
+    if 'Input #0' not in result.stderr:
+        message = result.stderr.strip().splitlines()
+        raise ProbeError(message[-1] if message else 'Could not read video')
+    data = {'format': {}, 'streams': []}
+    duration_match = re.search(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)', result.stderr)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        data['format']['duration'] = str(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    return data
+
+
+def keyframe_before(path, seconds, start_time=0.0, window=KEYFRAME_SEARCH_WINDOW):
+    """Return the time of the last video keyframe at or before seconds, or None.
+
+    Times count from the file's start_time, as FFMPEG's -ss does. None
+    means no keyframe within window seconds before, or no ffprobe.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-read_intervals', f'{start_time + max(seconds - window, 0):.3f}%'
+                           f'{start_time + seconds + 1:.3f}',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, errors='replace')
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        time = _to_float(pts_time)
+        if time is not None and flags.startswith('K'):
+            keyframes.append(time - start_time)
+    # Allow for timestamps rounded to the millisecond
+    earlier = [time for time in keyframes if time <= seconds + 0.001]
+    return max(earlier) if earlier else None
+
+
+def get_cache():
+    """Return the shared on-disk metadata cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KeyValueCache(os.path.join(cache_dir(), 'metadata.sqlite3'))
+        return _cache
+
+
+def probe(path, use_cache=True):
+    """Return MediaInfo for a file, from the cache when it hasn't changed.
+
+    Raises ProbeError if the file is missing or isn't readable media.
+    """
+    try:
+        key = file_key(path)
+    except OSError as e:
+        raise ProbeError(str(e))
+
+    if use_cache:
+        data = get_cache().get(key)
+        if data is not None:
+            return MediaInfo(data)
+
+    try:
+        data = run_ffprobe(path)
+    except FileNotFoundError:
+        # The fallback only knows the duration, so don't let it fill the cache
+        return MediaInfo(run_ffmpeg_probe(path))
+
+    if use_cache:
+        get_cache().set(key, data)
+    return MediaInfo(data)
+
+
+def get_video_duration(filename):
+    """Get video duration in seconds, or 0 if it can't be determined."""
+    try:
+        return probe(filename).duration or 0
+    except ProbeError:
+        return 0
@@ -0,0 +1,408 @@
+"""Running FFMPEG processes and following their progress."""
+import collections
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from progress import ProgressParser
+
+# Scheduling priorities for FFMPEG processes, as POSIX nice values
+PRIORITIES = {
+    'normal': 0,
+    'low': 10,
+    'idle': 19
+}
+WINDOWS_PRIORITY_CLASSES = {
+    'low': 'BELOW_NORMAL_PRIORITY_CLASS',
+    'idle': 'IDLE_PRIORITY_CLASS'
+}
+
+# Lines of FFMPEG's stderr kept per job, for error messages and metrics
+STDERR_TAIL_LINES = 40
+
+# Closing lines FFMPEG adds after the message that explains a failure
+GENERIC_ERROR_LINES = ('Conversion failed!',)
+# Lines FFMPEG writes as a consequence of an earlier error, rather than its cause
+FOLLOW_ON_ERRORS = ('Error sending frames to consumers', 'Task finished with error code',
+                    'Terminating thread with return code', 'Nothing was written into output file')
+# Stats lines, which end the stderr of a run without -nostats
+STATS_LINE = re.compile(r'^(frame|size)=')
+# Words that mark a line as an error message rather than information
+ERROR_WORDS = re.compile(r'error|invalid|could not|cannot|can\'t|unable|failed|supported|unknown|'
+                         r'no such|not found|denied|incorrect|does not', re.IGNORECASE)
+
+# Seconds a stopped FFMPEG process gets to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 5
+# Seconds between the supervisor's timeout checks
+WATCHDOG_INTERVAL = 1.0
+# Exit code reported for a process the supervisor refused to start
+STOPPED_RETURN_CODE = -signal.SIGTERM
+
+CAN_PAUSE = hasattr(signal, 'SIGSTOP')
+SIGKILL = getattr(signal, 'SIGKILL', signal.SIGTERM)
+
+
+def send_signal(process, signum):
+    """Signal a process without Popen's implicit poll, which could reap it early."""
+    if sys.platform == 'win32':
+        process.terminate()
+    else:
+        os.kill(process.pid, signum)
+
+
+class ProcessStats:
+    """CPU time, peak memory and stderr tail of a job's FFMPEG processes.
+
+    One object can collect from several concurrent processes, such as the
+    segment encodes of one job.
+    """
+
+    def __init__(self, tail_lines=STDERR_TAIL_LINES):
+        self.processes = 0
+        self.cpu_seconds = 0.0
+        # Peak resident memory of the largest single process, in bytes
+        self.max_rss = 0
+        self.stderr_tail = collections.deque(maxlen=tail_lines)
+        self._lock = threading.Lock()
+
+    def add_line(self, line):
+        with self._lock:
+            self.stderr_tail.append(line)
+
+    def add_usage(self, usage):
+        """Add a finished process's resource.struct_rusage, or None if unavailable."""
+        with self._lock:
+            self.processes += 1
+            if usage is None:
+                return
+            self.cpu_seconds += usage.ru_utime + usage.ru_stime
+            # Linux reports ru_maxrss in KiB, macOS in bytes
+            scale = 1 if sys.platform == 'darwin' else 1024
+            self.max_rss = max(self.max_rss, usage.ru_maxrss * scale)
+
+    def last_error(self):
+        """Return the stderr line that explains a failure, or None.
+
+        FFMPEG states the cause first and then the errors it led to, so
+        this is the first line that reads as an error once stats lines,
+        generic closers and follow-on errors are left out; failing that,
+        the last remaining line.
+        """
+        with self._lock:
+            lines = list(self.stderr_tail)
+        candidates = [line for line in lines
+                      if line and line not in GENERIC_ERROR_LINES and not STATS_LINE.match(line)
+                      and not any(follow_on in line for follow_on in FOLLOW_ON_ERRORS)]
+        for line in candidates:
+            if ERROR_WORDS.search(line):
+                return line
+        return candidates[-1] if candidates else None
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'cpu_seconds': round(self.cpu_seconds, 3),
+                'max_rss_bytes': self.max_rss,
+                'stderr_tail': list(self.stderr_tail)
+            }
+
+
+def with_progress_output(command):
+    """Ask FFMPEG for key=value progress on stdout instead of stats on stderr.
+
+    The banner is left out so stderr holds only warnings and errors.
+    """
+    return [command[0], '-hide_banner', '-nostats', '-progress', 'pipe:1', *command[1:]]
+
+
+def with_priority(command, priority):
+    """Return (command, Popen keyword arguments) starting a process at a priority.
+
+    On POSIX the command is run under nice(1), so every thread FFMPEG
+    starts inherits the priority (and Linux derives the process's I/O
+    priority from it); on Windows the process gets a lower priority class.
+    """
+    if not priority or priority == 'normal':
+        return command, {}
+    if sys.platform == 'win32':
+        return command, {'creationflags': getattr(subprocess, WINDOWS_PRIORITY_CLASSES[priority])}
+    nice = shutil.which('nice')
+    if not nice:
+        return command, {}
+    return [nice, '-n', str(PRIORITIES[priority]), *command], {}
+
+
+def wait_until_exited(process):
+    """Block until a process exits without reaping it, so its pid can't be reused yet."""
+    if hasattr(os, 'waitid'):
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+
+
+def wait_for(process):
+    """Wait for a process to exit; return (exit code, resource.struct_rusage or None).
+
+    os.wait4 reports the usage of this one child, even with other
+    processes running concurrently; it isn't available on Windows.
+    """
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, usage
+
+
+class ProcessHandle:
+    """A supervised process, its owner and its timeout bookkeeping."""
+
+    def __init__(self, process, owner, timeout=None, stall_timeout=None):
+        self.process = process
+        self.owner = owner
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        now = time.monotonic()
+        self.started = now
+        self.last_activity = now
+        self.paused_at = None
+        # Set once the process has exited, before it is reaped and its pid can be reused
+        self.finished = False
+        self.kill_timer = None
+
+
+class Supervisor:
+    """Track running FFMPEG processes by owner to cancel, pause, resume or time them out.
+
+    An owner (for the engine, a ConversionJob) may run several processes
+    at once. Once an owner is stopped, with a reason such as 'cancelled',
+    its processes are terminated and run_ffmpeg refuses to start more
+    until forget(owner) is called. timeout limits a process's running time,
+    not counting pauses; stall_timeout limits the time without progress
+    output.
+    """
+
+    def __init__(self, timeout=None, stall_timeout=None):
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self._handles = {}
+        self._paused = set()
+        self._reasons = {}
+        self._lock = threading.Lock()
+        self._watchdog = None
+
+    def start(self, owner, process):
+        """Register a process started for owner and return its ProcessHandle."""
+        handle = ProcessHandle(process, owner, self.timeout, self.stall_timeout)
+        with self._lock:
+            self._handles.setdefault(owner, set()).add(handle)
+            paused = owner in self._paused
+            stopped = owner in self._reasons
+            if (self.timeout or self.stall_timeout) and self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, daemon=True)
+                self._watchdog.start()
+        if stopped:
+            self._terminate(handle)
+        elif paused:
+            self._signal(handle, signal.SIGSTOP)
+            handle.paused_at = time.monotonic()
+        return handle
+
+    def finish(self, handle):
+        """Unregister a process that has exited; call before reaping it."""
+        with self._lock:
+            handle.finished = True
+            if handle.kill_timer is not None:
+                handle.kill_timer.cancel()
+            handles = self._handles.get(handle.owner)
+            if handles is not None:
+                handles.discard(handle)
+                if not handles:
+                    del self._handles[handle.owner]
+
+    def stop_reason(self, owner):
+        """Why owner's processes were stopped, or None if they weren't."""
+        with self._lock:
+            return self._reasons.get(owner)
+
+    def stop(self, owner, reason='cancelled'):
+        """Terminate owner's processes and refuse to start more; the first reason is kept."""
+        with self._lock:
+            self._reasons.setdefault(owner, reason)
+            self._paused.discard(owner)
+            handles = list(self._handles.get(owner, ()))
+        for handle in handles:
+            self._terminate(handle)
+
+    def pause(self, owner):
+        """Suspend owner's processes with SIGSTOP; returns False where unsupported."""
+        if not CAN_PAUSE:
+            return False
+        with self._lock:
+            if owner in self._reasons:
+                return False
+            self._paused.add(owner)
+            handles = list(self._handles.get(owner, ()))
+        now = time.monotonic()
+        for handle in handles:
+            if handle.paused_at is None:
+                self._signal(handle, signal.SIGSTOP)
+                handle.paused_at = now
+        return True
+
+    def resume(self, owner):
+        """Continue owner's paused processes with SIGCONT."""
+        if not CAN_PAUSE:
+            return False
+        with self._lock:
+            self._paused.discard(owner)
+            handles = list(self._handles.get(owner, ()))
+        now = time.monotonic()
+        for handle in handles:
+            if handle.paused_at is not None:
+                # Time spent paused doesn't count towards the timeouts
+                handle.started += now - handle.paused_at
+                handle.last_activity = now
+                handle.paused_at = None
+                self._signal(handle, signal.SIGCONT)
+        return True
+
+    def is_paused(self, owner):
+        with self._lock:
+            return owner in self._paused
+
+    def forget(self, owner):
+        """Drop owner's stop and pause state once it won't start more processes."""
+        with self._lock:
+            self._reasons.pop(owner, None)
+            self._paused.discard(owner)
+
+    def shutdown(self, reason='shutdown'):
+        """Stop every owner's processes, e.g. before the application exits."""
+        with self._lock:
+            owners = list(self._handles)
+        for owner in owners:
+            self.stop(owner, reason)
+
+    def running(self):
+        """Return the number of live supervised processes."""
+        with self._lock:
+            return sum(len(handles) for handles in self._handles.values())
+
+    def _signal(self, handle, signum):
+        with self._lock:
+            if handle.finished:
+                return
+            try:
+                send_signal(handle.process, signum)
+            except OSError:
+                pass
+
+    def _terminate(self, handle):
+        """SIGTERM lets FFMPEG exit cleanly; kill it if it hasn't after a grace period."""
+        with self._lock:
+            if handle.finished:
+                return
+            try:
+                send_signal(handle.process, signal.SIGTERM)
+                if CAN_PAUSE:
+                    # A stopped process only acts on SIGTERM once continued
+                    os.kill(handle.process.pid, signal.SIGCONT)
+            except OSError:
+                return
+            if handle.kill_timer is None:
+                handle.kill_timer = threading.Timer(TERMINATE_GRACE, self._kill, (handle,))
+                handle.kill_timer.daemon = True
+                handle.kill_timer.start()
+
+    def _kill(self, handle):
+        with self._lock:
+            if not handle.finished:
+                try:
+                    send_signal(handle.process, SIGKILL)
+                except OSError:
+                    pass
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                handles = [handle for handles in self._handles.values() for handle in handles]
+            for handle in handles:
+                if handle.paused_at is not None:
+                    continue
+                if handle.timeout and now - handle.started > handle.timeout:
+                    self.stop(handle.owner, f'timed out after {handle.timeout:g}s')
+                elif handle.stall_timeout and now - handle.last_activity > handle.stall_timeout:
+                    self.stop(handle.owner, f'no progress for {handle.stall_timeout:g}s')
+
+
+def run_ffmpeg(command, on_progress=None, priority=None, stats=None, supervisor=None,
+               owner=None):
+    """Run an FFMPEG command to completion and return its exit code.
+
+    on_progress is called with a ProgressEvent for each progress block.
+    priority is one of PRIORITIES; None runs at normal priority. stats, a
+    ProcessStats, collects the process's resource usage and stderr tail.
+    With a Supervisor, the process is registered under owner so it can be
+    cancelled, paused or timed out; nothing is started once owner was
+    stopped, and STOPPED_RETURN_CODE is returned.
+    """
+    if supervisor is not None and supervisor.stop_reason(owner):
+        return STOPPED_RETURN_CODE
+    command, options = with_priority(with_progress_output(command), priority)
+    process = subprocess.Popen(
+        command,
+        # FFMPEG reads keyboard commands from stdin; it must never wait on the terminal
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **options
+    )
+    handle = supervisor.start(owner, process) if supervisor is not None else None
+
+    # Drain stderr on its own thread so a chatty process can never block on it
+    def drain_stderr():
+        for line in process.stderr:
+            if stats is not None:
+                stats.add_line(line.decode('utf-8', 'replace').rstrip())
+
+    drain = threading.Thread(target=drain_stderr, daemon=True)
+    drain.start()
+
+    parser = ProgressParser()
+    try:
+        while True:
+            data = process.stdout.read1(65536)
+            if not data:
+                break
+            if handle is not None:
+                handle.last_activity = time.monotonic()
+            for event in parser.feed(data):
+                if on_progress:
+                    on_progress(event)
+
+    except BaseException:
+        # Don't leave FFMPEG running when following it fails or is interrupted
+        send_signal(process, SIGKILL)
+        raise
+
+    finally:
+        if handle is not None:
+            wait_until_exited(process)
+            supervisor.finish(handle)
+        return_code, usage = wait_for(process)
+        drain.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    if stats is not None:
+        stats.add_usage(usage)
+    return return_code
@@ -0,0 +1,123 @@
+"""Parsing and coalescing FFMPEG's machine-readable progress output.
+
+FFMPEG run with `-progress pipe:1` writes blocks of key=value lines to
+stdout, each block ending with `progress=continue` or `progress=end`.
+"""
+import re
+import time
+
+# Minimum seconds between progress events passed on to listeners
+PROGRESS_INTERVAL = 0.25
+
+_LINE_SEPARATOR = re.compile(br'[\r\n]+')
+
+
+def _number(value, cast=float):
+    """Parse a progress value, treating 'N/A' and garbage as zero."""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+class ProgressEvent:
+    """One progress report: media time reached, frame rate, speed and output size."""
+
+    def __init__(self, out_time=0.0, frame=0, fps=0.0, speed=0.0, total_size=0,
+                 bitrate=0.0, finished=False):
+        self.out_time = out_time
+        self.frame = frame
+        self.fps = fps
+        self.speed = speed
+        self.total_size = total_size
+        self.bitrate = bitrate
+        self.finished = finished
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Build an event from one block of -progress key=value fields."""
+        out_time_us = _number(fields.get('out_time_us'), int)
+        bitrate = fields.get('bitrate', '').replace('kbits/s', '')
+        return cls(
+            out_time=max(out_time_us, 0) / 1000000,
+            frame=_number(fields.get('frame'), int),
+            fps=_number(fields.get('fps')),
+            speed=_number(fields.get('speed', '').rstrip('x')),
+            total_size=max(_number(fields.get('total_size'), int), 0),
+            bitrate=_number(bitrate),
+            finished=fields.get('progress') == 'end'
+        )
+
+    @classmethod
+    def combine(cls, events):
+        """Sum the progress of processes working on parts of the same job.
+
+        Rates only count processes that are still running.
+        """
+        events = [event for event in events if event is not None]
+        running = [event for event in events if not event.finished]
+        return cls(
+            out_time=sum(event.out_time for event in events),
+            frame=sum(event.frame for event in events),
+            fps=sum(event.fps for event in running),
+            speed=sum(event.speed for event in running),
+            total_size=sum(event.total_size for event in events),
+            bitrate=sum(event.bitrate for event in running),
+            finished=bool(events) and all(event.finished for event in events)
+        )
+
+    def to_dict(self):
+        return {
+            'out_time': round(self.out_time, 3),
+            'frame': self.frame,
+            'fps': self.fps,
+            'speed': self.speed,
+            'total_size': self.total_size,
+            'bitrate': self.bitrate,
+            'finished': self.finished
+        }
+
+
+class ProgressParser:
+    """Incrementally parse -progress output fed in arbitrary chunks.
+
+    Lines may end in \\n, \\r\\n or a bare \\r.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._fields = {}
+
+    def feed(self, data):
+        """Consume a chunk of output and return the events it completed."""
+        lines = _LINE_SEPARATOR.split(self._buffer + data)
+        # The last piece may be a partial line; keep it for the next chunk
+        self._buffer = lines.pop()
+
+        events = []
+        for line in lines:
+            key, separator, value = line.decode('utf-8', 'replace').partition('=')
+            if not separator:
+                continue
+            key, value = key.strip(), value.strip()
+            self._fields[key] = value
+            if key == 'progress':
+                events.append(ProgressEvent.from_fields(self._fields))
+                self._fields = {}
+        return events
+
+
+class ProgressThrottle:
+    """Let through at most one event per interval, plus the final event."""
+
+    def __init__(self, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._last = None
+
+    def ready(self, event):
+        now = self.clock()
+        if event.finished or self._last is None or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
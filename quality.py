@@ -0,0 +1,281 @@
+"""Target-quality encoding: pick the CRF from measured quality.
+
+Short sample windows of the source are encoded at several CRF values and
+scored against the source with FFMPEG's libvmaf, ssim or psnr filter. The
+highest CRF (smallest output) whose worst window still meets the target
+is used for the full encode. Each round encodes its CRF candidates and
+windows in parallel and narrows the range around the target, and the
+decision is cached per source file and settings so re-runs skip it.
+"""
+import concurrent.futures
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from cache import KeyValueCache, cache_dir, file_key
+from encoders import resolve_encoder
+from presets import build_conversion_parameters, get_preset_options, resolution_width
+from process import ProcessStats, run_ffmpeg
+from scheduler import thread_parameters
+from segmented import strip_audio_parameters
+
+# Default target for each metric, roughly "visually transparent" for most content
+DEFAULT_TARGETS = {
+    'vmaf': 93.0,
+    'ssim': 0.98,
+    'psnr': 42.0
+}
+
+# CRF range searched for each codec family; higher is smaller and worse
+CRF_RANGES = {
+    'h264': (16, 38),
+    'hevc': (18, 40),
+    'vp9': (20, 50),
+    'av1': (20, 55)
+}
+
+# Sample windows scored per CRF, and their length in seconds
+SAMPLE_WINDOWS = 3
+SAMPLE_SECONDS = 4
+# Sources shorter than this are scored on a single window
+MIN_MULTI_WINDOW_DURATION = 60
+
+# CRF values tried per search round
+ROUND_CANDIDATES = 3
+
+# Lines FFMPEG's metric filters log when they finish
+SCORE_PATTERNS = {
+    'vmaf': re.compile(r'VMAF score[:=]\s*([\d.]+)'),
+    'ssim': re.compile(r'SSIM .*All:([\d.]+)'),
+    'psnr': re.compile(r'PSNR .*average:([\d.]+|inf)')
+}
+
+_vmaf_available = None
+_vmaf_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class QualitySearchError(Exception):
+    """Raised when the sample windows can't be encoded or scored."""
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KeyValueCache(os.path.join(cache_dir(), 'quality.sqlite3'))
+        return _cache
+
+
+def vmaf_available():
+    """Return True if the installed FFMPEG has the libvmaf filter."""
+    global _vmaf_available
+    with _vmaf_lock:
+        if _vmaf_available is None:
+            try:
+                result = subprocess.run(['ffmpeg', '-hide_banner', '-filters'],
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        universal_newlines=True)
+                _vmaf_available = any(line.split()[1:2] == ['libvmaf']
+                                      for line in result.stdout.splitlines())
+            except OSError:
+                _vmaf_available = False
+        return _vmaf_available
+
+
+def parse_target(text):
+    """Parse 'METRIC', 'METRIC=VALUE' or 'auto' into a (metric, value) target.
+
+    A missing value means the metric's default target; auto is resolved
+    when the search runs. Raises ValueError.
+    """
+    metric, _, value = text.strip().lower().partition('=')
+    if metric not in DEFAULT_TARGETS and metric != 'auto':
+        raise ValueError(f"unknown quality metric '{metric}' "
+                         f"(choose from: auto, {', '.join(DEFAULT_TARGETS)})")
+    if metric == 'auto' and value:
+        raise ValueError("'auto' takes no value; name the metric to set a target")
+    return metric, float(value) if value else None
+
+
+def resolve_target(target):
+    """Fill in an 'auto' metric and default value: VMAF when libvmaf is available, else SSIM."""
+    metric, value = target
+    if metric == 'auto':
+        metric = 'vmaf' if vmaf_available() else 'ssim'
+    return metric, DEFAULT_TARGETS[metric] if value is None else value
+
+
+def supports_target_quality(format_name, preset_name):
+    """Return True if the preset is CRF-controlled by an encoder the search covers."""
+    options = get_preset_options(format_name, preset_name)
+    return 'crf' in options and options.get('codec') in CRF_RANGES
+
+
+def sample_windows(duration):
+    """Return (start, length) sample windows spread through the source."""
+    if not duration or duration <= SAMPLE_SECONDS:
+        return [(0, duration or SAMPLE_SECONDS)]
+    if duration < MIN_MULTI_WINDOW_DURATION:
+        return [((duration - SAMPLE_SECONDS) / 2, SAMPLE_SECONDS)]
+    return [(duration * (index + 1) / (SAMPLE_WINDOWS + 1) - SAMPLE_SECONDS / 2, SAMPLE_SECONDS)
+            for index in range(SAMPLE_WINDOWS)]
+
+
+def round_candidates(low, high, count=ROUND_CANDIDATES):
+    """Spread up to count CRF values evenly inside [low, high]."""
+    if high - low + 1 <= count:
+        return list(range(low, high + 1))
+    step = (high - low) / (count + 1)
+    return sorted({low + round(step * (index + 1)) for index in range(count)})
+
+
+def metric_filter(metric, media_info, resolution):
+    """Build the filter graph comparing input 0 (sample) with input 1 (source)."""
+    scale = ''
+    if resolution_width(resolution) and media_info and media_info.width and media_info.height:
+        # Score at the source resolution, as a viewer would see the scaled output
+        scale = f'scale={media_info.width}:{media_info.height}:flags=bicubic,'
+    name = 'libvmaf' if metric == 'vmaf' else metric
+    return (f'[0:v]{scale}format=yuv420p,setpts=PTS-STARTPTS[sample];'
+            f'[1:v]format=yuv420p,setpts=PTS-STARTPTS[source];'
+            f'[sample][source]{name}')
+
+
+def encode_sample(source, start, length, params, output, supervisor=None, owner=None,
+                  priority=None):
+    """Encode one sample window; with a Supervisor, the process belongs to owner."""
+    command = [
+        'ffmpeg', '-v', 'error',
+        '-ss', f'{start:.3f}', '-t', f'{length:.3f}',
+        '-i', source,
+        '-an', *params,
+        '-y', output
+    ]
+    stats = ProcessStats()
+    return_code = run_ffmpeg(command, priority=priority, stats=stats, supervisor=supervisor,
+                             owner=owner)
+    if return_code != 0:
+        raise QualitySearchError(f'Encoding a sample failed: '
+                                 f'{stats.last_error() or f"exit code {return_code}"}')
+
+
+def score_sample(sample, source, start, length, metric, graph, supervisor=None, owner=None,
+                 priority=None):
+    command = [
+        'ffmpeg',
+        '-i', sample,
+        '-ss', f'{start:.3f}', '-t', f'{length:.3f}',
+        '-i', source,
+        '-lavfi', graph,
+        '-f', 'null', '-'
+    ]
+    stats = ProcessStats()
+    return_code = run_ffmpeg(command, priority=priority, stats=stats, supervisor=supervisor,
+                             owner=owner)
+    # The filters log their score among the last lines
+    match = SCORE_PATTERNS[metric].search('\n'.join(stats.stderr_tail))
+    if return_code != 0 or not match:
+        raise QualitySearchError(f'Scoring a sample with {metric} failed')
+    # Identical frames give an infinite PSNR
+    return float('inf') if match.group(1) == 'inf' else float(match.group(1))
+
+
+def search_key(job, encoder, metric, target):
+    return '|'.join(str(part) for part in (
+        file_key(job.source), job.format_name, job.preset_name, job.resolution,
+        job.encode_preset, encoder, metric, target, SAMPLE_WINDOWS, SAMPLE_SECONDS,
+        job.start, job.end))
+
+
+def search_crf(job, target, parallelism=1, use_cache=True, supervisor=None):
+    """Find the highest CRF whose samples meet target, a (metric, value) pair.
+
+    Returns a dict with the chosen 'crf', its worst window 'score', whether
+    the target was 'met', every CRF's 'scores', the search 'seconds' and
+    whether the result came from the cache ('cached').
+    If even the lowest CRF misses the target, the lowest CRF is chosen.
+    With a Supervisor, the sample processes are registered under the job,
+    so cancelling, pausing or timing it out reaches them too.
+    Raises QualitySearchError, also when the job is stopped.
+    """
+    metric, value = resolve_target(target)
+    options = get_preset_options(job.format_name, job.preset_name)
+    encoder = resolve_encoder(options.get('codec'))
+    key = search_key(job, encoder, metric, value)
+    if use_cache:
+        cached = get_cache().get(key)
+        if cached is not None:
+            cached['cached'] = True
+            return cached
+
+    started = time.time()
+    # Windows are spread through the job's range of the source
+    windows = [((job.start or 0) + start, length) for start, length in sample_windows(job.duration)]
+    graph = metric_filter(metric, job.media_info, job.resolution)
+    # Each sample gets the job's share of the cores the engine reserved for the search
+    threads = thread_parameters(encoder, job.thread_usage, job.frame_size()[0])
+    scores = {}
+    workdir = tempfile.mkdtemp(prefix='quality-')
+    try:
+        def check_stopped():
+            reason = supervisor.stop_reason(job) if supervisor is not None else None
+            if reason:
+                raise QualitySearchError(f'Quality search stopped: {reason}')
+
+        def evaluate(crf, index):
+            check_stopped()
+            start, length = windows[index]
+            params = strip_audio_parameters(build_conversion_parameters(
+                job.format_name, job.preset_name, job.resolution, crf, job.encode_preset)) + threads
+            sample = os.path.join(workdir, f'sample_{crf}_{index}.mkv')
+            encode_sample(job.source, start, length, params, sample, supervisor, job, job.priority)
+            try:
+                check_stopped()
+                return score_sample(sample, job.source, start, length, metric, graph,
+                                    supervisor, job, job.priority)
+            finally:
+                os.remove(sample)
+
+        low, high = CRF_RANGES[options['codec']]
+        best = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(parallelism, 1)) as executor:
+            while low <= high:
+                check_stopped()
+                candidates = [crf for crf in round_candidates(low, high) if crf not in scores]
+                tasks = {(crf, index): executor.submit(evaluate, crf, index)
+                         for crf in candidates for index in range(len(windows))}
+                for crf in candidates:
+                    # A CRF must hold up on its hardest window
+                    scores[crf] = min(tasks[crf, index].result() for index in range(len(windows)))
+
+                passing = [crf for crf in candidates if scores[crf] >= value]
+                if passing:
+                    best = max(passing)
+                    low = best + 1
+                failing = [crf for crf in candidates if scores[crf] < value and crf >= low]
+                if failing:
+                    high = min(failing) - 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    met = best is not None
+    crf = best if met else min(scores)
+    result = {
+        'crf': crf,
+        'metric': metric,
+        'target': value,
+        'score': scores[crf],
+        'met': met,
+        'scores': {str(crf): score for crf, score in sorted(scores.items())},
+        'seconds': round(time.time() - started, 3),
+        'cached': False
+    }
+    if use_cache:
+        get_cache().set(key, result)
+    return result
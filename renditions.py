@@ -0,0 +1,108 @@
+"""Several outputs from one decode of the source.
+
+A job with extra renditions runs a single FFMPEG process: the decoded
+video is scaled once per distinct resolution, split to every output at
+that resolution, and each output is encoded with its own format and
+quality preset. The source is read and decoded once however many
+outputs are made, which matters most for ProRes and 4K sources.
+"""
+import collections
+
+from encoders import resolve_encoder
+from presets import build_conversion_parameters, get_preset_options, resolution_width
+from scheduler import thread_parameters
+
+
+class Rendition:
+    """One output of a multi-output job: a format, quality preset and resolution."""
+
+    def __init__(self, format_name, preset_name, resolution='Original', output_file=None,
+                 crf=None, encode_preset=None):
+        # Validates the format and preset
+        get_preset_options(format_name, preset_name)
+        self.format_name = format_name
+        self.preset_name = preset_name
+        self.resolution = resolution
+        self.output_file = output_file
+        self.crf = crf
+        self.encode_preset = encode_preset
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(**settings)
+
+    def settings(self):
+        return {
+            'format_name': self.format_name,
+            'preset_name': self.preset_name,
+            'resolution': self.resolution,
+            'output_file': self.output_file,
+            'crf': self.crf,
+            'encode_preset': self.encode_preset
+        }
+
+    @property
+    def encoder(self):
+        return resolve_encoder(get_preset_options(self.format_name, self.preset_name).get('codec'))
+
+    def encoder_parameters(self, threads=None, width=None):
+        """Output arguments without scaling, which happens in the shared filter graph.
+
+        threads limits the encoder's threads for frames width pixels wide.
+        """
+        params = build_conversion_parameters(self.format_name, self.preset_name, 'Original',
+                                             self.crf, self.encode_preset)
+        if threads:
+            params.extend(thread_parameters(self.encoder, threads, width))
+        return params
+
+
+def resolution_label(resolution):
+    """Short name for a resolution preset in file names, e.g. '720p' or 'original'."""
+    if not resolution_width(resolution):
+        return 'original'
+    return resolution.split('x')[-1].rstrip(')') + 'p'
+
+
+def build_filter_graph(resolutions):
+    """Build a filter graph feeding output i's video to the label [vi].
+
+    Each distinct resolution is scaled once and split to its outputs.
+    """
+    groups = collections.OrderedDict()
+    for index, resolution in enumerate(resolutions):
+        groups.setdefault(resolution_width(resolution), []).append(index)
+
+    parts = []
+    if len(groups) > 1:
+        parts.append(f'[0:v]split={len(groups)}' + ''.join(f'[g{i}]' for i in range(len(groups))))
+    for group, (width, indexes) in enumerate(groups.items()):
+        source = f'[g{group}]' if len(groups) > 1 else '[0:v]'
+        chain = f'scale={width}:-2' if width else 'null'
+        if len(indexes) > 1:
+            chain += f',split={len(indexes)}'
+        parts.append(source + chain + ''.join(f'[v{index}]' for index in indexes))
+    return ';'.join(parts)
+
+
+def build_multi_output_command(source, outputs, threads=None, input_params=()):
+    """Build one FFMPEG command writing every (rendition, path) in outputs.
+
+    threads optionally gives each output's (thread count, frame width), and
+    input_params are placed before -i, e.g. to select a range.
+    """
+    threads = threads or [(None, None)] * len(outputs)
+    command = [
+        'ffmpeg',
+        *input_params,
+        '-i', source,
+        '-filter_complex', build_filter_graph([rendition.resolution for rendition, _ in outputs])
+    ]
+    for index, ((rendition, path), (count, width)) in enumerate(zip(outputs, threads)):
+        command.extend([
+            '-map', f'[v{index}]',
+            '-map', '0:a?',
+            *rendition.encoder_parameters(count, width),
+            '-y', path
+        ])
+    return command
@@ -0,0 +1,167 @@
+"""Resource budgets for concurrent FFMPEG processes.
+
+Left to its defaults every encoder starts threads for all cores, so a few
+concurrent encodes oversubscribe the machine, and ProRes outputs can
+saturate the disk. Each job is given a thread count it passes to FFMPEG,
+and an estimate of its memory use and output write rate; a job waits
+until the cores, memory and write bandwidth it needs are free.
+"""
+import math
+import os
+import threading
+
+# Most threads worth giving one process of each encoder; beyond this they scale poorly
+ENCODER_MAX_THREADS = {
+    'libx264': 16,
+    'libopenh264': 4,
+    'libx265': 16,
+    'libvpx-vp9': 8,
+    'libsvtav1': 32,
+    'librav1e': 16,
+    'libaom-av1': 16,
+    'prores_ks': 8,
+    'prores_aw': 4
+}
+DEFAULT_MAX_THREADS = 8
+
+# Rough resident memory of one encoder process, in MiB per megapixel of output frame
+ENCODER_MEMORY_PER_MEGAPIXEL = {
+    'libx264': 130,
+    'libopenh264': 60,
+    'libx265': 250,
+    'libvpx-vp9': 110,
+    'libsvtav1': 400,
+    'librav1e': 250,
+    'libaom-av1': 300,
+    'prores_ks': 40,
+    'prores_aw': 40
+}
+DEFAULT_MEMORY_PER_MEGAPIXEL = 150
+# Decoder, demuxer and FFMPEG's own overhead, in MiB
+BASE_MEMORY = 48
+
+# Output bits per pixel of ProRes profiles (Proxy to HQ); CRF encodes write far less
+PRORES_BITS_PER_PIXEL = {0: 0.75, 1: 1.65, 2: 2.4, 3: 3.55}
+DEFAULT_BITS_PER_PIXEL = 0.15
+
+# Output write bandwidth shared by all running jobs, in MB/s
+DEFAULT_WRITE_RATE = 200
+
+# Share of the memory available at startup that running jobs may use
+MEMORY_FRACTION = 0.8
+
+
+def encoder_max_threads(encoder):
+    return ENCODER_MAX_THREADS.get(encoder, DEFAULT_MAX_THREADS)
+
+
+def available_memory():
+    """Return the memory available to new processes in MiB, or None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 1048576
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_memory_limit():
+    memory = available_memory()
+    return int(memory * MEMORY_FRACTION) if memory else None
+
+
+def estimate_memory(encoder, width, height):
+    """Estimate an encoder process's peak memory in MiB for a frame size."""
+    per_megapixel = ENCODER_MEMORY_PER_MEGAPIXEL.get(encoder, DEFAULT_MEMORY_PER_MEGAPIXEL)
+    return int(BASE_MEMORY + per_megapixel * width * height / 1e6)
+
+
+def estimate_write_rate(bits_per_pixel, width, height, frame_rate, speed=1.0):
+    """Estimate output write rate in MB/s for an encode running at speed x realtime."""
+    return bits_per_pixel * width * height * frame_rate * speed / 8e6
+
+
+def bits_per_pixel(options):
+    """Expected output bits per pixel for a preset's options."""
+    if options.get('codec') == 'prores':
+        return PRORES_BITS_PER_PIXEL.get(options.get('profile'), PRORES_BITS_PER_PIXEL[3])
+    return DEFAULT_BITS_PER_PIXEL
+
+
+def thread_parameters(encoder, threads, width=None):
+    """Build the FFMPEG arguments limiting an encoder to a number of threads.
+
+    VP9 only spreads work across tile columns, so it also gets as many
+    columns as the threads can use and the frame width allows (at least
+    256 pixels per column).
+    """
+    params = ['-threads', str(threads)]
+    if encoder == 'libvpx-vp9':
+        columns = int(math.log2(threads)) if threads > 1 else 0
+        if width:
+            columns = min(columns, max(int(math.log2(width / 256)), 0) if width >= 256 else 0)
+        params.extend(['-tile-columns', str(columns)])
+    return params
+
+
+class ResourceBudget:
+    """Share cores, memory and write bandwidth between running processes.
+
+    limits maps a resource name to its total, or None for no limit. A
+    request waits until every resource it needs fits, except that one
+    request may always run so jobs bigger than the machine still make
+    progress.
+    """
+
+    def __init__(self, limits):
+        self.limits = {name: total for name, total in limits.items() if total}
+        self.used = {name: 0 for name in self.limits}
+        self._running = 0
+        self._condition = threading.Condition()
+
+    @property
+    def total(self):
+        """Total cores, for callers that only schedule CPU."""
+        return self.limits.get('cores', 0)
+
+    def _fits(self, request):
+        return all(self.used[name] + amount <= self.limits[name]
+                   for name, amount in request.items())
+
+    def acquire(self, request, stopped=None):
+        """Block until request (resource name -> amount) fits; return what was taken.
+
+        Pass the returned value to release(). stopped, if given, is checked
+        whenever the waiter wakes; once it returns true, acquire gives up
+        and returns None, having taken nothing. Call wake() after stopping.
+        """
+        request = {name: min(amount, self.limits[name])
+                   for name, amount in request.items() if name in self.limits}
+        with self._condition:
+            while self._running and not self._fits(request):
+                if stopped is not None and stopped():
+                    return None
+                self._condition.wait()
+            if stopped is not None and stopped():
+                return None
+            for name, amount in request.items():
+                self.used[name] += amount
+            self._running += 1
+        return request
+
+    def release(self, granted):
+        with self._condition:
+            for name, amount in granted.items():
+                self.used[name] -= amount
+            self._running -= 1
+            self._condition.notify_all()
+
+    def wake(self):
+        """Let waiting requests check whether they were stopped."""
+        with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,247 @@
+"""Segmented parallel encoding.
+
+A single FFMPEG process on a slow x264 or VP9 preset keeps only a few
+cores busy. In segmented mode the source's video is split at keyframes
+with a stream copy, the segments are encoded concurrently with the
+job's preset arguments, and the encoded segments are joined losslessly
+with the concat demuxer while the audio is copied from the source.
+
+The work directory is named after the job's journal key and kept until
+the job succeeds, so a job restarted after a crash reuses the split and
+every segment that finished encoding.
+"""
+import concurrent.futures
+import csv
+import os
+import shutil
+import threading
+
+from presets import get_preset_options
+from process import STOPPED_RETURN_CODE, run_ffmpeg
+from progress import ProgressEvent
+
+# Encoder presets slow enough that one process leaves most cores idle
+SLOW_X264_PRESETS = ('slow', 'slower', 'veryslow')
+SLOW_VP9_SPEEDS = (0, 1)
+
+# Sources shorter than this aren't worth splitting
+MIN_SEGMENTED_DURATION = 120
+
+# Bounds on segment length, in seconds
+MIN_SEGMENT_TIME = 10
+MAX_SEGMENT_TIME = 300
+
+# Container used for segments; Matroska holds every codec the presets produce
+SEGMENT_EXTENSION = '.mkv'
+
+
+def is_slow_encode(job):
+    """Return True if the job's encoder settings leave most cores idle."""
+    options = get_preset_options(job.format_name, job.preset_name)
+    codec = options.get('codec')
+    # libaom stays far below one process per core at every speed setting
+    if job.encoder == 'libaom-av1':
+        return True
+    if codec in ('h264', 'hevc', 'av1'):
+        return (job.encode_preset or options.get('preset')) in SLOW_X264_PRESETS
+    if codec == 'vp9':
+        return options.get('speed') in SLOW_VP9_SPEEDS
+    return False
+
+
+def should_segment(job, cpu_count):
+    """Decide whether an encode job should run in segmented mode.
+
+    job.segmented forces the choice when it is True or False; when it is
+    None the job is segmented only for long, slow encodes on machines with
+    room for at least two concurrent segment encodes.
+    """
+    if job.segmented is not None:
+        return bool(job.segmented)
+    if not job.duration or job.duration < MIN_SEGMENTED_DURATION:
+        return False
+    return is_slow_encode(job) and cpu_count >= 2 * job.thread_usage
+
+
+def segment_time(duration, parallelism):
+    """Pick a segment length giving each worker about two segments."""
+    target = duration / max(parallelism * 2, 1)
+    return max(MIN_SEGMENT_TIME, min(MAX_SEGMENT_TIME, target))
+
+
+def concat_list_entry(path):
+    """Quote a path for an FFMPEG concat demuxer list file."""
+    return "file '{}'\n".format(path.replace("'", "'\\''"))
+
+
+def strip_audio_parameters(params):
+    """Remove audio arguments; segments are encoded video-only."""
+    result = []
+    skip = False
+    for arg in params:
+        if skip:
+            skip = False
+            continue
+        if arg.startswith('-c:a') or arg.startswith('-b:a'):
+            skip = True
+            continue
+        result.append(arg)
+    return result
+
+
+def segment_workdir(job):
+    """Return the job's work directory next to its output, named after its journal key."""
+    return os.path.join(os.path.dirname(os.path.abspath(job.output_file)),
+                        f'.segments-{job.journal_key[:16]}')
+
+
+def read_segment_list(workdir):
+    """Return (segment path, segment duration) pairs from a finished split."""
+    segments = []
+    with open(os.path.join(workdir, 'segments.csv'), newline='') as f:
+        for row in csv.reader(f):
+            name, start, end = row[0], float(row[1]), float(row[2])
+            segments.append((os.path.join(workdir, name), end - start))
+    return segments
+
+
+def split_source(source, workdir, seconds, priority=None, stats=None, supervisor=None,
+                 owner=None):
+    """Split the source's video into keyframe-aligned segments without re-encoding.
+
+    Returns a list of (segment path, segment duration) in playback order.
+    A split already completed in workdir is reused.
+    """
+    marker = os.path.join(workdir, 'split.done')
+    if os.path.exists(marker):
+        return read_segment_list(workdir)
+
+    segment_list = os.path.join(workdir, 'segments.csv')
+    command = [
+        'ffmpeg',
+        '-i', source,
+        '-map', '0:v:0',
+        '-c', 'copy',
+        '-f', 'segment',
+        '-segment_time', f'{seconds:.3f}',
+        '-segment_list', segment_list,
+        '-segment_list_type', 'csv',
+        '-reset_timestamps', '1',
+        '-y',
+        os.path.join(workdir, f'source_%05d{SEGMENT_EXTENSION}')
+    ]
+    return_code = run_ffmpeg(command, priority=priority, stats=stats, supervisor=supervisor,
+                             owner=owner)
+    if return_code != 0:
+        raise RuntimeError(f'Splitting the source failed (ffmpeg exited with code {return_code})')
+
+    segments = read_segment_list(workdir)
+    open(marker, 'w').close()
+    return segments
+
+
+def concat_segments(encoded, source, output_file, workdir, priority=None, stats=None,
+                    supervisor=None, owner=None):
+    """Join encoded segments losslessly and copy the audio from the source."""
+    list_file = os.path.join(workdir, 'encoded.txt')
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for path in encoded:
+            f.write(concat_list_entry(path))
+    command = [
+        'ffmpeg',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', list_file,
+        '-i', source,
+        '-map', '0:v',
+        '-map', '1:a?',
+        '-c', 'copy',
+        '-y',
+        output_file
+    ]
+    return run_ffmpeg(command, priority=priority, stats=stats, supervisor=supervisor,
+                      owner=owner)
+
+
+def encode_segmented(job, budget, cpu_count, on_progress, supervisor=None):
+    """Encode a job in segments on concurrent FFMPEG processes.
+
+    Each segment encode takes its cores, memory and write rate from the
+    shared ResourceBudget and runs on job.threads threads. Every process
+    is registered with supervisor under job, so cancelling the job stops
+    the running segments and starts no more.
+    on_progress is called with a ProgressEvent summed over all segments.
+    The joined result is written to job.partial_file. Returns the exit
+    code of the failing step, or 0.
+    """
+    workdir = segment_workdir(job)
+    os.makedirs(workdir, exist_ok=True)
+    return_code = None
+    try:
+        parallelism = max(1, cpu_count // job.thread_usage)
+        segments = split_source(job.source, workdir, segment_time(job.duration or 0, parallelism),
+                                job.priority, job.process_stats, supervisor, job)
+        params = strip_audio_parameters(job.conversion_parameters())
+
+        lock = threading.Lock()
+        progress = [None] * len(segments)
+        # Exit codes of failed segment encodes; once there is one, the rest are skipped
+        failures = []
+
+        def encode(index):
+            path, duration = segments[index]
+            encoded = os.path.join(workdir, f'encoded_{index:05d}{SEGMENT_EXTENSION}')
+            if os.path.exists(encoded):
+                # Finished before an earlier attempt was interrupted
+                with lock:
+                    progress[index] = ProgressEvent(out_time=duration, finished=True)
+                return encoded, 0
+            partial = os.path.join(workdir, f'encoded_{index:05d}.partial{SEGMENT_EXTENSION}')
+
+            def segment_progress(event):
+                with lock:
+                    progress[index] = event
+                    total = ProgressEvent.combine(progress)
+                # Only the concat step finishes the job
+                total.finished = False
+                on_progress(total)
+
+            if failures:
+                return encoded, failures[0]
+            granted = budget.acquire(job.resources(job.threads),
+                                     lambda: failures or (supervisor is not None
+                                                          and supervisor.stop_reason(job)))
+            if granted is None:
+                return encoded, failures[0] if failures else STOPPED_RETURN_CODE
+            try:
+                return_code = run_ffmpeg(['ffmpeg', '-i', path, '-an', *params, '-y', partial],
+                                         segment_progress, job.priority, job.process_stats,
+                                         supervisor, job)
+                if return_code != 0:
+                    # Recorded before the release wakes segments waiting for resources
+                    with lock:
+                        failures.append(return_code)
+            finally:
+                budget.release(granted)
+            if return_code == 0:
+                os.replace(partial, encoded)
+            return encoded, return_code
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+            results = list(executor.map(encode, range(len(segments))))
+
+        if failures:
+            return_code = failures[0]
+            return return_code
+        for _, return_code in results:
+            if return_code != 0:
+                return return_code
+        return_code = concat_segments([path for path, _ in results], job.source,
+                                      job.partial_file, workdir, job.priority,
+                                      job.process_stats, supervisor, job)
+        return return_code
+
+    finally:
+        # Keep finished segments for a retry unless the job is complete
+        if return_code == 0:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,146 @@
+import http.client
+import json
+
+import pytest
+
+from api import JobServer, RequestError, job_from_request
+
+
+class FakeEngine:
+    """Just enough of BatchEngine for the API, without running FFMPEG."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        return job
+
+    def find_job(self, job_id):
+        return next((job for job in self.jobs if job.id == job_id), None)
+
+    def cancel(self, job):
+        if job.status not in ('queued', 'running'):
+            return False
+        job.status = 'cancelled'
+        return True
+
+    def pause(self, job):
+        return False
+
+    def resume(self, job):
+        return False
+
+    def stats(self):
+        return {'jobs': len(self.jobs)}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'not really a video')
+    return str(path)
+
+
+@pytest.fixture
+def server():
+    server = JobServer(FakeEngine(), port=0).start()
+    yield server
+    server.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    port = server.server.server_address[1]
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+    data = None if body is None else (body if isinstance(body, str) else json.dumps(body))
+    connection.request(method, path, body=data, headers=headers)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_job_from_request_applies_fields(source):
+    job = job_from_request({'source': source, 'format': 'mkv', 'preset': 'Small Size',
+                            'allow_remux': False, 'crf': 30, 'start': '0:05', 'end': 12,
+                            'target_size': '50M'})
+    assert (job.format_name, job.preset_name, job.crf) == ('MKV', 'Small Size', 30)
+    assert job.allow_remux is False
+    assert (job.start, job.end, job.target_size) == (5.0, 12.0, 50000000)
+
+
+def test_job_from_request_defaults(source):
+    job = job_from_request({'source': source}, priority='low')
+    assert (job.format_name, job.preset_name, job.priority) == ('MP4', 'Maximum Quality', 'low')
+    assert job.allow_remux is True
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'allow_remux': 'false'}, "'allow_remux' must be true or false"),
+    ({'allow_remux': 0}, "'allow_remux' must be true or false"),
+    ({'crf': '23'}, "'crf' must be an integer"),
+    ({'crf': True}, "'crf' must be an integer"),
+    ({'start': False}, "'start' must be"),
+    ({'output_file': ['a.mp4']}, "'output_file' must be a string"),
+    ({'format': 3}, "'format' must be a string"),
+    ({'format': 'FLV'}, "unknown format 'FLV'"),
+    ({'preset': 'Bogus'}, "unknown quality preset 'Bogus'"),
+    ({'resolution': '9K'}, "unknown resolution '9K'"),
+    ({'priority': 'urgent'}, "unknown priority 'urgent'"),
+    ({'start': 10, 'end': 5}, 'end'),
+    ({'target_size': 'lots'}, "invalid value 'lots'"),
+    ({'color': 'red'}, 'unknown fields: color'),
+])
+def test_job_from_request_rejects_bad_fields(source, fields, message):
+    with pytest.raises(RequestError, match=message) as error:
+        job_from_request(dict({'source': source}, **fields))
+    assert error.value.status == 400
+
+
+def test_job_from_request_rejects_missing_source(tmp_path):
+    with pytest.raises(RequestError, match='no such source file'):
+        job_from_request({'source': str(tmp_path / 'missing.mp4')})
+    with pytest.raises(RequestError, match='no such source file'):
+        job_from_request({})
+
+
+def test_job_from_request_refuses_to_overwrite_the_source(source):
+    with pytest.raises(RequestError, match='overwrite the source'):
+        job_from_request({'source': source, 'output_file': source})
+
+
+def test_submit_poll_and_cancel(server, source):
+    status, job = request(server, 'POST', '/jobs', {'source': source, 'format': 'MKV'})
+    assert status == 201 and job['status'] == 'queued'
+    assert request(server, 'GET', f"/jobs/{job['id']}")[1]['output'].endswith('clip_converted.mkv')
+    status, listing = request(server, 'GET', '/jobs')
+    assert status == 200 and [entry['id'] for entry in listing['jobs']] == [job['id']]
+    status, cancelled = request(server, 'POST', f"/jobs/{job['id']}/cancel")
+    assert status == 200 and cancelled['status'] == 'cancelled'
+    assert request(server, 'DELETE', f"/jobs/{job['id']}")[0] == 409
+
+
+def test_status_codes(server, source):
+    assert request(server, 'GET', '/formats')[1]['MOV'][0] == 'ProRes HQ'
+    assert request(server, 'POST', '/jobs', {'source': source, 'crf': 'x'})[0] == 400
+    assert request(server, 'POST', '/jobs', 'not json')[0] == 400
+    assert request(server, 'POST', '/jobs')[0] == 400
+    assert request(server, 'GET', '/jobs/99')[0] == 404
+    assert request(server, 'GET', '/jobs/abc')[0] == 404
+    assert request(server, 'GET', '/nowhere')[0] == 404
+    assert request(server, 'POST', '/formats')[0] == 405
+
+
+def test_requests_from_web_pages_are_refused(server, source):
+    port = server.server.server_address[1]
+    body = {'source': source}
+    # A form or fetch() "simple request" can only send text/plain and friends
+    assert request(server, 'POST', '/jobs', body, {'Content-Type': 'text/plain'})[0] == 415
+    assert request(server, 'POST', '/jobs', body, {'Origin': 'https://example.com'})[0] == 403
+    assert request(server, 'GET', '/jobs', headers={'Origin': 'null'})[0] == 403
+    # DNS rebinding reaches the server under the attacker's host name
+    assert request(server, 'GET', '/jobs', headers={'Host': f'evil.example:{port}'})[0] == 403
+    assert request(server, 'GET', '/events', headers={'Host': f'evil.example:{port}'})[0] == 403
+    assert request(server, 'GET', '/jobs', headers={'Host': f'localhost:{port}'})[0] == 200
+    assert not server.engine.jobs
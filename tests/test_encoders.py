@@ -0,0 +1,25 @@
+from encoders import parse_encoders
+
+# Abridged `ffmpeg -hide_banner -encoders` output from FFMPEG 7
+ENCODERS_OUTPUT = """\
+Encoders:
+ V..... = Video
+ A..... = Audio
+ S..... = Subtitle
+ .F.... = Frame-level multithreading
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V....D libvpx-vp9           libvpx VP9 (codec vp9)
+ VFS..D prores_ks            Apple ProRes (iCodec Pro) (codec prores)
+ A....D aac                  AAC (Advanced Audio Coding)
+ S..... ass                  ASS (Advanced SubStation Alpha) subtitle
+"""
+
+
+def test_parse_encoders_keeps_video_encoders_from_the_list():
+    assert parse_encoders(ENCODERS_OUTPUT) == {'libx264', 'libvpx-vp9', 'prores_ks'}
+
+
+def test_parse_encoders_without_a_list():
+    assert parse_encoders('') == set()
+    assert parse_encoders(' V..... = Video\n V....D libx264 H.264\n') == set()
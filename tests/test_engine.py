@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from cli import print_event, progress_printer
+from engine import BatchEngine, ConversionJob
+from process import CAN_PAUSE
+from renditions import Rendition
+
+
+def test_output_file_equal_to_source_is_refused(tmp_path):
+    source = str(tmp_path / 'clip.mp4')
+    with pytest.raises(ValueError, match='overwrite the source'):
+        ConversionJob(source, 'MP4', 'Balanced', output_file=source)
+
+
+def test_output_template_resolving_to_source_is_refused(tmp_path):
+    source = str(tmp_path / 'clip.mp4')
+    with pytest.raises(ValueError, match='overwrite the source'):
+        ConversionJob(source, 'MP4', 'Balanced',
+                      output_template=os.path.join('{dir}', '{stem}{ext}'))
+
+
+def test_relative_output_path_to_source_is_refused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match='overwrite the source'):
+        ConversionJob(str(tmp_path / 'clip.mp4'), 'MP4', 'Balanced', output_file='clip.mp4')
+
+
+def test_rendition_output_equal_to_source_is_refused(tmp_path):
+    source = str(tmp_path / 'clip.mkv')
+    rendition = Rendition('MKV', 'Balanced', output_file=source)
+    with pytest.raises(ValueError, match='overwrite the source'):
+        ConversionJob(source, 'MP4', 'Balanced', output_file=str(tmp_path / 'out.mp4'),
+                      renditions=[rendition])
+
+
+def test_default_output_is_next_to_the_source(tmp_path):
+    source = str(tmp_path / 'clip.mp4')
+    job = ConversionJob(source, 'MP4', 'Balanced')
+    assert job.output_file == str(tmp_path / 'clip_converted.mp4')
+
+
+@pytest.mark.skipif(not CAN_PAUSE, reason='pausing needs SIGSTOP')
+def test_pausing_a_queued_job_emits_paused_and_resumed(tmp_path, capsys):
+    engine = BatchEngine(max_workers=1)
+    events = []
+    engine.add_listener(lambda event, job: events.append((event, job.paused)))
+    # Listeners that read progress details must not see these events as progress
+    engine.add_listener(progress_printer(engine))
+    engine.add_listener(print_event)
+    job = ConversionJob(str(tmp_path / 'clip.mp4'), 'MP4', 'Balanced')
+    assert job.estimator is None
+    assert engine.pause(job) and engine.resume(job)
+    assert events == [('paused', True), ('resumed', False)]
+    assert capsys.readouterr().out.splitlines() == [f'[{job.id}] paused', f'[{job.id}] resumed']
+
+
+def test_output_cache_key_ignores_thread_limits(tmp_path):
+    source = tmp_path / 'clip.mp4'
+    source.write_bytes(b'x' * 1000)
+    engine = BatchEngine(max_workers=1)
+    job = ConversionJob(str(source), 'MP4', 'Balanced')
+    job.mode = 'encode'
+    key = engine.output_cache_key(job)
+    job.threads = 3
+    assert '-threads' in job.conversion_parameters()
+    assert engine.output_cache_key(job) == key
+
+
+def test_submit_refuses_an_output_another_active_job_writes(tmp_path):
+    engine = BatchEngine(max_workers=1)
+    template = '{dir}/{stem}_converted{ext}'
+    first = ConversionJob(str(tmp_path / 'clip.mov'), 'MP4', 'Balanced', output_template=template)
+    # Stands in for a job still queued or running, without starting a worker
+    engine.jobs.append(first)
+    second = ConversionJob(str(tmp_path / 'clip.mkv'), 'MP4', 'Balanced', output_template=template)
+    with pytest.raises(ValueError, match=f'already the output of job {first.id}'):
+        engine.submit(second)
+    assert engine.jobs == [first]
+    first.status = 'done'
+    engine.submit(second)
+    engine.cancel(second)
+    engine.shutdown(cancel=True)
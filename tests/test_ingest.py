@@ -0,0 +1,108 @@
+import os
+
+from ingest import WatchFolder, batch_output_path, is_partial_output
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        return job
+
+
+def watch(folder, **options):
+    engine = RecordingEngine()
+    watcher = WatchFolder(engine, str(folder), lambda path, relative: (path, relative),
+                          settle_scans=2, **options)
+    return watcher, engine
+
+
+def scans(watcher, count):
+    return [watcher.scan() for _ in range(count)]
+
+
+def test_file_is_submitted_once_settled(tmp_path):
+    (tmp_path / 'a.mp4').write_bytes(b'x' * 10)
+    watcher, engine = watch(tmp_path)
+    assert scans(watcher, 2) == [[], []]
+    assert watcher.scan() == [(str(tmp_path / 'a.mp4'), '')]
+    assert scans(watcher, 3) == [[], [], []]
+    assert len(engine.jobs) == 1
+
+
+def test_growing_file_waits_until_it_stops_changing(tmp_path):
+    path = tmp_path / 'growing.mkv'
+    watcher, engine = watch(tmp_path)
+    for size in range(1, 6):
+        path.write_bytes(b'x' * size)
+        assert watcher.scan() == []
+    assert scans(watcher, 2)[-1] == [(str(path), '')]
+
+
+def test_empty_files_are_not_submitted(tmp_path):
+    (tmp_path / 'empty.mp4').write_bytes(b'')
+    watcher, engine = watch(tmp_path)
+    scans(watcher, 5)
+    assert not engine.jobs
+
+
+def test_replaced_file_is_submitted_again(tmp_path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(b'x' * 10)
+    watcher, engine = watch(tmp_path)
+    scans(watcher, 3)
+    path.write_bytes(b'y' * 20)
+    scans(watcher, 3)
+    assert len(engine.jobs) == 2
+
+
+def test_ignored_folders_partial_outputs_and_other_files_are_skipped(tmp_path):
+    output = tmp_path / 'converted'
+    (tmp_path / 'sub').mkdir()
+    output.mkdir()
+    (tmp_path / 'sub' / 'b.MOV').write_bytes(b'x')
+    (tmp_path / 'a.partial.mp4').write_bytes(b'x')
+    (tmp_path / 'notes.txt').write_bytes(b'x')
+    (output / 'done.mp4').write_bytes(b'x')
+    watcher, engine = watch(tmp_path, ignore=[str(output)])
+    scans(watcher, 3)
+    assert engine.jobs == [(str(tmp_path / 'sub' / 'b.MOV'), 'sub')]
+
+
+def test_rejected_file_is_skipped_until_it_changes(tmp_path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(b'x')
+    attempts = []
+
+    def make_job(path, relative):
+        attempts.append(path)
+        raise ValueError('bad settings')
+
+    engine = RecordingEngine()
+    watcher = WatchFolder(engine, str(tmp_path), make_job, settle_scans=0)
+    scans(watcher, 3)
+    assert attempts == [str(path)] and not engine.jobs
+
+
+def test_is_partial_output():
+    assert is_partial_output('clip.partial.mp4')
+    assert not is_partial_output('clip.mp4')
+    assert not is_partial_output('partial.mp4')
+
+
+def test_batch_output_path_never_overwrites_the_source(tmp_path):
+    source = str(tmp_path / 'clip.mp4')
+    assert batch_output_path(source, '', str(tmp_path), '.mp4') == os.path.join(
+        str(tmp_path), 'clip_converted.mp4')
+
+
+def test_batch_output_path_keeps_same_stem_sources_apart(tmp_path):
+    claimed = {}
+    out = str(tmp_path / 'out')
+    outputs = [batch_output_path(str(tmp_path / name), '', out, '.mp4', claimed)
+               for name in ('clip.mov', 'clip.mkv', 'clip.avi')]
+    assert outputs == [os.path.join(out, name) for name in ('clip.mp4', 'clip_1.mp4', 'clip_2.mp4')]
+    # The same source asking again, as a replaced file in a watched folder does, keeps its name
+    assert batch_output_path(str(tmp_path / 'clip.mkv'), '', out, '.mp4', claimed) == outputs[1]
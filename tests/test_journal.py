@@ -0,0 +1,46 @@
+import os
+
+from engine import ConversionJob
+from journal import JobJournal
+from renditions import Rendition
+
+
+def queued_job(tmp_path, **options):
+    source = tmp_path / 'clip.mp4'
+    if not source.exists():
+        source.write_bytes(b'x' * 100)
+    return ConversionJob(str(source), 'MP4', 'Balanced', **options)
+
+
+def test_resumed_job_has_the_recorded_key(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.sqlite3'))
+    job = queued_job(tmp_path, start=1.5, target_quality=('vmaf', 95.0),
+                     renditions=[Rendition('MP4', 'Small Size', 'HD (1280x720)')])
+    journal.record(job)
+    [settings] = journal.unfinished()
+    resumed = ConversionJob.from_settings(settings)
+    assert resumed.journal_key == job.journal_key
+    journal.forget(resumed)
+    assert journal.unfinished() == []
+
+
+def test_entries_for_changed_or_missing_sources_are_dropped(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.sqlite3'))
+    changed = queued_job(tmp_path)
+    journal.record(changed)
+    other = tmp_path / 'other.mp4'
+    other.write_bytes(b'y' * 100)
+    missing = ConversionJob(str(other), 'MKV', 'Balanced')
+    journal.record(missing)
+
+    with open(changed.source, 'ab') as f:
+        f.write(b'more')
+    os.remove(str(other))
+    kept = queued_job(tmp_path, resolution='HD (1280x720)')
+    journal.record(kept)
+
+    assert journal.unfinished() == [kept.journal_settings]
+    # The stale entries are gone for good, not just hidden
+    with journal._lock:
+        keys = [row[0] for row in journal._connection.execute('SELECT key FROM jobs')]
+    assert keys == [kept.journal_key]
@@ -0,0 +1,37 @@
+import threading
+
+import loader
+from loader import FileLoader
+from probe import MediaInfo
+
+
+class Events:
+    def __init__(self, expected):
+        self.items = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, event, path, value):
+        self.items.append((event, path))
+        if len(self.items) == self.expected:
+            self.done.set()
+
+
+def missing(path, *args):
+    raise FileNotFoundError(2, 'No such file or directory', path)
+
+
+def test_os_errors_are_reported_and_the_loader_keeps_going(monkeypatch):
+    monkeypatch.setattr(loader, 'probe', missing)
+    events = Events(expected=3)
+    file_loader = FileLoader(events, max_workers=1)
+    file_loader.load('gone.mp4')
+    file_loader._executor.submit(lambda: None).result(5)
+
+    monkeypatch.setattr(loader, 'probe', lambda path: MediaInfo({'format': {'duration': '4'}}))
+    monkeypatch.setattr(loader, 'get_thumbnail', missing)
+    file_loader.load('deleted_later.mp4')
+    assert events.done.wait(5)
+    file_loader.shutdown()
+    assert events.items == [('load_error', 'gone.mp4'), ('probed', 'deleted_later.mp4'),
+                            ('thumbnail_error', 'deleted_later.mp4')]
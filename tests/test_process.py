@@ -0,0 +1,61 @@
+import pytest
+
+from process import ProcessStats, with_progress_output
+
+# The stderr tail of a failed WEBM conversion of a source with AAC audio,
+# as FFMPEG 7 writes it (the engine passes -nostats, but a failure still ends
+# with a stats line)
+WEBM_AAC_TAIL = """\
+Stream mapping:
+  Stream #0:0 -> #0:0 (h264 (native) -> vp9 (libvpx-vp9))
+  Stream #0:1 -> #0:1 (copy)
+[libvpx-vp9 @ 0x187b5f80] v1.11.0-30-g888bafc78
+[libvpx-vp9 @ 0x187b5f80] Neither bitrate nor constrained quality specified, using default CRF of 32
+[webm @ 0x187a2740] Only VP8 or VP9 or AV1 video and Vorbis or Opus audio and WebVTT subtitles are supported for WebM.
+[out#0/webm @ 0x187a2540] Could not write header (incorrect codec parameters ?): Invalid argument
+[vf#0:0 @ 0x187b6d80] Error sending frames to consumers: Invalid argument
+[vf#0:0 @ 0x187b6d80] Task finished with error code: -22 (Invalid argument)
+[vf#0:0 @ 0x187b6d80] Terminating thread with return code -22 (Invalid argument)
+[out#0/webm @ 0x187a2540] Nothing was written into output file, because at least one of its streams received no packets.
+frame=    0 fps=0.0 q=0.0 Lsize=       0KiB time=N/A bitrate=N/A speed=N/A    
+Conversion failed!
+"""
+
+
+def stats_from(text):
+    stats = ProcessStats()
+    for line in text.splitlines():
+        stats.add_line(line.rstrip())
+    return stats
+
+
+def test_last_error_is_the_cause_not_the_stats_line():
+    assert stats_from(WEBM_AAC_TAIL).last_error() == (
+        '[webm @ 0x187a2740] Only VP8 or VP9 or AV1 video and Vorbis or Opus audio and '
+        'WebVTT subtitles are supported for WebM.')
+
+
+def test_last_error_of_an_unreadable_input():
+    stats = stats_from('/tmp/bad.mp4: Invalid data found when processing input\n')
+    assert stats.last_error() == '/tmp/bad.mp4: Invalid data found when processing input'
+
+
+def test_last_error_falls_back_to_the_last_informative_line():
+    stats = stats_from('Stream mapping:\nsomething odd happened\n'
+                       'size=       0KiB time=N/A bitrate=N/A speed=N/A\nConversion failed!\n')
+    assert stats.last_error() == 'something odd happened'
+
+
+def test_last_error_without_stderr():
+    assert ProcessStats().last_error() is None
+
+
+@pytest.mark.parametrize('command, expected', [
+    (['ffmpeg', '-i', 'in.mov', '-y', 'out.mp4'],
+     ['ffmpeg', '-hide_banner', '-nostats', '-progress', 'pipe:1',
+      '-i', 'in.mov', '-y', 'out.mp4']),
+    (['/opt/ffmpeg/bin/ffmpeg'],
+     ['/opt/ffmpeg/bin/ffmpeg', '-hide_banner', '-nostats', '-progress', 'pipe:1']),
+])
+def test_with_progress_output(command, expected):
+    assert with_progress_output(command) == expected
@@ -0,0 +1,41 @@
+import pytest
+
+from progress import ProgressParser
+
+# Two blocks of -progress output as FFMPEG writes them on Windows; the first
+# comes before the muxer has written anything
+OUTPUT = (b'frame=0\r\nfps=0.00\r\nbitrate=N/A\r\ntotal_size=N/A\r\nout_time_us=N/A\r\n'
+          b'speed=N/A\r\nprogress=continue\r\n'
+          b'frame=25\r\nfps=24.50\r\nbitrate= 128.0kbits/s\r\ntotal_size=16000\r\n'
+          b'out_time_us=1000000\r\nspeed=1.5x\r\nprogress=end\r\n')
+
+EXPECTED = [
+    {'out_time': 0.0, 'frame': 0, 'fps': 0.0, 'speed': 0.0, 'total_size': 0, 'bitrate': 0.0,
+     'finished': False},
+    {'out_time': 1.0, 'frame': 25, 'fps': 24.5, 'speed': 1.5, 'total_size': 16000,
+     'bitrate': 128.0, 'finished': True},
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, len(OUTPUT)])
+def test_parser_reads_blocks_split_anywhere(chunk_size):
+    parser = ProgressParser()
+    events = []
+    for offset in range(0, len(OUTPUT), chunk_size):
+        events.extend(parser.feed(OUTPUT[offset:offset + chunk_size]))
+    assert [event.to_dict() for event in events] == EXPECTED
+
+
+@pytest.mark.parametrize('output', [
+    OUTPUT.replace(b'\r\n', b'\n'),
+    OUTPUT.replace(b'\r\n', b'\r'),
+])
+def test_parser_accepts_any_line_ending(output):
+    assert [event.to_dict() for event in ProgressParser().feed(output)] == EXPECTED
+
+
+def test_last_line_waits_for_its_line_ending():
+    parser = ProgressParser()
+    assert parser.feed(b'out_time_us=2000000\nprogress=end') == []
+    [event] = parser.feed(b'\n')
+    assert (event.out_time, event.finished) == (2.0, True)
@@ -0,0 +1,35 @@
+import pytest
+
+import quality
+from engine import ConversionJob
+from quality import QualitySearchError, round_candidates, search_crf
+
+
+@pytest.mark.parametrize('low, high, count, candidates', [
+    (20, 20, 3, [20]),
+    (20, 22, 3, [20, 21, 22]),
+    (20, 24, 3, [21, 22, 23]),
+    (20, 25, 3, [21, 22, 24]),
+    (18, 38, 3, [23, 28, 33]),
+    (10, 30, 1, [20]),
+])
+def test_round_candidates(low, high, count, candidates):
+    assert round_candidates(low, high, count) == candidates
+
+
+def test_sample_encodes_keep_to_the_jobs_threads(tmp_path, monkeypatch):
+    source = tmp_path / 'clip.mp4'
+    source.write_bytes(b'x' * 1000)
+    job = ConversionJob(str(source), 'WEBM', 'Balanced', resolution='HD (1280x720)')
+    encoded = []
+
+    def encode_sample(source, start, length, params, output, *args):
+        encoded.append(params)
+        raise QualitySearchError('stop after the first sample')
+
+    monkeypatch.setattr(quality, 'encode_sample', encode_sample)
+    with pytest.raises(QualitySearchError):
+        search_crf(job, ('ssim', 0.98), use_cache=False)
+    params = encoded[0]
+    assert params[params.index('-threads') + 1] == str(job.thread_usage)
+    assert '-tile-columns' in params
@@ -0,0 +1,15 @@
+import pytest
+
+from renditions import build_filter_graph
+
+
+@pytest.mark.parametrize('resolutions, graph', [
+    (['Original'], '[0:v]null[v0]'),
+    (['HD (1280x720)'], '[0:v]scale=1280:-2[v0]'),
+    (['HD (1280x720)', 'HD (1280x720)'], '[0:v]scale=1280:-2,split=2[v0][v1]'),
+    (['Original', 'SD (854x480)'], '[0:v]split=2[g0][g1];[g0]null[v0];[g1]scale=854:-2[v1]'),
+    (['Full HD (1920x1080)', 'HD (1280x720)', 'Full HD (1920x1080)'],
+     '[0:v]split=2[g0][g1];[g0]scale=1920:-2,split=2[v0][v2];[g1]scale=1280:-2[v1]'),
+])
+def test_build_filter_graph_scales_each_resolution_once(resolutions, graph):
+    assert build_filter_graph(resolutions) == graph
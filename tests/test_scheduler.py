@@ -0,0 +1,49 @@
+import threading
+
+from engine import BatchEngine, ConversionJob
+from scheduler import ResourceBudget
+
+
+def acquire_in_thread(budget, request, stopped=None):
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.setdefault('granted', budget.acquire(request, stopped)))
+    thread.start()
+    return thread, result
+
+
+def test_acquire_waits_until_resources_are_released():
+    budget = ResourceBudget({'cores': 4})
+    held = budget.acquire({'cores': 3})
+    thread, result = acquire_in_thread(budget, {'cores': 2})
+    thread.join(0.2)
+    assert thread.is_alive()
+    budget.release(held)
+    thread.join(5)
+    assert result['granted'] == {'cores': 2}
+
+
+def test_stopped_waiter_gives_up_when_woken():
+    budget = ResourceBudget({'cores': 4})
+    budget.acquire({'cores': 4})
+    stop = threading.Event()
+    thread, result = acquire_in_thread(budget, {'cores': 1}, stop.is_set)
+    thread.join(0.2)
+    assert thread.is_alive()
+    stop.set()
+    budget.wake()
+    thread.join(5)
+    assert not thread.is_alive() and result['granted'] is None
+    assert budget.used == {'cores': 4}
+
+
+def test_cancelling_a_job_wakes_it_from_the_resource_wait(tmp_path):
+    engine = BatchEngine(max_workers=1, cpu_count=2, memory_limit=0)
+    engine.budget.acquire({'cores': 2})
+    job = ConversionJob(str(tmp_path / 'clip.mp4'), 'MP4', 'Balanced')
+    thread, result = acquire_in_thread(engine.budget, {'cores': 1}, engine.stop_check(job))
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert engine.cancel(job)
+    thread.join(5)
+    assert not thread.is_alive() and result['granted'] is None
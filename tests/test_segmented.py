@@ -0,0 +1,21 @@
+import segmented
+from engine import ConversionJob
+from scheduler import ResourceBudget
+
+
+def test_segments_after_a_failure_are_not_encoded(tmp_path, monkeypatch):
+    job = ConversionJob(str(tmp_path / 'clip.mp4'), 'MP4', 'Balanced')
+    job.mode = 'encode'
+    job.threads = 1
+    segments = [(str(tmp_path / f'segment_{index}.mkv'), 10) for index in range(4)]
+    monkeypatch.setattr(segmented, 'split_source', lambda *args: segments)
+    commands = []
+
+    def run_ffmpeg(command, *args):
+        commands.append(command)
+        return 1
+
+    monkeypatch.setattr(segmented, 'run_ffmpeg', run_ffmpeg)
+    budget = ResourceBudget({'cores': 1})
+    assert segmented.encode_segmented(job, budget, 1, lambda event: None) == 1
+    assert len(commands) == 1
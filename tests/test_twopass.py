@@ -0,0 +1,41 @@
+import pytest
+
+from twopass import parse_bitrate, parse_size
+
+
+@pytest.mark.parametrize('text, size', [
+    ('700M', 700000000),
+    ('1.5G', 1500000000),
+    ('.5g', 500000000),
+    ('25MiB', 25 * 1024 * 1024),
+    ('700MB', 700000000),
+    (' 2k ', 2000),
+    ('100', 100),
+])
+def test_parse_size(text, size):
+    assert parse_size(text) == size
+
+
+@pytest.mark.parametrize('text, bitrate', [
+    ('2500k', 2500000),
+    ('2500kbps', 2500000),
+    ('1.5M', 1500000),
+    ('64Ki', 65536),
+])
+def test_parse_bitrate(text, bitrate):
+    assert parse_bitrate(text) == bitrate
+
+
+@pytest.mark.parametrize('text, message', [
+    ('lots', "invalid value 'lots'"),
+    ('', "invalid value ''"),
+    ('-5M', "invalid value '-5M'"),
+    ('5T', "invalid value '5T'"),
+    ('5i', "invalid value '5i'"),
+    ('0', "'0' must be more than zero"),
+    ('0.0M', "'0.0M' must be more than zero"),
+])
+def test_invalid_sizes_and_bitrates(text, message):
+    for parse in (parse_size, parse_bitrate):
+        with pytest.raises(ValueError, match=message):
+            parse(text)
@@ -0,0 +1,242 @@
+"""Preview thumbnails and scrubbing sprite sheets with in-memory and on-disk LRU caches.
+
+FFMPEG seeks to a representative timestamp and scales the frame to the
+preview height itself, so only a small PNG crosses the pipe instead of
+a full-resolution PPM frame. For scrubbing, one FFMPEG pass decodes only
+keyframes, samples evenly spaced ones and tiles them into a single JPEG
+sprite sheet, so hovering over the preview never starts a process.
+"""
+import collections
+import hashlib
+import os
+import subprocess
+import threading
+
+from cache import cache_dir, file_key
+
+PREVIEW_HEIGHT = 180
+
+# Thumbnails kept in memory and on disk
+MEMORY_CACHE_SIZE = 64
+DISK_CACHE_SIZE = 2000
+
+# Seek this far into the video (capped) to skip black leaders and title cards
+SEEK_FRACTION = 0.1
+MAX_SEEK_SECONDS = 30
+
+# Frames in a scrubbing sprite sheet, tiled in rows of SPRITE_COLUMNS
+SPRITE_FRAMES = 20
+SPRITE_COLUMNS = 5
+SPRITE_JPEG_QUALITY = 5
+# Sprite sheets are larger than thumbnails, so fewer are kept
+SPRITE_MEMORY_CACHE_SIZE = 8
+SPRITE_DISK_CACHE_SIZE = 500
+
+_memory_cache = collections.OrderedDict()
+_sprite_cache = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+class ThumbnailError(Exception):
+    """Raised when no frame could be extracted from a file."""
+
+
+def thumbnail_timestamp(duration):
+    """Pick a representative timestamp in seconds for a video of this duration."""
+    if not duration:
+        return 0
+    return min(duration * SEEK_FRACTION, MAX_SEEK_SECONDS)
+
+
+def extract_thumbnail(path, timestamp=0, height=PREVIEW_HEIGHT):
+    """Decode one frame at timestamp, scaled to height, and return it as PNG bytes."""
+    cmd = [
+        'ffmpeg',
+        '-ss', f'{timestamp:.3f}',   # Seek on the input, before decoding
+        '-i', path,
+        '-frames:v', '1',            # Extract only one frame
+        '-vf', f'scale=-2:{height}',
+        '-f', 'image2pipe',          # Output to pipe
+        '-c:v', 'png',
+        '-'
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0 or not result.stdout:
+        raise ThumbnailError('Could not extract video thumbnail')
+    return result.stdout
+
+
+class SpriteSheet:
+    """Evenly spaced preview frames of one video, tiled into a JPEG image.
+
+    Frame i shows the video around time(i) and sits at box(i) in the image.
+    """
+
+    def __init__(self, data, duration, count=SPRITE_FRAMES, columns=SPRITE_COLUMNS):
+        self.data = data
+        self.duration = duration
+        self.count = count
+        self.columns = columns
+
+    @property
+    def rows(self):
+        return -(-self.count // self.columns)
+
+    def index_at(self, fraction):
+        """Return the frame for a position from 0 to 1 along the video."""
+        return min(max(int(fraction * self.count), 0), self.count - 1)
+
+    def time(self, index):
+        return self.duration * index / self.count
+
+    def box(self, index, width, height):
+        """Crop box (left, upper, right, lower) of a frame in a sheet of width x height."""
+        tile_width, tile_height = width // self.columns, height // self.rows
+        left = index % self.columns * tile_width
+        upper = index // self.columns * tile_height
+        return left, upper, left + tile_width, upper + tile_height
+
+
+def extract_sprites(path, duration, height=PREVIEW_HEIGHT, count=SPRITE_FRAMES,
+                    columns=SPRITE_COLUMNS):
+    """Tile count evenly spaced keyframes, scaled to height, into JPEG bytes.
+
+    Only keyframes are decoded; the fps filter picks the one at or before
+    each sampling point. tpad holds the last keyframe to the end, so a
+    video with few keyframes still fills every tile.
+    """
+    rows = -(-count // columns)
+    cmd = [
+        'ffmpeg',
+        '-skip_frame', 'nokey',      # Decode keyframes only
+        '-i', path,
+        '-an', '-sn',
+        '-vf', f'tpad=stop_mode=clone:stop_duration={duration:.3f},fps={count}/{duration:.3f},'
+               f'scale=-2:{height},tile={columns}x{rows}',
+        '-frames:v', '1',
+        '-f', 'image2pipe',
+        '-c:v', 'mjpeg',
+        '-q:v', str(SPRITE_JPEG_QUALITY),
+        '-'
+    ]
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    if result.returncode != 0 or not result.stdout:
+        raise ThumbnailError('Could not extract preview frames')
+    return result.stdout
+
+
+def _disk_path(key, kind='thumbnails', extension='.png'):
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + extension
+    return os.path.join(cache_dir(kind), name)
+
+
+def _remember(key, data, cache=_memory_cache, size=MEMORY_CACHE_SIZE):
+    with _lock:
+        cache[key] = data
+        cache.move_to_end(key)
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+
+def _recall(key, cache=_memory_cache):
+    with _lock:
+        data = cache.get(key)
+        if data is not None:
+            cache.move_to_end(key)
+        return data
+
+
+def _read_disk_cache(disk_path):
+    try:
+        with open(disk_path, 'rb') as f:
+            data = f.read()
+        # Touch the file so the disk cache evicts least recently used first
+        os.utime(disk_path)
+        return data
+    except OSError:
+        return None
+
+
+def _write_disk_cache(disk_path, data):
+    temp_path = f'{disk_path}.{threading.get_ident()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, disk_path)
+    except OSError:
+        pass
+
+
+def _prune_disk_cache(kind='thumbnails', extension='.png', limit=DISK_CACHE_SIZE):
+    """Delete the least recently used cache files beyond limit."""
+    directory = cache_dir(kind)
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(extension)]
+    except OSError:
+        return
+    if len(entries) <= limit:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - limit]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def get_thumbnail(path, duration=None, height=PREVIEW_HEIGHT):
+    """Return PNG bytes of a preview frame, from the cache when possible.
+
+    Safe to call from any thread. Raises ThumbnailError on failure.
+    """
+    try:
+        key = f'{file_key(path)}|{height}'
+    except OSError as e:
+        raise ThumbnailError(str(e))
+
+    data = _recall(key)
+    if data is not None:
+        return data
+
+    disk_path = _disk_path(key)
+    data = _read_disk_cache(disk_path)
+    if data is None:
+        timestamp = thumbnail_timestamp(duration)
+        try:
+            data = extract_thumbnail(path, timestamp, height)
+        except ThumbnailError:
+            if not timestamp:
+                raise
+            # Some files can't seek (or are shorter than reported); use the first frame
+            data = extract_thumbnail(path, 0, height)
+        _write_disk_cache(disk_path, data)
+        _prune_disk_cache()
+
+    _remember(key, data)
+    return data
+
+
+def get_sprites(path, duration, height=PREVIEW_HEIGHT):
+    """Return the SpriteSheet for scrubbing a video, from the cache when possible.
+
+    Safe to call from any thread. Raises ThumbnailError on failure,
+    including when the duration is unknown.
+    """
+    if not duration:
+        raise ThumbnailError('Unknown duration')
+    try:
+        key = f'{file_key(path)}|{height}|{SPRITE_FRAMES}x{SPRITE_COLUMNS}'
+    except OSError as e:
+        raise ThumbnailError(str(e))
+
+    data = _recall(key, _sprite_cache)
+    if data is None:
+        disk_path = _disk_path(key, 'sprites', '.jpg')
+        data = _read_disk_cache(disk_path)
+        if data is None:
+            data = extract_sprites(path, duration, height)
+            _write_disk_cache(disk_path, data)
+            _prune_disk_cache('sprites', '.jpg', SPRITE_DISK_CACHE_SIZE)
+        _remember(key, data, _sprite_cache, SPRITE_MEMORY_CACHE_SIZE)
+    return SpriteSheet(data, duration)
@@ -0,0 +1,64 @@
+"""Converting a time range of the source instead of the whole file.
+
+The range is applied with input-side seeking (-ss and -t before -i), so
+FFMPEG starts reading at the keyframe before the start instead of
+decoding everything up to it. A re-encode decodes from that keyframe and
+drops the frames before the start, so its cut is frame-accurate. A
+stream copy can only begin on a keyframe: it is used when the start
+falls on one, or, with accurate trimming off, by starting at the
+keyframe before the requested start.
+"""
+from probe import keyframe_before
+
+# A start this close after a keyframe counts as on it
+KEYFRAME_TOLERANCE = 0.01
+
+
+def parse_timestamp(text):
+    """Parse '[[HH:]MM:]SS[.fff]' into seconds. Raises ValueError."""
+    parts = text.strip().split(':')
+    if not 1 <= len(parts) <= 3 or not all(part.strip() for part in parts):
+        raise ValueError(f"invalid time '{text}' (use SECONDS, MM:SS or HH:MM:SS)")
+    seconds = 0.0
+    for part in parts:
+        value = float(part)
+        if value < 0:
+            raise ValueError(f"invalid time '{text}'")
+        seconds = seconds * 60 + value
+    return seconds
+
+
+def validate_range(start, end):
+    """Raise ValueError unless start..end is a usable range; either may be None."""
+    if start is not None and start < 0:
+        raise ValueError('the range start cannot be negative')
+    if end is not None and end <= (start or 0):
+        raise ValueError('the range end must be after its start')
+
+
+def range_duration(start, end, duration):
+    """Seconds in start..end of a source lasting duration, or None if unknown."""
+    if duration:
+        end = duration if end is None else min(end, duration)
+    if end is None:
+        return None
+    return max(end - (start or 0), 0)
+
+
+def trim_parameters(start, end):
+    """Build the FFMPEG input arguments selecting start..end; empty for the whole file."""
+    params = []
+    if start:
+        params.extend(['-ss', f'{start:.3f}'])
+    if end is not None:
+        params.extend(['-t', f'{end - (start or 0):.3f}'])
+    return params
+
+
+def starts_on_keyframe(source, start, media_info=None):
+    """Return True if a stream copy from start would begin exactly at start."""
+    if not start:
+        return True
+    start_time = media_info.start_time if media_info else 0.0
+    keyframe = keyframe_before(source, start, start_time)
+    return keyframe is not None and start - keyframe <= KEYFRAME_TOLERANCE
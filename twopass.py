@@ -0,0 +1,152 @@
+"""Two-pass encoding to a target file size or video bitrate.
+
+CRF presets control quality, not size. With a target, the job's video
+bitrate is worked out from the size left once the copied audio and the
+container overhead are taken off, and the preset's encoder runs twice:
+an analysis pass that only writes a pass log, then the real encode,
+which spends the bits where the log says they are needed. x264 and x265
+already run a lighter first pass by themselves; libvpx and libaom are
+given a faster speed for it. Each job's pass log lives in a directory
+of its own, so concurrent jobs never read each other's.
+"""
+import os
+import re
+import tempfile
+
+from encoders import resolve_encoder
+from presets import get_preset_options
+from segmented import strip_audio_parameters
+
+# Encoders with a two-pass mode, and the formats whose presets use them
+TWO_PASS_ENCODERS = ('libx264', 'libx265', 'libvpx-vp9', 'libaom-av1')
+TWO_PASS_FORMATS = ('MP4', 'MKV', 'AVI', 'WEBM')
+
+# Faster speed settings for the analysis pass, replacing the preset's
+FIRST_PASS_SPEEDS = {
+    'libvpx-vp9': ('-speed', '4'),
+    'libaom-av1': ('-cpu-used', '6')
+}
+
+# Share of a target size taken by the container
+MUXING_OVERHEAD = 0.01
+# Assumed bitrate of a copied audio stream that doesn't report its own
+DEFAULT_AUDIO_BITRATE = 128000
+# Below this the video is unwatchable; refuse rather than encode it
+MIN_VIDEO_BITRATE = 50000
+
+# SI prefixes as FFMPEG reads them; an 'i' after one makes it binary, e.g. 'Mi'
+_QUANTITY = re.compile(r'^\s*(\d+(?:\.\d*)?|\.\d+)\s*([kmg]?)(i?)\s*$', re.IGNORECASE)
+_PREFIXES = {'': 0, 'k': 1, 'm': 2, 'g': 3}
+
+
+def parse_quantity(text, unit):
+    """Parse e.g. '700M', '1.5G' or '25MiB' (unit 'B') or '2500k' (unit 'bps').
+
+    Raises ValueError.
+    """
+    stripped = text.strip()
+    if stripped.lower().endswith(unit.lower()):
+        stripped = stripped[:-len(unit)]
+    match = _QUANTITY.match(stripped)
+    if not match:
+        raise ValueError(f"invalid value '{text}' (e.g. 700M, 1.5G, 2500k)")
+    number, prefix, binary = match.groups()
+    if binary and not prefix:
+        raise ValueError(f"invalid value '{text}'")
+    base = 1024 if binary else 1000
+    value = float(number) * base ** _PREFIXES[prefix.lower()]
+    if value <= 0:
+        raise ValueError(f"'{text}' must be more than zero")
+    return value
+
+
+def parse_size(text):
+    """Parse a target file size into bytes, e.g. '700M' or '25MiB'. Raises ValueError."""
+    return int(parse_quantity(text, 'B'))
+
+
+def parse_bitrate(text):
+    """Parse a video bitrate into bits per second, e.g. '2500k' or '4M'. Raises ValueError."""
+    return int(parse_quantity(text, 'bps'))
+
+
+def supports_two_pass(format_name, preset_name):
+    """Return True if the preset's encoder can be run in two passes."""
+    codec = get_preset_options(format_name, preset_name).get('codec')
+    return format_name in TWO_PASS_FORMATS and resolve_encoder(codec) in TWO_PASS_ENCODERS
+
+
+def audio_bitrate(media_info):
+    """Bits per second of the audio streams the output copies from the source."""
+    return sum(int(float(stream.get('bit_rate') or DEFAULT_AUDIO_BITRATE))
+               for stream in media_info.audio_streams) if media_info else 0
+
+
+def target_video_bitrate(duration, media_info, target_size=None, target_bitrate=None):
+    """Return the video bitrate in bits per second that meets the target.
+
+    target_bitrate is used as given; target_size is the whole output in
+    bytes, audio included. Raises ValueError if the size can't be met.
+    """
+    if target_bitrate:
+        return int(target_bitrate)
+    if not duration:
+        raise ValueError('a target size needs a source with a known duration')
+    total = target_size * 8 * (1 - MUXING_OVERHEAD) / duration
+    bitrate = int(total - audio_bitrate(media_info))
+    if bitrate < MIN_VIDEO_BITRATE:
+        raise ValueError(f'a target size of {target_size / 1e6:g} MB leaves too little for '
+                         f'{duration:.0f}s of video; allow at least '
+                         f'{minimum_size(duration, media_info) / 1e6:.1f} MB')
+    return bitrate
+
+
+def minimum_size(duration, media_info):
+    """Smallest target size in bytes that still leaves MIN_VIDEO_BITRATE for the video."""
+    return (MIN_VIDEO_BITRATE + audio_bitrate(media_info)) * duration / 8 / (1 - MUXING_OVERHEAD)
+
+
+def bitrate_parameters(params, bitrate):
+    """Replace the CRF rate control in output arguments with an average bitrate."""
+    result = []
+    skip = False
+    for arg in params:
+        if skip:
+            skip = False
+            continue
+        if arg in ('-crf', '-qp', '-b:v'):
+            skip = True
+            continue
+        result.append(arg)
+    return [*result, '-b:v', str(bitrate)]
+
+
+def first_pass_parameters(params, encoder):
+    """Turn a job's output arguments into those of its analysis pass: faster, no audio."""
+    params = strip_audio_parameters(params)
+    speed = FIRST_PASS_SPEEDS.get(encoder)
+    if speed:
+        option, value = speed
+        if option in params:
+            params[params.index(option) + 1] = value
+        else:
+            params.extend(speed)
+    return params
+
+
+def escape_x265_value(value):
+    """Escape a value for -x265-params, whose entries are split at ':'."""
+    return value.replace('\\', '\\\\').replace(':', '\\:')
+
+
+def pass_parameters(encoder, number, passlog):
+    """Arguments making an encoder run pass number (1 or 2) with its log at passlog."""
+    if encoder == 'libx265':
+        # FFMPEG's -pass doesn't reach x265; it takes its own options
+        return ['-x265-params', f'pass={number}:stats={escape_x265_value(passlog)}.log']
+    return ['-pass', str(number), '-passlogfile', passlog]
+
+
+def make_passlog_prefix():
+    """Create a private directory for one job's pass log and return the log's path prefix."""
+    return os.path.join(tempfile.mkdtemp(prefix='video_converter-2pass-'), 'pass')
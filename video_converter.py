@@ -1,14 +1,34 @@
+import sys
+
+# Command-line runs go straight to the CLI so they never import Tk, tkinterdnd2 or PIL
+if __name__ == "__main__" and len(sys.argv) > 1:
+    from cli import main
+    sys.exit(main())
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinterdnd2 import DND_FILES, TkinterDnD
 from PIL import Image, ImageTk
 import os
 import io
-import subprocess
+import queue
 import threading
-import re
 import time
 
+from api import JobServer
+from encoders import available_encoders
+from engine import BatchEngine, ConversionJob
+from ingest import batch_output_path, is_supported_file, iter_video_files
+from journal import JobJournal
+from output_cache import OutputCache
+from presets import (ENCODING_PRESETS, FORMATS, RESOLUTION_PRESETS,
+                     build_conversion_parameters)
+from quality import parse_target
+from loader import FileLoader
+from process import CAN_PAUSE
+from trim import parse_timestamp, validate_range
+from twopass import parse_size, supports_two_pass
+
 class ToolTip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -38,6 +58,15 @@ class ToolTip:
             self.tooltip.destroy()
             self.tooltip = None
 
+# How often the Tk main thread drains the dispatch queue
+DISPATCH_INTERVAL_MS = 50
+
+def slice_sprites(sheet):
+    """Decode a SpriteSheet and cut it into one image per frame, off the UI thread."""
+    image = Image.open(io.BytesIO(sheet.data))
+    image.load()
+    return sheet, [image.crop(sheet.box(index, *image.size)) for index in range(sheet.count)]
+
 class VideoConverter(TkinterDnD.Tk):
     def __init__(self):
         super().__init__()
@@ -51,157 +80,70 @@ class VideoConverter(TkinterDnD.Tk):
         self.title("Video Format Converter")
         self.geometry("600x600")
         
-        # Define common presets
-        self.presets = {
-            'ultrafast': 'Fastest encoding, largest file size',
-            'superfast': 'Very fast encoding, larger file size',
-            'veryfast': 'Fast encoding, good file size',
-            'faster': 'Fast encoding, better compression',
-            'fast': 'Good balance of speed and compression',
-            'medium': 'Default preset, good balance',
-            'slow': 'Better compression, slower encoding',
-            'slower': 'Very good compression, slower encoding',
-            'veryslow': 'Best compression, slowest encoding'
-        }
+        self.presets = ENCODING_PRESETS
+        self.resolution_presets = RESOLUTION_PRESETS
+        self.formats = FORMATS
 
-        # Define resolution presets
-        self.resolution_presets = [
-            'Original',
-            '4K (3840x2160)',
-            '2K (2560x1440)',
-            'Full HD (1920x1080)',
-            'HD (1280x720)',
-            'SD (854x480)',
-            'Low (640x360)'
-        ]
-
-        self.formats = {
-            'MP4': {
-                'extension': '.mp4',
-                'presets': {
-                    'Maximum Quality': {
-                        'crf': 18,
-                        'preset': 'slow',
-                        'codec': 'libx264'
-                    },
-                    'High Quality': {
-                        'crf': 23,
-                        'preset': 'medium',
-                        'codec': 'libx264'
-                    },
-                    'Balanced': {
-                        'crf': 28,
-                        'preset': 'fast',
-                        'codec': 'libx264'
-                    },
-                    'Small Size': {
-                        'crf': 32,
-                        'preset': 'veryfast',
-                        'codec': 'libx264'
-                    }
-                }
-            },
-            'MOV': {
-                'extension': '.mov',
-                'presets': {
-                    'ProRes HQ': {
-                        'codec': 'prores_ks',
-                        'profile': 3
-                    },
-                    'ProRes Normal': {
-                        'codec': 'prores_ks',
-                        'profile': 2
-                    },
-                    'ProRes LT': {
-                        'codec': 'prores_ks',
-                        'profile': 1
-                    },
-                    'ProRes Proxy': {
-                        'codec': 'prores_ks',
-                        'profile': 0
-                    }
-                }
-            },
-            'MKV': {
-                'extension': '.mkv',
-                'presets': {
-                    'Maximum Quality': {
-                        'crf': 18,
-                        'preset': 'slow',
-                        'codec': 'libx264'
-                    },
-                    'High Quality': {
-                        'crf': 23,
-                        'preset': 'medium',
-                        'codec': 'libx264'
-                    },
-                    'Balanced': {
-                        'crf': 28,
-                        'preset': 'fast',
-                        'codec': 'libx264'
-                    },
-                    'Small Size': {
-                        'crf': 32,
-                        'preset': 'veryfast',
-                        'codec': 'libx264'
-                    }
-                }
-            },
-            'AVI': {
-                'extension': '.avi',
-                'presets': {
-                    'Maximum Quality': {
-                        'crf': 18,
-                        'preset': 'slow',
-                        'codec': 'libx264'
-                    },
-                    'High Quality': {
-                        'crf': 23,
-                        'preset': 'medium',
-                        'codec': 'libx264'
-                    },
-                    'Balanced': {
-                        'crf': 28,
-                        'preset': 'fast',
-                        'codec': 'libx264'
-                    },
-                    'Small Size': {
-                        'crf': 32,
-                        'preset': 'veryfast',
-                        'codec': 'libx264'
-                    }
-                }
-            },
-            'WEBM': {
-                'extension': '.webm',
-                'presets': {
-                    'Maximum Quality': {
-                        'crf': 18,
-                        'speed': 0,
-                        'codec': 'libvpx-vp9'
-                    },
-                    'High Quality': {
-                        'crf': 30,
-                        'speed': 1,
-                        'codec': 'libvpx-vp9'
-                    },
-                    'Balanced': {
-                        'crf': 35,
-                        'speed': 2,
-                        'codec': 'libvpx-vp9'
-                    },
-                    'Small Size': {
-                        'crf': 40,
-                        'speed': 4,
-                        'codec': 'libvpx-vp9'
-                    }
-                }
-            }
-        }
+        # Background threads hand results to the Tk main thread through this queue
+        self.dispatch_queue = queue.Queue()
+
+        # Conversions run on the shared batch engine; this window is one of its clients.
+        # The journal lets conversions interrupted by a crash or restart resume.
+        # Repeated conversions of the same source and settings reuse the earlier output.
+        try:
+            self.journal = JobJournal()
+            output_cache = OutputCache()
+        except Exception:
+            self.journal = output_cache = None
+        self.engine = BatchEngine(journal=self.journal, output_cache=output_cache)
+        self.engine.add_listener(self.handle_engine_event)
+        self.current_job = None
+
+        # With VIDEO_CONVERTER_API_PORT set, other programs can queue jobs on this
+        # engine through the local job API; they run at low priority like batches
+        self.api_server = None
+        api_port = os.environ.get('VIDEO_CONVERTER_API_PORT')
+        if api_port:
+            try:
+                self.api_server = JobServer(self.engine, int(api_port), priority='low').start()
+            except (OSError, ValueError) as e:
+                messagebox.showwarning("Job API", f"Cannot serve the job API on port {api_port}: {e}")
+        self.paused = False
+
+        # Jobs queued from dropped folders and multi-file drops
+        self.batch_job_ids = set()
+        self.batch_counts = {'queued': 0, 'done': 0, 'failed': 0}
+        self.batch_lock = threading.Lock()
+        self.batch_status_pending = False
+
+        # Probing and thumbnails run in the background so loading never blocks the UI
+        self.loader = FileLoader(lambda *args: self.dispatch(self.handle_loader_event, *args))
+
+        # Detect the installed encoders now so the first conversion doesn't wait for it
+        threading.Thread(target=available_encoders, daemon=True).start()
 
         self.current_video = None
+        self.current_info = None
+        self.reset_scrubbing()
         self.setup_ui()
         self.setup_drop_target()
+        self.after(DISPATCH_INTERVAL_MS, self.process_dispatch_queue)
+        self.after_idle(self.offer_resume)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def dispatch(self, callback, *args):
+        """Run callback(*args) on the Tk main thread; safe to call from any thread."""
+        self.dispatch_queue.put((callback, args))
+
+    def process_dispatch_queue(self):
+        """Run the callbacks queued by background threads."""
+        try:
+            while True:
+                callback, args = self.dispatch_queue.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        self.after(DISPATCH_INTERVAL_MS, self.process_dispatch_queue)
 
     def setup_ui(self):
         main_frame = ttk.Frame(self)
@@ -269,10 +211,64 @@ class VideoConverter(TkinterDnD.Tk):
         self.encode_preset_combo.pack(side=tk.LEFT, padx=(10, 0), fill=tk.X, expand=True)
         ToolTip(self.encode_preset_combo, "Encoding preset affects compression speed vs quality")
 
+        # Range
+        range_frame = ttk.Frame(advanced_frame)
+        range_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(range_frame, text="Start:").pack(side=tk.LEFT)
+        self.start_var = tk.StringVar()
+        self.start_entry = ttk.Entry(range_frame, textvariable=self.start_var, width=10)
+        self.start_entry.pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(range_frame, text="End:").pack(side=tk.LEFT, padx=(10, 0))
+        self.end_var = tk.StringVar()
+        self.end_entry = ttk.Entry(range_frame, textvariable=self.end_var, width=10)
+        self.end_entry.pack(side=tk.LEFT, padx=(10, 0))
+        ToolTip(self.start_entry, "Convert from this time (SS, MM:SS or HH:MM:SS). "
+                                  "Leave empty to start at the beginning")
+        ToolTip(self.end_entry, "Convert up to this time (SS, MM:SS or HH:MM:SS). "
+                                "Leave empty to convert to the end")
+
+        # Target size
+        target_size_frame = ttk.Frame(advanced_frame)
+        target_size_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(target_size_frame, text="Target Size:").pack(side=tk.LEFT)
+        self.target_size_var = tk.StringVar()
+        self.target_size_entry = ttk.Entry(target_size_frame, textvariable=self.target_size_var,
+                                           width=10)
+        self.target_size_entry.pack(side=tk.LEFT, padx=(10, 0))
+        ToolTip(self.target_size_entry, "Encode in two passes to about this file size, e.g. 700M "
+                                        "or 1.5G. Leave empty to encode at the CRF value")
+
+        # Stream copy
+        self.remux_var = tk.BooleanVar(value=True)
+        self.remux_check = ttk.Checkbutton(advanced_frame, text="Copy streams when possible",
+                                           variable=self.remux_var)
+        self.remux_check.pack(anchor=tk.W, padx=10, pady=5)
+        ToolTip(self.remux_check, "Skip re-encoding when the source already uses the preset's codec "
+                                  "and no resolution or quality change is requested")
+
+        # Target quality
+        self.target_quality_var = tk.BooleanVar(value=False)
+        self.target_quality_check = ttk.Checkbutton(advanced_frame,
+                                                    text="Pick CRF by measured quality",
+                                                    variable=self.target_quality_var)
+        self.target_quality_check.pack(anchor=tk.W, padx=10, pady=5)
+        ToolTip(self.target_quality_check, "Encode short samples at several CRF values and use the "
+                                           "smallest one that still scores as visually transparent "
+                                           "(VMAF, or SSIM when VMAF is unavailable)")
+
         # Convert button
         self.convert_btn = ttk.Button(controls_frame, text="Convert", command=self.convert_video)
         self.convert_btn.pack(fill=tk.X, pady=(0, 10))
 
+        # Pause and cancel apply to every conversion started from this window
+        job_controls = ttk.Frame(controls_frame)
+        job_controls.pack(fill=tk.X, pady=(0, 10))
+        self.pause_btn = ttk.Button(job_controls, text="Pause", command=self.toggle_pause)
+        self.pause_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        self.cancel_btn = ttk.Button(job_controls, text="Cancel", command=self.cancel_conversions)
+        self.cancel_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        self.set_job_controls(False)
+
         # Progress bar and label
         self.progress = ttk.Progressbar(controls_frame, mode='determinate', maximum=100)
         self.progress.pack(fill=tk.X)
@@ -295,6 +291,12 @@ class VideoConverter(TkinterDnD.Tk):
         self.preview_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         self.preview_label.bind('<Button-1>', lambda e: self.select_file())
 
+        # Hovering over the preview scrubs through frames cut from one sprite sheet
+        self.scrub_label = ttk.Label(self.preview_frame)
+        for widget in (self.preview_frame, self.preview_label, self.scrub_label):
+            widget.bind('<Motion>', self.scrub_preview)
+            widget.bind('<Leave>', self.end_scrub)
+
         # Set initial format
         self.format_combo.set('MP4')
         self.update_quality_options()
@@ -326,47 +328,69 @@ class VideoConverter(TkinterDnD.Tk):
         else:
             self.encode_preset_combo.state(['disabled'])
 
+    def get_advanced_overrides(self):
+        """Return the CRF and encoding preset overrides, or None where disabled."""
+        crf = None
+        if not self.crf_spinbox.instate(['disabled']):
+            crf = self.crf_var.get()
+        encode_preset = None
+        if not self.encode_preset_combo.instate(['disabled']):
+            encode_preset = self.encode_preset_var.get()
+        return crf, encode_preset
+
     def get_conversion_parameters(self):
-        selected_format = self.format_var.get()
-        selected_preset = self.quality_preset_var.get()
-        preset_options = self.formats[selected_format]['presets'][selected_preset]
-        
-        params = []
-        
-        # Add codec
-        if 'codec' in preset_options:
-            params.extend(['-c:v', preset_options['codec']])
-        
-        # Add resolution if not original
-        if self.resolution_var.get() != 'Original':
-            resolution = self.resolution_var.get()
-            width = resolution.split('(')[1].split('x')[0]
-            params.extend(['-vf', f'scale={width}:-2'])
-        
-        # Add format-specific parameters
-        if selected_format in ['MP4', 'MKV', 'AVI']:
-            if not self.crf_spinbox.instate(['disabled']):
-                params.extend(['-crf', self.crf_var.get()])
-            if not self.encode_preset_combo.instate(['disabled']):
-                params.extend(['-preset', self.encode_preset_var.get()])
-        elif selected_format == 'MOV':
-            if 'profile' in preset_options:
-                params.extend(['-profile:v', str(preset_options['profile'])])
-        elif selected_format == 'WEBM':
-            if 'speed' in preset_options:
-                params.extend(['-speed', str(preset_options['speed'])])
-            if 'crf' in preset_options:
-                params.extend(['-crf', str(preset_options['crf']), '-b:v', '0'])
-        
-        # Always copy audio codec
-        params.extend(['-c:a', 'copy'])
-        
-        return params
+        crf, encode_preset = self.get_advanced_overrides()
+        return build_conversion_parameters(self.format_var.get(),
+                                           self.quality_preset_var.get(),
+                                           self.resolution_var.get(),
+                                           crf=crf,
+                                           encode_preset=encode_preset)
+
+    def get_range(self):
+        """Return the (start, end) seconds entered, None where empty. Raises ValueError."""
+        start = parse_timestamp(self.start_var.get()) if self.start_var.get().strip() else None
+        end = parse_timestamp(self.end_var.get()) if self.end_var.get().strip() else None
+        validate_range(start, end)
+        return start, end
+
+    def get_target_size(self):
+        """Return the target size entered in bytes, or None if empty. Raises ValueError."""
+        if not self.target_size_var.get().strip():
+            return None
+        if self.target_quality_var.get():
+            raise ValueError("a target size can't be combined with picking the CRF by quality")
+        if not supports_two_pass(self.format_var.get(), self.quality_preset_var.get()):
+            raise ValueError(f"{self.format_var.get()} {self.quality_preset_var.get()} can't be "
+                             f"encoded to a target size")
+        return parse_size(self.target_size_var.get())
+
+    def get_job_settings(self):
+        """Return the ConversionJob options selected in the window. Raises ValueError."""
+        crf, encode_preset = self.get_advanced_overrides()
+        start, end = self.get_range()
+        target_size = self.get_target_size()
+        return {
+            'format_name': self.format_var.get(),
+            'preset_name': self.quality_preset_var.get(),
+            'resolution': self.resolution_var.get(),
+            'crf': crf,
+            'encode_preset': encode_preset,
+            'allow_remux': self.remux_var.get(),
+            'target_quality': parse_target('auto') if self.target_quality_var.get() else None,
+            'start': start,
+            'end': end,
+            'target_size': target_size
+        }
 
     def convert_video(self):
         if not self.current_video:
             messagebox.showerror("Error", "No video selected")
             return
+        try:
+            settings = self.get_job_settings()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {e}")
+            return
 
         output_file = filedialog.asksaveasfilename(
             defaultextension=self.formats[self.format_var.get()]['extension'],
@@ -377,82 +401,123 @@ class VideoConverter(TkinterDnD.Tk):
         if not output_file:
             return
 
-        # Get video duration
-        duration = self.get_video_duration(self.current_video)
-        if duration == 0:
-            messagebox.showerror("Error", "Could not determine video duration")
+        try:
+            job = ConversionJob(
+                self.current_video,
+                output_file=output_file,
+                media_info=self.current_info,
+                **settings
+            )
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        # Hand the job to the batch engine, which runs it on a worker thread
+        try:
+            self.current_job = self.engine.submit(job)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
 
         # Reset progress
         self.progress['value'] = 0
         self.progress_label.config(text="Starting conversion...")
-
-        # Get conversion parameters
-        conversion_params = self.get_conversion_parameters()
-
-        # Prepare FFMPEG command
-        command = [
-            'ffmpeg', 
-            '-i', self.current_video,
-            *conversion_params,
-            '-y',  # Overwrite output file if it exists
-            output_file
-        ]
-
-        # Start conversion in a separate thread
         self.convert_btn.state(['disabled'])
-        threading.Thread(target=self.run_conversion, 
-                        args=(command, output_file, duration)).start()
-
-    def run_conversion(self, command, output_file, duration):
-        try:
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                errors='replace'
-            )
-
-            # Pattern to match time progress in FFmpeg output
-            time_pattern = re.compile(r'time=(\d{2}):(\d{2}):(\d{2})\.\d+')
-            
-            while True:
-                line = process.stderr.readline()
-                
-                if not line and process.poll() is not None:
-                    break
-                    
-                time_match = time_pattern.search(line)
-                if time_match:
-                    hours, minutes, seconds = map(int, time_match.groups())
-                    current_time = hours * 3600 + minutes * 60 + seconds
-                    self.after(0, self.update_progress, current_time, duration)
-
-            return_code = process.poll()
-            self.after(0, self.conversion_complete, return_code, output_file)
-            
-        except Exception as e:
-            self.after(0, self.conversion_error, str(e))
-            
-        finally:
-            try:
-                process.stderr.close()
-                process.stdout.close()
-            except:
-                pass
 
-    def conversion_complete(self, return_code, output_file):
+    def active_jobs(self):
+        return [job for job in list(self.engine.jobs) if job.status in ('queued', 'running')]
+
+    def set_job_controls(self, active):
+        """Enable Pause and Cancel while conversions are queued or running."""
+        if not active:
+            self.paused = False
+            self.pause_btn.config(text="Pause")
+        self.pause_btn.state(['!disabled'] if active and CAN_PAUSE else ['disabled'])
+        self.cancel_btn.state(['!disabled'] if active else ['disabled'])
+
+    def toggle_pause(self):
+        """Suspend or continue every running conversion's FFMPEG processes."""
+        for job in self.active_jobs():
+            if self.paused:
+                self.engine.resume(job)
+            else:
+                self.engine.pause(job)
+        self.paused = not self.paused
+        self.pause_btn.config(text="Resume" if self.paused else "Pause")
+
+    def cancel_conversions(self):
+        self.engine.cancel_all()
+
+    def on_close(self):
+        """Stop conversions before closing so no FFMPEG process outlives the window."""
+        self.progress_label.config(text="Stopping conversions...")
+        self.update_idletasks()
+        self.loader.shutdown()
+        if self.api_server:
+            self.api_server.close()
+        self.engine.shutdown(cancel=True)
+        self.destroy()
+
+    def handle_engine_event(self, event, job):
+        """Forward engine events for this window's jobs to the Tk main thread."""
+        if event == 'queued':
+            self.dispatch(self.set_job_controls, True)
+        elif event == 'finished' and not self.active_jobs():
+            self.dispatch(self.set_job_controls, False)
+        if job.id in self.batch_job_ids:
+            self.count_batch_event(event, job)
+            return
+        if job is not self.current_job:
+            return
+        if event == 'progress':
+            self.dispatch(self.update_progress, job.media_time, job.duration,
+                          job.eta, job.estimator.speed, job.projected_size, job.current_pass)
+        elif event in ('paused', 'resumed'):
+            # A queued job has no progress to show yet; the next progress event replaces this
+            self.dispatch(self.progress_label.config,
+                          {'text': "Paused" if event == 'paused' else "Resuming..."})
+        elif event == 'finished':
+            if job.status == 'cancelled':
+                self.dispatch(self.conversion_cancelled)
+            elif job.error:
+                self.dispatch(self.conversion_error, job.error)
+            else:
+                self.dispatch(self.conversion_complete, job.return_code, job.output_file,
+                              self.describe_conversion(job))
+
+    def describe_conversion(self, job):
+        """Describe whether the job was remuxed or re-encoded, and how long it took."""
+        if job.mode == 'skipped':
+            return "Already converted with these settings; the existing file is up to date"
+        if job.mode == 'cached':
+            return "Reused an identical earlier conversion"
+        if job.mode == 'remux':
+            text = f"Copied streams without re-encoding in {job.elapsed:.1f}s"
+            if job.time_saved is not None:
+                text += f" (saved about {job.time_saved:.0f}s)"
+            return text
+        text = f"Re-encoded in {job.elapsed:.1f}s"
+        if job.mode == 'two-pass':
+            text = f"Encoded in two passes at {job.bitrate / 1000:.0f} kb/s in {job.elapsed:.1f}s"
+        if job.quality_search:
+            search = job.quality_search
+            text += f" at CRF {search['crf']} ({search['metric'].upper()} {search['score']:.4g})"
+        return text
+
+    def conversion_complete(self, return_code, output_file, details=""):
+        if return_code != 0:
+            self.conversion_error(f"ffmpeg exited with code {return_code}")
+            return
         self.progress['value'] = 100
-        self.progress_label.config(text="Conversion complete!")
+        self.progress_label.config(text=f"Conversion complete! {details}".strip())
+        self.convert_btn.state(['!disabled'])
+        messagebox.showinfo("Success", 
+                          f"Video converted successfully!\nSaved to: {output_file}\n{details}".strip())
+
+    def conversion_cancelled(self):
+        self.progress['value'] = 0
+        self.progress_label.config(text="Conversion cancelled")
         self.convert_btn.state(['!disabled'])
-        
-        if return_code == 0:
-            messagebox.showinfo("Success", 
-                              f"Video converted successfully!\nSaved to: {output_file}")
-        else:
-            messagebox.showerror("Error", 
-                               "Conversion failed. Please check if FFMPEG is installed.")
 
     def conversion_error(self, error_message):
         self.progress['value'] = 0
@@ -468,19 +533,117 @@ class VideoConverter(TkinterDnD.Tk):
         self.preview_label.dnd_bind('<<Drop>>', self.handle_drop)
 
     def handle_drop(self, event):
-        """Handle dropped files."""
-        file_path = event.data
-        # Handle multiple path formats
-        if file_path.startswith('{') and file_path.endswith('}'):
-            file_path = file_path[1:-1]
-        if file_path.startswith('"') and file_path.endswith('"'):
-            file_path = file_path[1:-1]
-        # Check file extension
-        if any(file_path.lower().endswith(ext) for ext in 
-               ('.mp4', '.mov', '.avi', '.mkv', '.webm')):
-            self.load_video(file_path)
-        else:
-            messagebox.showerror("Error", "Unsupported file format")
+        """Handle dropped files and folders."""
+        # tkdnd sends a Tcl list, with braces around paths that contain spaces
+        paths = list(self.tk.splitlist(event.data))
+
+        # A single file is previewed; anything more is converted as a batch
+        if len(paths) == 1 and not os.path.isdir(paths[0]):
+            if is_supported_file(paths[0]):
+                self.load_video(paths[0])
+            else:
+                messagebox.showerror("Error", "Unsupported file format")
+            return
+        self.start_batch(paths)
+
+    def start_batch(self, paths):
+        """Convert every supported file in the dropped paths into one output folder."""
+        try:
+            settings = self.get_job_settings()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {e}")
+            return
+        output_dir = filedialog.askdirectory(title="Choose a folder for the converted files")
+        if not output_dir:
+            return
+        self.progress_label.config(text="Looking for video files...")
+        threading.Thread(target=self.queue_batch,
+                         args=(paths, output_dir, settings),
+                         daemon=True).start()
+
+    def queue_batch(self, paths, output_dir, settings):
+        """Submit files to the engine as they are discovered (runs on a worker thread)."""
+        extension = self.formats[settings['format_name']]['extension']
+        found = 0
+        # Sources differing only in extension, like clip.mov and clip.mkv, get distinct outputs
+        claimed = {}
+        for source, relative_dir in iter_video_files(paths):
+            job = ConversionJob(
+                source,
+                output_file=batch_output_path(source, relative_dir, output_dir, extension,
+                                              claimed),
+                # Keep the window responsive while a batch runs in the background
+                priority='low',
+                **settings
+            )
+            with self.batch_lock:
+                self.batch_job_ids.add(job.id)
+            try:
+                self.engine.submit(job)
+            except ValueError:
+                # Its output is still being written by an earlier conversion
+                with self.batch_lock:
+                    self.batch_job_ids.discard(job.id)
+                continue
+            found += 1
+        if not found:
+            self.dispatch(messagebox.showerror, "Error", "No supported video files found")
+
+    def offer_resume(self):
+        """Offer to queue conversions the journal shows were interrupted last time."""
+        if self.journal is None:
+            return
+        jobs = []
+        for settings in self.journal.unfinished():
+            try:
+                jobs.append(ConversionJob.from_settings(settings))
+            except ValueError:
+                # Settings this version refuses, e.g. an output that would replace its source
+                pass
+        if not jobs:
+            return
+        if not messagebox.askyesno("Resume Conversions",
+                                   f"{len(jobs)} conversion(s) did not finish last time. "
+                                   "Resume them?"):
+            for job in jobs:
+                self.journal.forget(job)
+            return
+        for job in jobs:
+            job.priority = 'low'
+            with self.batch_lock:
+                self.batch_job_ids.add(job.id)
+            try:
+                self.engine.submit(job)
+            except ValueError:
+                with self.batch_lock:
+                    self.batch_job_ids.discard(job.id)
+
+    def count_batch_event(self, event, job):
+        """Tally batch job events and schedule one status update at a time."""
+        with self.batch_lock:
+            if event == 'queued':
+                self.batch_counts['queued'] += 1
+            elif event == 'finished':
+                self.batch_counts['done' if job.status == 'done' else 'failed'] += 1
+            elif event not in ('paused', 'resumed'):
+                return
+            if self.batch_status_pending:
+                return
+            self.batch_status_pending = True
+        self.dispatch(self.show_batch_status)
+
+    def show_batch_status(self):
+        with self.batch_lock:
+            self.batch_status_pending = False
+            counts = dict(self.batch_counts)
+        finished = counts['done'] + counts['failed']
+        self.progress['value'] = 100 * finished / counts['queued'] if counts['queued'] else 0
+        text = f"Batch: {finished} of {counts['queued']} files converted"
+        if counts['failed']:
+            text += f" ({counts['failed']} failed or cancelled)"
+        if any(job.paused for job in self.active_jobs() if job.id in self.batch_job_ids):
+            text += ", paused"
+        self.progress_label.config(text=text)
 
     def select_file(self):
         """Open file dialog to select a video file."""
@@ -498,86 +661,128 @@ class VideoConverter(TkinterDnD.Tk):
             return
 
         self.current_video = file_path
+        self.current_info = None
         # Update filename label with just the filename, not the full path
         self.filename_label.config(text=os.path.basename(file_path))
-        self.update_thumbnail()
+        self.preview_label.configure(image='')
+        self.preview_label.image = None
+        self.reset_scrubbing()
 
-    def update_thumbnail(self):
-            """Generate and display a thumbnail from the video."""
-            try:
-                # Use ffmpeg to extract first frame
-                cmd = [
-                    'ffmpeg',
-                    '-i', self.current_video,
-                    '-vframes', '1',  # Extract only first frame
-                    '-f', 'image2pipe',  # Output to pipe
-                    '-vcodec', 'ppm',    # Use PPM format
-                    '-'                  # Output to pipe
-                ]
-                
-                # Run ffmpeg and capture output
-                pipe = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = pipe.communicate()
-                
-                if pipe.returncode != 0:
-                    messagebox.showerror("Error", "Could not extract video thumbnail")
-                    return
-                    
-                # Create PIL Image from bytes
-                image = Image.open(io.BytesIO(stdout))
-                
-                # Calculate resize dimensions while maintaining aspect ratio
-                preview_height = 180
-                aspect_ratio = image.width / image.height
-                target_width = int(preview_height * aspect_ratio)
-                
-                # Resize image
-                image = image.resize((target_width, preview_height), Image.Resampling.LANCZOS)
-                
-                # Convert to PhotoImage and display
-                photo = ImageTk.PhotoImage(image)
-                self.preview_label.configure(image=photo)
-                self.preview_label.image = photo  # Keep a reference to prevent garbage collection
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not generate thumbnail: {str(e)}")
-                return
+        # Probe and thumbnail in the background; this cancels any earlier load
+        self.loader.load(file_path)
 
-    def update_progress(self, current_time, duration):
-        """Update progress bar and label."""
-        if duration > 0:
+    def handle_loader_event(self, event, file_path, value):
+        """Apply a background load result, unless another file was loaded meanwhile."""
+        if file_path != self.current_video:
+            return
+        if event == 'probed':
+            self.current_info = value
+        elif event == 'thumbnail':
+            self.show_thumbnail(file_path, value)
+        elif event == 'thumbnail_error':
+            self.thumbnail_error(file_path, value)
+        elif event == 'sprites':
+            self.sprite_sheet, self.sprite_frames = value
+        elif event == 'sprites_error':
+            # Scrubbing is a convenience; the still thumbnail stays
+            pass
+        elif event == 'load_error':
+            self.current_video = None
+            self.filename_label.config(text="Drop video file here or click to select")
+            messagebox.showerror("Error", f"Could not read video: {value}")
+
+    def show_thumbnail(self, file_path, data):
+        """Display thumbnail PNG bytes, unless another file was loaded meanwhile."""
+        if file_path != self.current_video:
+            return
+        try:
+            # The frame is already scaled to the preview height by ffmpeg
+            image = Image.open(io.BytesIO(data))
+            photo = ImageTk.PhotoImage(image)
+        except Exception as e:
+            self.thumbnail_error(file_path, str(e))
+            return
+        self.preview_label.configure(image=photo)
+        self.preview_label.image = photo  # Keep a reference to prevent garbage collection
+        self.thumbnail_photo = photo
+
+    def thumbnail_error(self, file_path, error_message):
+        if file_path == self.current_video:
+            messagebox.showerror("Error", f"Could not generate thumbnail: {error_message}")
+
+    def reset_scrubbing(self):
+        self.thumbnail_photo = None
+        self.sprite_sheet = None
+        self.sprite_frames = None
+        self.sprite_photos = {}
+        self.sprites_requested = False
+        if hasattr(self, 'scrub_label'):
+            self.scrub_label.place_forget()
+
+    def scrub_preview(self, event):
+        """Show the frame under the pointer; the sprite sheet is fetched on first hover."""
+        duration = self.current_info.duration if self.current_info else None
+        if not duration or self.thumbnail_photo is None:
+            return
+        if not self.sprites_requested:
+            self.sprites_requested = True
+            self.loader.load_sprites(self.current_video, duration, prepare=slice_sprites)
+        if self.sprite_frames is None:
+            return
+
+        width = self.preview_frame.winfo_width()
+        fraction = (event.x_root - self.preview_frame.winfo_rootx()) / max(width, 1)
+        index = self.sprite_sheet.index_at(fraction)
+        photo = self.sprite_photos.get(index)
+        if photo is None:
+            photo = ImageTk.PhotoImage(self.sprite_frames[index])
+            self.sprite_photos[index] = photo
+        self.preview_label.configure(image=photo)
+        self.preview_label.image = photo
+        self.scrub_label.config(
+            text=time.strftime('%H:%M:%S', time.gmtime(self.sprite_sheet.time(index))))
+        self.scrub_label.place(relx=1.0, rely=1.0, anchor=tk.SE, x=-4, y=-4)
+
+    def end_scrub(self, event):
+        """Go back to the still thumbnail once the pointer leaves the preview."""
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        if widget in (self.preview_frame, self.preview_label, self.scrub_label):
+            return
+        self.scrub_label.place_forget()
+        if self.thumbnail_photo is not None:
+            self.preview_label.configure(image=self.thumbnail_photo)
+            self.preview_label.image = self.thumbnail_photo
+
+    def update_progress(self, current_time, duration, eta=None, speed=None, projected_size=None,
+                        pass_number=None):
+        """Update progress bar and label.
+
+        eta is wall-clock seconds left, estimated from the encode speed;
+        pass_number is set for the passes of a two-pass encode.
+        """
+        if duration:
             progress = (current_time / duration) * 100
             self.progress['value'] = progress
-            time_remaining = duration - current_time
             
             current_formatted = time.strftime('%H:%M:%S', time.gmtime(current_time))
             total_formatted = time.strftime('%H:%M:%S', time.gmtime(duration))
-            remaining_formatted = time.strftime('%H:%M:%S', time.gmtime(time_remaining))
+            remaining_formatted = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '--:--:--'
             
+            details = f"ETA: {remaining_formatted}"
+            if speed:
+                details = f"{speed:.2f}x, {details}"
+            if projected_size:
+                details += f", ~{projected_size / 1048576:.0f} MB"
+            text = f"{current_formatted} / {total_formatted} ({details})"
+            if pass_number:
+                text = f"Pass {pass_number}/2: {text}"
+            self.progress_label.config(text=text)
+        else:
+            # Unknown duration (e.g. live captures): show how far the conversion has got
             self.progress_label.config(
-                text=f"{current_formatted} / {total_formatted} (ETA: {remaining_formatted})"
+                text=time.strftime('%H:%M:%S', time.gmtime(current_time))
             )
 
-    def get_video_duration(self, filename):
-        """Get video duration using ffmpeg."""
-        cmd = ['ffmpeg', '-i', filename]
-        try:
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-            
-            duration_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2})\.(\d{2})", output)
-            if duration_match:
-                hours, minutes, seconds, centis = map(int, duration_match.groups())
-                total_seconds = hours * 3600 + minutes * 60 + seconds + centis / 100
-                return total_seconds
-        except subprocess.CalledProcessError as e:
-            output = e.output
-            duration_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2})\.(\d{2})", output)
-            if duration_match:
-                hours, minutes, seconds, centis = map(int, duration_match.groups())
-                total_seconds = hours * 3600 + minutes * 60 + seconds + centis / 100
-                return total_seconds
-        return 0
-
 if __name__ == "__main__":
     app = VideoConverter()
     app.mainloop()
\ No newline at end of file
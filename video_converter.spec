@@ -17,8 +17,9 @@ a = Analysis(
         # Include tkdnd2 files
         (tkdnd_path, 'tkinterdnd2/tkdnd'),
         
-        # Include FFmpeg binary (Windows)
+        # Include FFmpeg and FFprobe binaries (Windows)
         ('ffmpeg/ffmpeg.exe', '.'),
+        ('ffmpeg/ffprobe.exe', '.'),
     ],
     # More specific hidden imports
     hiddenimports=[